@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, g, request, jsonify
 from flask_cors import CORS
 from keras.models import load_model
 import os
@@ -8,11 +8,29 @@ import uuid
 import numpy as np
 from PIL import Image
 import logging
-import requests
-from functools import lru_cache
 import hashlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from backend.azure_blob import put_blob
+from backend import http_client, metrics
+from backend.batching import BatchPredictor
+from backend.cpu_budget import configure_tensorflow, worker_threads
+from backend.currency_conversions import convert_currency_bulk
+from backend.depreciation_scoring import calculate_depreciation, depreciation_scores
+from backend.exchange_rates import default_store as exchange_rates
+from backend.model_fetch import MODELS_DIR, fetch_models, load_manifest, tflite_filename
+from backend.model_scores import predict_scores
+from backend.notification_queue import NotificationQueue
+from backend.phash_index import NearDuplicateIndex
+from backend.preprocess import load_exact, load_fast
+from backend.recommendation_service import RecommendationService
+from backend.result_cache import ResultCache, model_version
+from backend.similarity_index import Embedder, SimilarityIndex
+from backend.upload_jobs import UploadJobs
+
 # Load environment variables
 load_dotenv()
 
@@ -20,109 +38,494 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class InMemoryRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Request bodies are capped by MAX_CONTENT_LENGTH, so keep uploads off disk
+        return io.BytesIO()
+
+    @property
+    def max_content_length(self):
+        if self.path == '/upload-images':
+            return BATCH_MAX_CONTENT_LENGTH
+        return super().max_content_length
+
 app = Flask(__name__)
+app.request_class = InMemoryRequest
 CORS(app)
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        # Route pattern rather than path, so /upload-status/<job_id> stays one series
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe_request(endpoint, request.method, response.status_code, time.perf_counter() - start)
+    return response
+
 UPLOAD_FOLDER = 'uploads'
+# Runtime state (result cache, notification queue, exchange-rate snapshot) unless given explicit paths
+DATA_DIR = os.getenv("DATA_DIR", "data")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 
+# Multi-image listing uploads (/upload-images)
+MAX_IMAGES_PER_REQUEST = int(os.getenv("MAX_IMAGES_PER_REQUEST", "20"))
+BATCH_MAX_CONTENT_LENGTH = int(os.getenv("BATCH_MAX_CONTENT_MB", "128")) * 1024 * 1024
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", "0")) or worker_threads()
+
+# "exact" = full decode + LANCZOS (float64), "fast" = JPEG draft decode (float32)
+PREPROCESS_MODE = os.getenv("PREPROCESS_MODE", "exact").lower()
+
+# Micro-batching of concurrent predict calls (useful with gunicorn --threads)
+INFERENCE_BATCHING = os.getenv("INFERENCE_BATCHING", "0") == "1"
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))
+BATCH_MAX_DELAY_MS = float(os.getenv("BATCH_MAX_DELAY_MS", "5"))
+
+# Content-hash result cache: in-memory LRU plus a SQLite file shared by workers, through which
+# concurrent identical uploads in different workers are analyzed once (RESULT_CACHE_DB= disables it)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB", os.path.join(DATA_DIR, "result_cache.db"))
+RESULT_CACHE_DISK_MAX = int(os.getenv("RESULT_CACHE_DISK_MAX", "100000"))
+
+# Perceptual-hash near-duplicate reuse: SQLite file shared by workers (unset disables it)
+PHASH_INDEX_DB = os.getenv("PHASH_INDEX_DB")
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "6"))
+PHASH_KIND = os.getenv("PHASH_KIND", "phash").lower()
+
+# Visual similarity search: directory built by backend/similarity_index.py (unset disables it)
+SIMILARITY_INDEX_DIR = os.getenv("SIMILARITY_INDEX_DIR")
+SIMILAR_ITEMS_K = int(os.getenv("SIMILAR_ITEMS_K", "10"))
+SIMILARITY_NPROBE = int(os.getenv("SIMILARITY_NPROBE", "8"))
+
 # eBay tokens from .env
 EBAY_VERIFICATION_TOKEN = os.getenv("EBAY_VERIFICATION_TOKEN")
 EBAY_ENDPOINT_SECRET = os.getenv("EBAY_ENDPOINT_SECRET")
+# Incoming notifications are queued in SQLite and processed in the background
+EBAY_NOTIFY_QUEUE_DB = os.getenv("EBAY_NOTIFY_QUEUE_DB", os.path.join(DATA_DIR, "ebay_notifications.db"))
+EBAY_NOTIFY_BATCH_SIZE = int(os.getenv("EBAY_NOTIFY_BATCH_SIZE", "100"))
+EBAY_NOTIFY_MAX_ATTEMPTS = int(os.getenv("EBAY_NOTIFY_MAX_ATTEMPTS", "5"))
+# Seconds before a failed batch is retried; doubles per attempt
+EBAY_NOTIFY_RETRY_BACKOFF = float(os.getenv("EBAY_NOTIFY_RETRY_BACKOFF", "5"))
+EBAY_NOTIFY_RETENTION_DAYS = float(os.getenv("EBAY_NOTIFY_RETENTION_DAYS", "7"))
+# NORMAL survives a crash of the app; FULL also survives power loss at the cost of an fsync per ack
+EBAY_NOTIFY_SYNC = os.getenv("EBAY_NOTIFY_SYNC", "NORMAL").upper()
 
 # Azure settings from .env
 AZURE_CONTAINER_URL = os.getenv("AZURE_CONTAINER_URL")
 AZURE_CONTAINER_SAS_TOKEN = os.getenv("AZURE_CONTAINER_SAS_TOKEN")
 DEPRECIATION_MODEL_URL = os.getenv("DEPRECIATION_MODEL_URL")
+
+# Background blob uploads: respond after analysis, poll /upload-status/<job_id> for the URL
+ASYNC_AZURE_UPLOAD = os.getenv("ASYNC_AZURE_UPLOAD", "0") == "1"
+AZURE_UPLOAD_WORKERS = int(os.getenv("AZURE_UPLOAD_WORKERS", "4"))
+AZURE_UPLOAD_MAX_PENDING = int(os.getenv("AZURE_UPLOAD_MAX_PENDING", "64"))
 WEAR_MODEL_URL = os.getenv("WEAR_MODEL_URL")
+# Optional JSON {"<model file>": "<sha256>"} used to verify downloaded models
+MODEL_MANIFEST = os.getenv("MODEL_MANIFEST", os.path.join(MODELS_DIR, "manifest.json"))
+
+# Inference backend per model: "keras", "tflite-float16" or "tflite-int8".
+# TFLite files come from backend/export_tflite.py and live next to the .h5 files;
+# a node without them downloads them from *_TFLITE_URL like the .h5 files.
+WEAR_MODEL_BACKEND = os.getenv("WEAR_MODEL_BACKEND", "keras").lower()
+DEPRECIATION_MODEL_BACKEND = os.getenv("DEPRECIATION_MODEL_BACKEND", "keras").lower()
+WEAR_MODEL_TFLITE_URL = os.getenv("WEAR_MODEL_TFLITE_URL")
+DEPRECIATION_MODEL_TFLITE_URL = os.getenv("DEPRECIATION_MODEL_TFLITE_URL")
+TFLITE_NUM_THREADS = int(os.getenv("TFLITE_NUM_THREADS", "0")) or None
+
+# Warm-up predicts run on both models at import, before the worker accepts requests.
+# /ready answers 503 until they succeed (and, with READY_REQUIRE_MODELS=1, both models loaded).
+WARMUP_INFERENCES = int(os.getenv("WARMUP_INFERENCES", "2"))
+READY_REQUIRE_MODELS = os.getenv("READY_REQUIRE_MODELS", "1") == "1"
+
+wear_model_path = os.path.join(MODELS_DIR, "wear_tear_model.h5")
+depreciation_model_path = os.path.join(MODELS_DIR, "depreciation_model.h5")
+
+# Thread pools sized by gunicorn.conf.py's CPU budget; has to happen before any model loads
+configure_tensorflow()
+
+def served_tflite_path(h5_path, backend):
+    return os.path.join(os.path.dirname(h5_path), tflite_filename(os.path.basename(h5_path), backend.split('-', 1)[1]))
+
+def model_artifacts():
+    """
+    {filename: url} of every file the configured backends need.
+    """
+    artifacts = {}
+    for h5_path, backend, url, tflite_url in (
+            (wear_model_path, WEAR_MODEL_BACKEND, WEAR_MODEL_URL, WEAR_MODEL_TFLITE_URL),
+            (depreciation_model_path, DEPRECIATION_MODEL_BACKEND, DEPRECIATION_MODEL_URL, DEPRECIATION_MODEL_TFLITE_URL)):
+        artifacts[os.path.basename(h5_path)] = url
+        if backend.startswith('tflite-'):
+            artifacts[os.path.basename(served_tflite_path(h5_path, backend))] = tflite_url
+    return artifacts
+
+# Fetch any missing models (one worker downloads, the rest wait on a file lock)
+try:
+    fetch_errors = fetch_models(
+        model_artifacts(),
+        MODELS_DIR,
+        manifest=load_manifest(MODEL_MANIFEST),
+    )
+except Exception as e:
+    fetch_errors = {}
+    logger.error(f"Model fetch failed: {e}")
+for name, error in fetch_errors.items():
+    logger.error(f"Could not fetch {name}: {error}")
+
+def load_served_model(h5_path, backend):
+    """
+    Returns (model, path of the file actually served). TFLite backends fall
+    back to the Keras model if their file is missing or fails to load; that
+    is logged as an error and shows in /inference-stats 'backends'.
+    """
+    if backend.startswith('tflite-'):
+        tflite_path = served_tflite_path(h5_path, backend)
+        try:
+            from backend.tflite_model import TFLiteModel
+            return TFLiteModel(tflite_path, num_threads=TFLITE_NUM_THREADS), tflite_path
+        except Exception as e:
+            logger.error(f"{backend} requested but {tflite_path} could not be loaded; serving the Keras model: {e}")
+    return load_model(h5_path), h5_path
 
 # Load wear model
 try:
-    wear_model_path = "models/wear_tear_model.h5"
-    os.makedirs("models", exist_ok=True)
-    if not os.path.exists(wear_model_path):
-        logger.info("Downloading wear model...")
-        resp = requests.get(WEAR_MODEL_URL, timeout=60)
-        resp.raise_for_status()
-        with open(wear_model_path, "wb") as f:
-            f.write(resp.content)
-    wear_model = load_model(wear_model_path)
-    logger.info("Wear model loaded successfully.")
+    wear_model, wear_model_served_path = load_served_model(wear_model_path, WEAR_MODEL_BACKEND)
+    logger.info(f"Wear model loaded successfully from {wear_model_served_path}.")
 except Exception as e:
     logger.warning(f"Wear model load failed: {e}")
-    wear_model = None
+    wear_model, wear_model_served_path = None, None
 
 # Load depreciation model
 try:
-    depreciation_model_path = "models/depreciation_model.h5"
-    if not os.path.exists(depreciation_model_path):
-        logger.info("Downloading depreciation model...")
-        resp = requests.get(DEPRECIATION_MODEL_URL, timeout=60)
-        resp.raise_for_status()
-        with open(depreciation_model_path, "wb") as f:
-            f.write(resp.content)
-    depreciation_model = load_model(depreciation_model_path)
-    logger.info("Depreciation model loaded successfully.")
+    depreciation_model, depreciation_model_served_path = load_served_model(depreciation_model_path, DEPRECIATION_MODEL_BACKEND)
+    logger.info(f"Depreciation model loaded successfully from {depreciation_model_served_path}.")
 except Exception as e:
     logger.error(f"Depreciation model load failed: {e}")
-    depreciation_model = None
+    depreciation_model, depreciation_model_served_path = None, None
+
+metrics.set_model_loaded('wear', WEAR_MODEL_BACKEND, wear_model is not None)
+metrics.set_model_loaded('depreciation', DEPRECIATION_MODEL_BACKEND, depreciation_model is not None)
+
+tflite_models = {
+    name: model for name, model in (('wear', wear_model), ('depreciation', depreciation_model))
+    if hasattr(model, 'stats')
+}
+
+if INFERENCE_BATCHING:
+    if wear_model is not None:
+        wear_model = BatchPredictor(wear_model, BATCH_MAX_SIZE, BATCH_MAX_DELAY_MS, name='wear')
+    if depreciation_model is not None:
+        depreciation_model = BatchPredictor(depreciation_model, BATCH_MAX_SIZE, BATCH_MAX_DELAY_MS, name='depreciation')
+    logger.info(f"Inference batching enabled (max_batch_size={BATCH_MAX_SIZE}, max_delay_ms={BATCH_MAX_DELAY_MS})")
+
+def compute_model_version():
+    """
+    Identifies the models and preprocessing that produced a score, so cached
+    results are dropped whenever either changes. MODEL_VERSION overrides it.
+    """
+    override = os.getenv("MODEL_VERSION")
+    if override:
+        return override
+    return model_version(PREPROCESS_MODE, (wear_model_served_path, depreciation_model_served_path))
+
+result_cache = ResultCache(
+    compute_model_version(),
+    max_entries=RESULT_CACHE_SIZE,
+    db_path=RESULT_CACHE_DB,
+    disk_max_entries=RESULT_CACHE_DISK_MAX,
+)
+
+near_duplicates = None
+if PHASH_INDEX_DB:
+    try:
+        near_duplicates = NearDuplicateIndex(PHASH_INDEX_DB, result_cache.model_version,
+                                             max_distance=PHASH_MAX_DISTANCE, kind=PHASH_KIND)
+        logger.info(f"Near-duplicate index loaded from {PHASH_INDEX_DB} ({near_duplicates.stats()['entries']} entries).")
+    except Exception as e:
+        logger.error(f"Near-duplicate index load failed: {e}")
+
+similarity_index = None
+embedder = None
+if SIMILARITY_INDEX_DIR:
+    try:
+        similarity_index = SimilarityIndex(SIMILARITY_INDEX_DIR, nprobe=SIMILARITY_NPROBE)
+        embedder = Embedder()
+        logger.info(f"Similarity index loaded from {SIMILARITY_INDEX_DIR} ({len(similarity_index)} items).")
+    except Exception as e:
+        logger.error(f"Similarity index load failed: {e}")
+        similarity_index = None
+recommendation_service = RecommendationService(similarity_index)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def preprocess_image(image_path, size=(224, 224)):
+def preprocess_image(source, size=(224, 224)):
     try:
-        with Image.open(image_path) as img:
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            img = img.resize(size, Image.Resampling.LANCZOS)
-            arr = np.array(img) / 255.0
-            return np.expand_dims(arr, axis=0)
+        loader = load_fast if PREPROCESS_MODE == 'fast' else load_exact
+        with metrics.stage('preprocess'):
+            arr = loader(source, size)
+        return np.expand_dims(arr, axis=0)
     except Exception as e:
         logger.error(f"Preprocessing error: {e}")
         return None
 
-def analyze_wear(image_path):
+def _score(model, arr):
+    return predict_scores(model, arr)[0]
+
+def analyze_wear(arr):
     if wear_model is None:
         return 0.3
-    arr = preprocess_image(image_path)
     if arr is None:
         return 0.5
-    pred = wear_model.predict(arr, verbose=0)
-    val = float(pred[0][0]) if pred.ndim > 1 else float(pred[0])
-    return round(max(0, min(1, val)), 3)
+    with metrics.stage('predict_wear'):
+        return _score(wear_model, arr)
 
-def predict_depreciation(image_path):
+def predict_depreciation(arr):
     if depreciation_model is None:
         return 0.5
-    arr = preprocess_image(image_path)
     if arr is None:
         return 0.5
-    pred = depreciation_model.predict(arr, verbose=0)
-    val = float(pred[0][0]) if pred.ndim > 1 else float(pred[0])
-    return round(max(0, min(1, val)), 3)
+    with metrics.stage('predict_depreciation'):
+        return _score(depreciation_model, arr)
+
+def analyze_image(source):
+    """
+    Decode and preprocess the upload once, then score that single tensor
+    with both models. Returns (wear_level_score, depreciation_score).
+    """
+    arr = None
+    if wear_model is not None or depreciation_model is not None:
+        arr = preprocess_image(source)
+    return analyze_wear(arr), predict_depreciation(arr)
 
-def upload_to_azure(file_path, blob_name):
+# PIL releases the GIL while decoding and resizing, so threads scale here
+decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="decode")
+upload_executor = ThreadPoolExecutor(max_workers=AZURE_UPLOAD_WORKERS, thread_name_prefix="upload")
+
+def analyze_images(sources):
+    """
+    Batch version of analyze_image: decodes all sources in parallel, then
+    runs a single predict per model over every image that decoded.
+    Returns a list of (wear_level_score, depreciation_score).
+    """
+    wear_scores = [0.3 if wear_model is None else 0.5] * len(sources)
+    depreciation_scores = [0.5] * len(sources)
+    if wear_model is None and depreciation_model is None:
+        return list(zip(wear_scores, depreciation_scores))
+
+    arrays = list(decode_executor.map(preprocess_image, sources))
+    decoded = [i for i, arr in enumerate(arrays) if arr is not None]
+    if decoded:
+        batch = np.concatenate([arrays[i] for i in decoded])
+        if wear_model is not None:
+            with metrics.stage('predict_wear_batch'):
+                scores = predict_scores(wear_model, batch)
+            for i, score in zip(decoded, scores):
+                wear_scores[i] = score
+        if depreciation_model is not None:
+            with metrics.stage('predict_depreciation_batch'):
+                scores = predict_scores(depreciation_model, batch)
+            for i, score in zip(decoded, scores):
+                depreciation_scores[i] = score
+    return list(zip(wear_scores, depreciation_scores))
+
+def upload_to_azure(data, blob_name):
     try:
-        with open(file_path, "rb") as f:
-            headers = {
-                "x-ms-blob-type": "BlockBlob",
-                "Content-Type": "application/octet-stream"
-            }
-            blob_url = f"{AZURE_CONTAINER_URL}/{blob_name}?{AZURE_CONTAINER_SAS_TOKEN}"
-            resp = requests.put(blob_url, headers=headers, data=f)
-            if resp.status_code in (201, 202):
-                return blob_url
-            logger.error(f"Azure upload failed: {resp.text}")
-            return None
+        blob_url = f"{AZURE_CONTAINER_URL}/{blob_name}?{AZURE_CONTAINER_SAS_TOKEN}"
+        with metrics.stage('azure_upload'):
+            put_blob(blob_url, data)
+        metrics.count_bytes('azure_upload', len(data))
+        return blob_url
     except Exception as e:
         logger.error(f"Azure upload error: {e}")
         return None
 
+def warm_up():
+    """
+    Pay graph tracing, allocator growth and decoder setup here rather than
+    on the first user requests: a synthetic JPEG goes through
+    preprocess_image and then through each model, at batch size 1 and at
+    the batcher's full batch size. Returns the seconds spent.
+    """
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (128, 128, 128)).save(buffer, 'JPEG')
+    arr = preprocess_image(io.BytesIO(buffer.getvalue()))
+    if arr is None:
+        raise RuntimeError("preprocessing the warm-up image failed")
+    batches = [arr]
+    if INFERENCE_BATCHING and BATCH_MAX_SIZE > 1:
+        batches.append(np.repeat(arr, BATCH_MAX_SIZE, axis=0))
+    for model in (wear_model, depreciation_model):
+        if model is None:
+            continue
+        for batch in batches:
+            for _ in range(WARMUP_INFERENCES):
+                predict_scores(model, batch)
+    if embedder is not None:
+        embedder(arr)
+    return time.perf_counter() - start
+
+warmup_seconds = None
+if WARMUP_INFERENCES > 0:
+    try:
+        warmup_seconds = warm_up()
+        logger.info(f"Warm-up finished in {warmup_seconds:.2f}s.")
+    except Exception as e:
+        logger.error(f"Warm-up failed: {e}")
+else:
+    warmup_seconds = 0.0
+
+upload_jobs = None
+if ASYNC_AZURE_UPLOAD:
+    upload_jobs = UploadJobs(
+        upload_to_azure,
+        os.path.join(UPLOAD_FOLDER, 'jobs'),
+        max_workers=AZURE_UPLOAD_WORKERS,
+        max_pending=AZURE_UPLOAD_MAX_PENDING,
+    )
+
+def analyze_upload(data, original_filename, digest=None):
+    scored = score_upload(data)
+    reused = reuse_near_duplicate(scored)
+    if reused is not None:
+        return reused
+    result = store_upload(data, original_filename, scored['wear_level_score'], scored['depreciation_score'],
+                          digest, scored['code'])
+    return index_upload(scored, digest, original_filename, result)
+
+def score_upload(data):
+    """
+    CPU half of analyze_upload: decode once, look the image up in the
+    near-duplicate index and score it (or take a near-duplicate's scores).
+    """
+    arr = None
+    if wear_model is not None or depreciation_model is not None or similarity_index is not None \
+            or near_duplicates is not None:
+        # BytesIO over bytes shares the buffer, so decoding does not copy the upload.
+        # The same tensor feeds the perceptual hash, both models and the embedding.
+        arr = preprocess_image(io.BytesIO(data))
+    code = match = None
+    if near_duplicates is not None and arr is not None:
+        with metrics.stage('phash_lookup'):
+            code = near_duplicates.hash(arr)
+            match = near_duplicates.find(code)
+        metrics.cache_lookup('near_duplicate', match is not None)
+    if match is not None:
+        # Skip the models; the prior result may lack a blob (bulk-built from the catalog)
+        wear_score = match['result']['wear_level_score']
+        depreciation_score = match['result']['depreciation_score']
+    else:
+        wear_score, depreciation_score = analyze_wear(arr), predict_depreciation(arr)
+    return {
+        'arr': arr, 'code': code, 'match': match,
+        'wear_level_score': wear_score, 'depreciation_score': depreciation_score,
+    }
+
+def reuse_near_duplicate(scored):
+    """
+    The full prior result when the upload is a near-duplicate of one that
+    already has a blob, else None (the upload still has to be stored).
+    """
+    match = scored['match']
+    if match is None or not match['result'].get('azure_blob_url'):
+        return None
+    return dict(
+        wear_level_score=match['result']['wear_level_score'],
+        depreciation_score=match['result']['depreciation_score'],
+        azure_blob_url=match['result']['azure_blob_url'],
+        near_duplicate_of=match['digest'],
+        hamming_distance=match['distance'],
+    )
+
+def index_upload(scored, digest, original_filename, result):
+    """
+    After store_upload: new images go into the similarity index;
+    near-duplicates get the fields saying whose scores they reused.
+    """
+    match = scored['match']
+    if match is not None:
+        return dict(result, near_duplicate_of=match['digest'], hamming_distance=match['distance'])
+    if similarity_index is not None and scored['arr'] is not None and digest is not None:
+        add_to_similarity_index(scored['arr'], digest, original_filename, result)
+    return result
+
+def remember_near_duplicate(code, digest, result):
+    # Only uploads with a blob are worth reusing in full
+    if near_duplicates is None or code is None or digest is None or not result.get('azure_blob_url'):
+        return
+    try:
+        near_duplicates.add(code, digest, {
+            'wear_level_score': result['wear_level_score'],
+            'depreciation_score': result['depreciation_score'],
+            'azure_blob_url': result['azure_blob_url'],
+        })
+    except Exception as e:
+        logger.error(f"Could not add upload to the near-duplicate index: {e}")
+
+def add_to_similarity_index(arr, digest, original_filename, result):
+    try:
+        with metrics.stage('embed'):
+            embedding = embedder(arr)
+        similarity_index.add(embedding, [{
+            'id': digest,
+            'image': secure_filename(original_filename),
+            'azure_blob_url': result['azure_blob_url'],
+            'wear_level_score': result['wear_level_score'],
+            'depreciation_score': result['depreciation_score'],
+            'added_at': datetime.utcnow().isoformat(),
+        }])
+    except Exception as e:
+        logger.error(f"Could not add upload to the similarity index: {e}")
+
+def similar_to_item(item_id, k=SIMILAR_ITEMS_K):
+    """
+    Neighbours of an indexed item, itself excluded; None if it is not indexed.
+    """
+    row = similarity_index.row(item_id)
+    if row is None:
+        return None
+    return recommendation_service.get_similar_items(similarity_index.vector(row), k, exclude_ids=[item_id])
+
+def blob_name(original_filename):
+    return f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}_{secure_filename(original_filename)}"
+
+def store_upload(data, original_filename, wear_score, depreciation_score, digest=None, perceptual_code=None):
+    """
+    Upload the original bytes to Azure (inline, or as a background job when
+    ASYNC_AZURE_UPLOAD is on) and build the per-image result. Once the blob
+    exists, the upload is added to the near-duplicate index under
+    `perceptual_code`.
+    """
+    filename = blob_name(original_filename)
+    result = {
+        'wear_level_score': wear_score,
+        'depreciation_score': depreciation_score,
+        'azure_blob_url': None,
+    }
+
+    job_id = None
+    if upload_jobs is not None:
+        def on_uploaded(blob_url):
+            # The immediate response could not be cached without a URL; cache it now
+            if digest is not None:
+                result_cache.put(digest, dict(result, azure_blob_url=blob_url))
+            remember_near_duplicate(perceptual_code, digest, dict(result, azure_blob_url=blob_url))
+        job_id = upload_jobs.submit(data, filename, on_uploaded)
+
+    if job_id is None:
+        result['azure_blob_url'] = upload_to_azure(data, filename)
+        remember_near_duplicate(perceptual_code, digest, result)
+        return result
+    return dict(result, upload_job_id=job_id)
+
 @app.route('/upload-image', methods=['POST'])
 def upload_image():
     if 'image' not in request.files:
@@ -131,52 +534,268 @@ def upload_image():
     if not file or not allowed_file(file.filename):
         return jsonify({'error': 'Invalid file'}), 400
 
-    filename = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex}_{secure_filename(file.filename)}"
-    local_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(local_path)
+    with metrics.stage('read'):
+        data = file.read()
+    metrics.count_bytes('upload', len(data))
+    with metrics.stage('hash'):
+        digest = hashlib.sha256(data).hexdigest()
+    result, cached = result_cache.get_or_compute(
+        digest,
+        lambda: analyze_upload(data, file.filename, digest),
+        cacheable=lambda r: r['azure_blob_url'] is not None,
+    )
+    metrics.cache_lookup('result', cached)
 
-    wear_score = analyze_wear(local_path)
-    depreciation_score = predict_depreciation(local_path)
-    blob_url = upload_to_azure(local_path, filename)
+    response = upload_response(result, cached)
+    if similarity_index is not None:
+        # Looked up per request (not cached) so newly added items show up
+        response['similar_items'] = similar_to_item(digest) or []
+    return jsonify(response)
 
-    return jsonify({
+def upload_response(result, cached):
+    response = {
         'success': True,
-        'wear_level_score': wear_score,
-        'depreciation_score': depreciation_score,
-        'azure_blob_url': blob_url,
+        'wear_level_score': result['wear_level_score'],
+        'depreciation_score': result['depreciation_score'],
+        'azure_blob_url': result['azure_blob_url'],
+        'cached': cached,
         'message': 'Image analyzed and uploaded.'
+    }
+    if 'near_duplicate_of' in result:
+        response['near_duplicate_of'] = result['near_duplicate_of']
+        response['hamming_distance'] = result['hamming_distance']
+        response['message'] = 'Near-duplicate of an earlier upload; its analysis was reused.'
+    if 'upload_job_id' in result:
+        response['upload_job_id'] = result['upload_job_id']
+        response['upload_status'] = 'pending'
+        response['message'] = 'Image analyzed; upload in progress.'
+    return response
+
+@app.route('/upload-images', methods=['POST'])
+def upload_images():
+    files = request.files.getlist('images')
+    if not files:
+        return jsonify({'error': 'No images provided'}), 400
+    if len(files) > MAX_IMAGES_PER_REQUEST:
+        return jsonify({'error': f'At most {MAX_IMAGES_PER_REQUEST} images per request'}), 400
+    invalid = [f.filename for f in files if not f or not allowed_file(f.filename)]
+    if invalid:
+        return jsonify({'error': 'Invalid file', 'files': invalid}), 400
+
+    with metrics.stage('read'):
+        uploads = [(f.filename, f.read()) for f in files]
+    metrics.count_bytes('upload', sum(len(data) for _, data in uploads))
+    with metrics.stage('hash'):
+        digests = [hashlib.sha256(data).hexdigest() for _, data in uploads]
+
+    # Serve repeats from the cache and analyze each distinct new image once
+    results = {}
+    pending = {}
+    for index, digest in enumerate(digests):
+        if digest in results or digest in pending:
+            continue
+        cached = result_cache.lookup(digest)
+        metrics.cache_lookup('result', cached is not None)
+        if cached is not None:
+            results[digest] = dict(cached, cached=True)
+        else:
+            pending[digest] = index
+
+    if pending:
+        indexes = list(pending.values())
+        scores = analyze_images([io.BytesIO(uploads[i][1]) for i in indexes])
+        futures = {
+            digests[i]: upload_executor.submit(store_upload, uploads[i][1], uploads[i][0], wear, dep, digests[i])
+            for i, (wear, dep) in zip(indexes, scores)
+        }
+        for digest, future in futures.items():
+            result = future.result()
+            if result['azure_blob_url'] is not None:
+                result_cache.put(digest, result)
+            results[digest] = dict(result, cached=False)
+
+    images = []
+    for (name, _), digest in zip(uploads, digests):
+        image = dict(results[digest], filename=name)
+        if 'upload_job_id' in image:
+            image['upload_status'] = 'pending'
+        images.append(image)
+
+    return jsonify({
+        'success': True,
+        'images': images,
+        'listing_wear_level_score': round(float(np.mean([i['wear_level_score'] for i in images])), 3),
+        'listing_depreciation_score': round(float(np.mean([i['depreciation_score'] for i in images])), 3),
+        'message': f'{len(images)} images analyzed.'
     })
 
+@app.route('/recommendations', methods=['POST'])
+def recommendations():
+    """
+    Visually similar catalog items, for an uploaded 'image' (not added to
+    the catalog) or for an indexed item via JSON {"item_id": ...}. Optional k.
+    """
+    if similarity_index is None:
+        return jsonify({'error': 'Similarity search is disabled'}), 404
+    try:
+        k = int(request.values.get('k') or (request.get_json(silent=True) or {}).get('k') or SIMILAR_ITEMS_K)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid k'}), 400
+    k = max(1, min(k, 100))
+
+    if 'image' in request.files:
+        file = request.files['image']
+        if not file or not allowed_file(file.filename):
+            return jsonify({'error': 'Invalid file'}), 400
+        arr = preprocess_image(file.stream)
+        if arr is None:
+            return jsonify({'error': 'Could not read image'}), 400
+        return jsonify({'similar_items': recommendation_service.get_similar_items(embedder(arr), k)})
+
+    item_id = (request.get_json(silent=True) or {}).get('item_id')
+    if not item_id:
+        return jsonify({'error': 'Provide an image or an item_id'}), 400
+    items = similar_to_item(item_id, k)
+    if items is None:
+        return jsonify({'error': 'Unknown item'}), 404
+    return jsonify({'similar_items': items})
+
+@app.route('/upload-status/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    if upload_jobs is None:
+        return jsonify({'error': 'Asynchronous uploads are disabled'}), 404
+    state = upload_jobs.status(job_id)
+    if state is None:
+        return jsonify({'error': 'Unknown upload job'}), 404
+    return jsonify(state)
+
 @app.route('/convert-currency', methods=['POST'])
 def convert_currency():
+    body, status = convert_currency_payload(request.get_json(silent=True))
+    return jsonify(body), status
+
+def convert_currency_payload(data):
+    """
+    Returns (response body, status) for a /convert-currency request body.
+    """
     try:
-        data = request.get_json()
         amount = float(data['amount'])
         base = data['base_currency'].upper()
         target = data['target_currency'].upper()
 
         if base == target:
-            return jsonify({'converted_amount': amount, 'exchange_rate': 1.0})
+            return {'converted_amount': amount, 'exchange_rate': 1.0}, 200
 
         rate = get_exchange_rate(base, target)
         if rate is None:
-            return jsonify({'error': 'Exchange rate fetch failed'}), 500
+            return {'error': 'Exchange rate fetch failed'}, 500
 
-        return jsonify({
+        return {
             'converted_amount': round(amount * rate, 2),
             'exchange_rate': rate
-        })
+        }, 200
     except Exception as e:
         logger.error(f"Currency conversion error: {e}")
+        return {'error': 'Invalid request'}, 400
+
+@app.route('/convert-currency/bulk', methods=['POST'])
+def convert_currency_bulk_route():
+    try:
+        data = request.get_json()
+        amounts = data['amounts']
+        base = data.get('base_currencies', data.get('base_currency'))
+        target = data.get('target_currencies', data.get('target_currency'))
+        if not isinstance(amounts, list) or base is None or target is None:
+            raise ValueError("amounts, base_currency(ies) and target_currency(ies) are required")
+        results, table = convert_currency_bulk(amounts, base, target)
+    except Exception as e:
+        logger.error(f"Bulk currency conversion error: {e}")
         return jsonify({'error': 'Invalid request'}), 400
 
-@lru_cache(maxsize=128)
+    if table is None:
+        return jsonify({'error': 'Exchange rate fetch failed'}), 500
+    return jsonify({
+        'results': results,
+        'rates_base': table['base'],
+        'rates_fetched_at': table['fetched_at']
+    })
+
 def get_exchange_rate(base, target):
-    url = f"https://api.exchangerate-api.com/v4/latest/{base}"
-    resp = requests.get(url, timeout=10)
-    if resp.status_code != 200:
-        return None
-    return resp.json().get('rates', {}).get(target)
+    # Served from the cached full rate table; refreshed in the background
+    return exchange_rates().rate(base, target)
+
+DEPRECIATION_FIELDS = ['brand', 'fabric', 'age_years', 'wear_level_score']
+
+@app.route('/depreciation', methods=['POST'])
+def get_depreciation():
+    data = request.get_json(silent=True) or {}
+    if not all(field in data for field in DEPRECIATION_FIELDS):
+        return jsonify({'error': 'Missing one or more required fields'}), 400
+    try:
+        score = calculate_depreciation(
+            brand=data['brand'],
+            fabric=data['fabric'],
+            age_years=float(data['age_years']),
+            wear_level_score=float(data['wear_level_score'])
+        )
+    except (TypeError, ValueError) as e:
+        logger.error(f"Depreciation scoring error: {e}")
+        return jsonify({'error': 'Invalid request'}), 400
+    return jsonify({'depreciation_score': score})
+
+@app.route('/depreciation/batch', methods=['POST'])
+def get_depreciation_batch():
+    """
+    Score a whole inventory in one call. Accepts either columns
+    ({"brand": [...], "fabric": [...], "age_years": [...], "wear_level_score": [...]})
+    or {"items": [{"brand": ..., "fabric": ..., ...}, ...]}.
+    Scores are returned in input order.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        if 'items' in data:
+            items = data['items']
+            columns = {field: [item[field] for item in items] for field in DEPRECIATION_FIELDS}
+        else:
+            columns = {field: data[field] for field in DEPRECIATION_FIELDS}
+        if not all(isinstance(column, list) for column in columns.values()):
+            raise ValueError("Every field must be a list")
+        scores = depreciation_scores(**columns)
+    except ValueError as e:
+        # e.g. "item 3: wear_level_score must be a finite number, got None"
+        logger.error(f"Batch depreciation scoring error: {e}")
+        return jsonify({'error': 'Invalid request', 'detail': str(e)}), 400
+    except (KeyError, TypeError) as e:
+        logger.error(f"Batch depreciation scoring error: {e}")
+        return jsonify({'error': 'Invalid request'}), 400
+    return jsonify({'depreciation_scores': scores.tolist()})
+
+def handle_ebay_notifications(events):
+    """
+    Background handler for a batch of queued notifications. Each event is
+    {'notification_id', 'topic', 'payload'}, already deduplicated.
+    """
+    for event in events:
+        topic = event['topic']
+        if "INVENTORY" in topic:
+            logger.info(f"Processing INVENTORY notification {event['notification_id']}")
+        elif "MARKETPLACE_ACCOUNT_DELETION" in topic:
+            logger.info(f"Processing MARKETPLACE_ACCOUNT_DELETION notification {event['notification_id']}")
+        else:
+            logger.info(f"Unhandled topic: {topic}")
+
+ebay_notifications = NotificationQueue(
+    EBAY_NOTIFY_QUEUE_DB,
+    handle_ebay_notifications,
+    batch_size=EBAY_NOTIFY_BATCH_SIZE,
+    max_attempts=EBAY_NOTIFY_MAX_ATTEMPTS,
+    retry_backoff=EBAY_NOTIFY_RETRY_BACKOFF,
+    retention=EBAY_NOTIFY_RETENTION_DAYS * 24 * 3600,
+    synchronous=EBAY_NOTIFY_SYNC,
+)
+ebay_notifications.start()
+# Queue depth is read from SQLite when /metrics is scraped, not on every health probe
+metrics.collect_on_scrape(metrics.NotificationQueueCollector(ebay_notifications.stats))
 
 @app.route('/ebay-notify', methods=['GET', 'POST'])
 def ebay_notify():
@@ -197,21 +816,25 @@ def ebay_notify():
         return jsonify({'challengeResponse': response_hash}), 200
 
     elif request.method == 'POST':
-        try:
-            data = request.get_json(force=True)
-            logger.info("Received eBay notification: %s", data)
-            topic = data.get("metadata", {}).get("topic", "")
-            if "INVENTORY" in topic:
-                logger.info("Processing INVENTORY notification")
-            elif "MARKETPLACE_ACCOUNT_DELETION" in topic:
-                logger.info("Processing MARKETPLACE_ACCOUNT_DELETION notification")
-            else:
-                logger.info("Unhandled topic: %s", topic)
-
-            return jsonify({"status": "success"}), 200
-        except Exception as e:
-            logger.exception("Error processing eBay notification")
-            return jsonify({"status": "error", "message": str(e)}), 500
+        body, status = enqueue_ebay_notification(request.get_data())
+        return jsonify(body), status
+
+def enqueue_ebay_notification(raw):
+    """
+    Only persist here; handle_ebay_notifications runs in the background.
+    Returns (response body, status).
+    """
+    try:
+        notification_id, added = ebay_notifications.enqueue(raw)
+    except ValueError:
+        logger.warning("Rejected eBay notification with an unparseable body")
+        return {"status": "error", "message": "Invalid JSON"}, 400
+    except Exception as e:
+        logger.exception("Error queueing eBay notification")
+        return {"status": "error", "message": str(e)}, 500
+
+    logger.debug(f"eBay notification {notification_id} {'queued' if added else 'already received'}")
+    return {"status": "success"}, 200
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -219,7 +842,57 @@ def health():
         'status': 'ok',
         'timestamp': datetime.utcnow().isoformat(),
         'wear_model_loaded': wear_model is not None,
-        'depreciation_model_loaded': depreciation_model is not None
+        'depreciation_model_loaded': depreciation_model is not None,
+        'exchange_rates': exchange_rates().stats()
+    })
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness for load balancers, separate from /health (liveness): 200 only
+    once this worker has warmed up and has the models it needs.
+    """
+    missing = [name for name, model in (('wear', wear_model), ('depreciation', depreciation_model)) if model is None]
+    is_ready = warmup_seconds is not None and not (READY_REQUIRE_MODELS and missing)
+    return jsonify({
+        'ready': is_ready,
+        'warmed_up': warmup_seconds is not None,
+        'warmup_seconds': warmup_seconds,
+        'missing_models': missing,
+        'pid': os.getpid(),
+        'intra_op_threads': os.getenv("TF_NUM_INTRAOP_THREADS"),
+        'cpu_affinity': sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else None,
+    }), 200 if is_ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Prometheus text exposition, merged across gunicorn workers (see backend/metrics.py).
+    """
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route('/outbound-stats', methods=['GET'])
+def outbound_stats():
+    return jsonify({'hosts': http_client.stats()})
+
+@app.route('/inference-stats', methods=['GET'])
+def inference_stats():
+    stats = {}
+    for name, model in (('wear', wear_model), ('depreciation', depreciation_model)):
+        if isinstance(model, BatchPredictor):
+            stats[name] = model.stats()
+    return jsonify({
+        'batching_enabled': INFERENCE_BATCHING,
+        'models': stats,
+        'backends': {
+            'wear': wear_model_served_path,
+            'depreciation': depreciation_model_served_path,
+        },
+        'tflite': {name: model.stats() for name, model in tflite_models.items()},
+        'result_cache': result_cache.stats(),
+        'similarity_index': similarity_index.stats() if similarity_index is not None else None,
+        'near_duplicates': near_duplicates.stats() if near_duplicates is not None else None
     })
 
 if __name__ == '__main__':
@@ -0,0 +1,265 @@
+"""
+ASGI serving mode: the same routes as app.py, on an event loop.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 80
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker -w 1
+
+Under `gunicorn app:app` a worker is blocked for the whole of the Azure PUT
+and inference, so concurrency equals the worker count and every worker
+loads its own copy of the models. Here one process loads the models once
+(by importing app.py) and serves POST /upload-image, /convert-currency and
+/ebay-notify natively:
+
+- outbound calls (Azure PUTs) use the pooled async client in
+  backend/async_http.py, so waiting on them holds no thread
+- decoding, hashing and inference run on a bounded pool of
+  ASGI_CPU_WORKERS threads (PIL and TensorFlow release the GIL), SQLite
+  work on ASGI_IO_WORKERS threads
+- at most ASGI_MAX_PENDING_UPLOADS uploads are in flight; beyond that
+  /upload-image answers 503 rather than queueing without bound
+
+Every other route (and CORS preflights) is the Flask app itself, run in a
+thread pool through a2wsgi's WSGI adapter, so behaviour stays the same.
+ASYNC_AZURE_UPLOAD has no effect on the native /upload-image: the PUT
+already happens without holding a worker.
+"""
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+import app as flask_app
+from backend import async_http, metrics
+from backend.azure_blob import put_blob_async
+from backend.cpu_budget import worker_threads
+
+logger = logging.getLogger(__name__)
+
+ASGI_CPU_WORKERS = int(os.getenv("ASGI_CPU_WORKERS", "0")) or worker_threads()
+ASGI_IO_WORKERS = int(os.getenv("ASGI_IO_WORKERS", "8"))
+# Threads running the Flask app for the routes not served natively
+ASGI_WSGI_WORKERS = int(os.getenv("ASGI_WSGI_WORKERS", "10"))
+ASGI_MAX_PENDING_UPLOADS = int(os.getenv("ASGI_MAX_PENDING_UPLOADS", "512"))
+
+cpu_executor = ThreadPoolExecutor(max_workers=ASGI_CPU_WORKERS, thread_name_prefix="asgi-cpu")
+io_executor = ThreadPoolExecutor(max_workers=ASGI_IO_WORKERS, thread_name_prefix="asgi-io")
+
+http = None
+pending_uploads = 0
+inflight = {}
+
+
+async def run_in(executor, fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+def timed(handler):
+    """
+    Request latency for native routes, into the same series Flask's
+    after_request hook feeds.
+    """
+    @functools.wraps(handler)
+    async def wrapper(request):
+        start = time.perf_counter()
+        response = await handler(request)
+        metrics.observe_request(request.url.path, request.method, response.status_code, time.perf_counter() - start)
+        return response
+    return wrapper
+
+
+async def upload_to_azure(data, blob_name):
+    try:
+        blob_url = f"{flask_app.AZURE_CONTAINER_URL}/{blob_name}?{flask_app.AZURE_CONTAINER_SAS_TOKEN}"
+        with metrics.stage('azure_upload'):
+            await put_blob_async(http, blob_url, data)
+        metrics.count_bytes('azure_upload', len(data))
+        return blob_url
+    except Exception as e:
+        logger.error(f"Azure upload error: {e}")
+        return None
+
+
+def _index_upload(scored, digest, original_filename, result):
+    flask_app.remember_near_duplicate(scored['code'], digest, result)
+    return flask_app.index_upload(scored, digest, original_filename, result)
+
+
+async def analyze_upload(data, original_filename, digest):
+    """
+    app.analyze_upload with the CPU work on the executor and the blob PUT on
+    the event loop.
+    """
+    scored = await run_in(cpu_executor, flask_app.score_upload, data)
+    reused = flask_app.reuse_near_duplicate(scored)
+    if reused is not None:
+        return reused
+    result = {
+        'wear_level_score': scored['wear_level_score'],
+        'depreciation_score': scored['depreciation_score'],
+        'azure_blob_url': await upload_to_azure(data, flask_app.blob_name(original_filename)),
+    }
+    return await run_in(cpu_executor, _index_upload, scored, digest, original_filename, result)
+
+
+async def cached_analysis(data, original_filename, digest):
+    """
+    ResultCache.get_or_compute for the event loop: returns (result, hit),
+    and concurrent uploads of the same image share one analysis.
+    """
+    result = await run_in(io_executor, flask_app.result_cache.lookup, digest)
+    if result is not None:
+        return result, True
+    future = inflight.get(digest)
+    if future is not None:
+        return await asyncio.shield(future), True
+
+    future = asyncio.get_running_loop().create_future()
+    # Nobody may be waiting on it; don't warn about an unretrieved exception
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    inflight[digest] = future
+    try:
+        result = await analyze_upload(data, original_filename, digest)
+        if result['azure_blob_url'] is not None:
+            await run_in(io_executor, flask_app.result_cache.put, digest, result)
+        future.set_result(result)
+        return result, False
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        del inflight[digest]
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def limit_body(receive, limit):
+    """
+    Wrap an ASGI receive channel so that reading more than `limit` body
+    bytes raises UploadTooLarge. Counts what actually arrives, so chunked
+    requests (no Content-Length) are held to the same limit.
+    """
+    received = 0
+
+    async def limited():
+        nonlocal received
+        message = await receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > limit:
+                raise UploadTooLarge()
+        return message
+    return limited
+
+
+@timed
+async def upload_image(request):
+    global pending_uploads
+    if pending_uploads >= ASGI_MAX_PENDING_UPLOADS:
+        return JSONResponse({'error': 'Too many uploads in progress'}, status_code=503, headers={'Retry-After': '1'})
+    limit = flask_app.app.config['MAX_CONTENT_LENGTH']
+    content_length = request.headers.get('content-length')
+    if content_length:
+        try:
+            declared = int(content_length)
+        except ValueError:
+            return JSONResponse({'error': 'Invalid Content-Length'}, status_code=400)
+        if declared > limit:
+            return JSONResponse({'error': 'Upload too large'}, status_code=413)
+
+    pending_uploads += 1
+    try:
+        try:
+            form = await Request(request.scope, limit_body(request.receive, limit)).form()
+        except UploadTooLarge:
+            return JSONResponse({'error': 'Upload too large'}, status_code=413)
+        file = form.get('image')
+        if file is None or isinstance(file, str):
+            return JSONResponse({'error': 'No image provided'}, status_code=400)
+        if not file.filename or not flask_app.allowed_file(file.filename):
+            return JSONResponse({'error': 'Invalid file'}, status_code=400)
+
+        with metrics.stage('read'):
+            data = await file.read()
+        metrics.count_bytes('upload', len(data))
+        with metrics.stage('hash'):
+            digest = await run_in(cpu_executor, lambda: hashlib.sha256(data).hexdigest())
+        result, cached = await cached_analysis(data, file.filename, digest)
+        metrics.cache_lookup('result', cached)
+
+        response = flask_app.upload_response(result, cached)
+        if flask_app.similarity_index is not None:
+            response['similar_items'] = await run_in(cpu_executor, flask_app.similar_to_item, digest) or []
+        return JSONResponse(response)
+    finally:
+        pending_uploads -= 1
+
+
+@timed
+async def convert_currency(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if flask_app.exchange_rates().stats()['currencies']:
+        # Served from the in-memory table; refreshes happen on a background thread
+        body, status = flask_app.convert_currency_payload(data)
+    else:
+        # Cold table: the fetch blocks, keep it off the event loop
+        body, status = await run_in(io_executor, flask_app.convert_currency_payload, data)
+    return JSONResponse(body, status_code=status)
+
+
+@timed
+async def ebay_notify(request):
+    raw = await request.body()
+    body, status = await run_in(io_executor, flask_app.enqueue_ebay_notification, raw)
+    return JSONResponse(body, status_code=status)
+
+
+@asynccontextmanager
+async def lifespan(_):
+    global http
+    http = async_http.from_env()
+    # Fetch the rate table (if there is no snapshot) before taking traffic
+    await run_in(io_executor, flask_app.exchange_rates().table)
+    try:
+        yield
+    finally:
+        await http.aclose()
+
+
+native = Starlette(
+    routes=[
+        Route('/upload-image', upload_image, methods=['POST']),
+        Route('/convert-currency', convert_currency, methods=['POST']),
+        Route('/ebay-notify', ebay_notify, methods=['POST']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+NATIVE_ROUTES = {('/upload-image', 'POST'), ('/convert-currency', 'POST'), ('/ebay-notify', 'POST')}
+wsgi = WSGIMiddleware(flask_app.app, workers=ASGI_WSGI_WORKERS)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'http' and (scope['path'], scope['method']) not in NATIVE_ROUTES:
+        await wsgi(scope, receive, send)
+    else:
+        await native(scope, receive, send)
@@ -0,0 +1,69 @@
+"""
+Shared outbound HTTP client for the async (ASGI) server.
+
+The asyncio counterpart of http_client: one httpx.AsyncClient per event
+loop, with pooled keep-alive connections and HTTP_* timeouts and pool size.
+Connection errors and 429/5xx responses to idempotent methods are retried
+with exponential backoff, and latency goes to the same per-host /metrics series. Waiting on
+a response holds no thread, so hundreds of outbound calls can be in flight
+at once.
+"""
+import asyncio
+import os
+import time
+from urllib.parse import urlparse
+
+import httpx
+
+from backend import metrics
+from backend.http_client import RETRY_METHODS, RETRY_STATUSES
+
+
+class AsyncHttpClient:
+    def __init__(self, pool_size=100, retries=3, backoff_factor=0.3, timeout=(5, 30)):
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+        )
+
+    async def request(self, method, url, **kwargs):
+        host = urlparse(url).netloc
+        retries = self.retries if method.upper() in RETRY_METHODS else 0
+        for attempt in range(retries + 1):
+            start = time.perf_counter()
+            try:
+                resp = await self._client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                metrics.outbound_call(host, time.perf_counter() - start, None)
+                if attempt == retries:
+                    raise
+            else:
+                metrics.outbound_call(host, time.perf_counter() - start, resp.status_code)
+                if resp.status_code not in RETRY_STATUSES or attempt == retries:
+                    return resp
+            await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request('PUT', url, **kwargs)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+def from_env():
+    """
+    A client configured like http_client.default_client(). The pool is
+    larger by default (ASYNC_HTTP_POOL_SIZE) since connections are not tied
+    to threads.
+    """
+    return AsyncHttpClient(
+        pool_size=int(os.getenv("ASYNC_HTTP_POOL_SIZE", "100")),
+        retries=int(os.getenv("HTTP_RETRIES", "3")),
+        backoff_factor=float(os.getenv("HTTP_BACKOFF", "0.3")),
+        timeout=(float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")), float(os.getenv("HTTP_READ_TIMEOUT", "30"))),
+    )
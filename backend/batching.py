@@ -0,0 +1,120 @@
+"""
+Dynamic micro-batching in front of a Keras model.
+
+BatchPredictor wraps a loaded model and exposes the same
+predict(arr, verbose=0) call. Concurrent callers are queued; a single
+background thread drains the queue, waiting at most max_delay_ms after the
+oldest pending request or until max_batch_size rows are collected, runs one
+model.predict on the stacked batch and hands each caller back its own rows.
+
+Batching only pays off when a worker handles requests concurrently, e.g.
+gunicorn --threads N or the threaded Flask dev server.
+"""
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+# Upper bounds (ms) of the queue-wait histogram buckets; the last bucket is +Inf
+WAIT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+class BatchPredictor:
+    def __init__(self, model, max_batch_size=16, max_delay_ms=5.0, name='model'):
+        self.model = model
+        self.name = name
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_delay = max(0.0, float(max_delay_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self._wait_count = 0
+        self._wait_sum = 0.0
+        self._wait_max = 0.0
+
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def predict(self, arr, verbose=0):
+        """
+        Queue `arr` (shape (n, ...)) for the next batch and block until its
+        n rows of predictions are ready.
+        """
+        future = Future()
+        self._queue.put((arr, time.perf_counter(), future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            items = [first]
+            rows = len(first[0])
+            deadline = first[1] + self.max_delay
+            while rows < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                items.append(item)
+                rows += len(item[0])
+            self._run_batch(items, rows)
+
+    def _run_batch(self, items, rows):
+        started = time.perf_counter()
+        self._record(rows, [started - enqueued for _, enqueued, _ in items])
+
+        try:
+            batch = items[0][0] if len(items) == 1 else np.concatenate([arr for arr, _, _ in items])
+            preds = self.model.predict(batch, verbose=0)
+        except Exception as e:
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for arr, _, future in items:
+            future.set_result(preds[offset:offset + len(arr)])
+            offset += len(arr)
+
+    def _record(self, rows, waits):
+        with self._lock:
+            self._batch_sizes[rows] += 1
+            for wait in waits:
+                wait_ms = wait * 1000.0
+                index = len(WAIT_BUCKETS_MS)
+                for i, bound in enumerate(WAIT_BUCKETS_MS):
+                    if wait_ms <= bound:
+                        index = i
+                        break
+                self._wait_buckets[index] += 1
+                self._wait_count += 1
+                self._wait_sum += wait_ms
+                self._wait_max = max(self._wait_max, wait_ms)
+
+    def stats(self):
+        """
+        Batch-size distribution and queue-wait summary since startup.
+        """
+        with self._lock:
+            labels = [f"le_{bound}" for bound in WAIT_BUCKETS_MS] + ['le_inf']
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_delay_ms': self.max_delay * 1000.0,
+                'batches': sum(self._batch_sizes.values()),
+                'pending': self._queue.qsize(),
+                'batch_size_histogram': {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                'queue_wait_ms': {
+                    'count': self._wait_count,
+                    'mean': self._wait_sum / self._wait_count if self._wait_count else 0.0,
+                    'max': self._wait_max,
+                    'buckets': dict(zip(labels, self._wait_buckets)),
+                },
+            }
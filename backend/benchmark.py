@@ -0,0 +1,463 @@
+"""
+Load-test harness for the API.
+
+Starts the app under gunicorn (so gunicorn.conf.py and the Procfile setup
+are what gets measured) with outbound Azure and exchange-rate calls pointed
+at a local stub server. It then replays the photos in backend/static
+against /upload-image, and synthetic payloads against /convert-currency and
+/ebay-notify. Every combination of worker count, threads per worker and
+client concurrency is one point:
+
+    python -m backend.benchmark run --workers 1,2,4 --threads 1,4 --concurrency 1,8,32 --out before.json
+    python -m backend.benchmark run --app-env PREPROCESS_MODE=fast --out after.json
+    python -m backend.benchmark run --server asgi --workers 1 --concurrency 16,64,256 --out asgi.json
+    python -m backend.benchmark compare before.json after.json
+
+Each point reports throughput, p50/p95/p99 latency, errors, and per-worker
+CPU seconds and peak RSS (read from /proc, so those are Linux only). The
+result file is rewritten after every point, so an interrupted sweep keeps
+what it measured. The result cache, near-duplicate index and similarity
+index are disabled unless --app-env turns them back on, so repeated images
+are analyzed every time.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+ENDPOINTS = ('upload-image', 'convert-currency', 'ebay-notify')
+CURRENCIES = ['USD', 'EUR', 'GBP', 'JPY', 'CAD', 'AUD', 'CHF', 'SEK']
+STUB_RATES = {'USD': 1.0, 'EUR': 0.92, 'GBP': 0.79, 'JPY': 151.3, 'CAD': 1.37, 'AUD': 1.52, 'CHF': 0.9, 'SEK': 10.6}
+
+# Settings that make points comparable; --app-env overrides any of them
+APP_ENV_DEFAULTS = {
+    'RESULT_CACHE_SIZE': '0',
+    'RESULT_CACHE_DB': '',
+    'PHASH_INDEX_DB': '',
+    'SIMILARITY_INDEX_DIR': '',
+    'ASYNC_AZURE_UPLOAD': '0',
+    'AZURE_CONTAINER_SAS_TOKEN': 'sig=benchmark',
+}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """
+    Accepts Azure Put Blob / Put Block (List) and serves /v4/latest/<base>.
+    """
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=b'', content_type='application/octet-stream'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.latency:
+            time.sleep(self.latency)
+        self._reply(201)
+
+    def do_GET(self):
+        match = re.match(r'^/v4/latest/([A-Z]{3})$', self.path)
+        if match is None or match.group(1) not in STUB_RATES:
+            self._reply(404)
+            return
+        base = STUB_RATES[match.group(1)]
+        rates = {code: rate / base for code, rate in STUB_RATES.items()}
+        self._reply(200, json.dumps({'base': match.group(1), 'rates': rates}).encode('utf-8'), 'application/json')
+
+
+def start_stub_server(latency_ms=0.0):
+    """
+    Runs the stub on a free local port in a daemon thread. Returns (server, base URL).
+    """
+    handler = type('StubHandler', (_StubHandler,), {'latency': latency_ms / 1000.0})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="benchmark-stub", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def load_images(image_dir=STATIC_DIR, limit=None):
+    names = sorted(n for n in os.listdir(image_dir) if n.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')))
+    if limit:
+        names = names[:limit]
+    images = []
+    for name in names:
+        with open(os.path.join(image_dir, name), 'rb') as f:
+            images.append((name, f.read()))
+    if not images:
+        raise ValueError(f"No images found in {image_dir}")
+    return images
+
+
+def request_factory(endpoint, images):
+    """
+    Returns send(session, base_url, i) -> HTTP status for the i-th request
+    of a point. Requests cycle deterministically through the inputs.
+    """
+    if endpoint == 'upload-image':
+        def send(session, base_url, i):
+            name, data = images[i % len(images)]
+            return session.post(f"{base_url}/upload-image", files={'image': (name, data, 'image/jpeg')}).status_code
+    elif endpoint == 'convert-currency':
+        pairs = [(a, b) for a, b in itertools.permutations(CURRENCIES, 2)]
+
+        def send(session, base_url, i):
+            base, target = pairs[i % len(pairs)]
+            payload = {'amount': 10 + i % 990, 'base_currency': base, 'target_currency': target}
+            return session.post(f"{base_url}/convert-currency", json=payload).status_code
+    elif endpoint == 'ebay-notify':
+        run_id = uuid.uuid4().hex
+
+        def send(session, base_url, i):
+            # Unique IDs so every notification is a fresh insert, not a dropped redelivery
+            payload = {
+                'metadata': {'topic': 'MARKETPLACE_ACCOUNT_DELETION', 'schemaVersion': '1.0'},
+                'notification': {
+                    'notificationId': f"{run_id}-{i}",
+                    'eventDate': datetime.utcnow().isoformat(),
+                    'data': {'username': f"user{i}", 'userId': f"id{i}"},
+                },
+            }
+            return session.post(f"{base_url}/ebay-notify", json=payload).status_code
+    else:
+        raise ValueError(f"Unknown endpoint {endpoint}")
+    return send
+
+
+def generate_load(send, base_url, concurrency, duration):
+    """
+    `concurrency` closed-loop clients, each with its own keep-alive session,
+    send back to back for `duration` seconds. Returns (latencies in
+    seconds, errors, elapsed).
+    """
+    counter = itertools.count()
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    deadline = time.perf_counter() + duration
+
+    def client(slot):
+        with requests.Session() as session:
+            while time.perf_counter() < deadline:
+                i = next(counter)
+                start = time.perf_counter()
+                try:
+                    status = send(session, base_url, i)
+                except requests.RequestException:
+                    status = None
+                latencies[slot].append(time.perf_counter() - start)
+                if status is None or status >= 400:
+                    errors[slot] += 1
+
+    threads = [threading.Thread(target=client, args=(slot,), daemon=True) for slot in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [l for per_client in latencies for l in per_client], sum(errors), time.perf_counter() - start
+
+
+def _child_pids(parent):
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def _cpu_seconds(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime, fields 14 and 15 of /proc/<pid>/stat
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def _peak_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+class AppServer:
+    """
+    One gunicorn instance of app:app (or asgi:app under uvicorn workers for
+    server='asgi'), run from the repo root.
+    """
+    def __init__(self, workers, threads, env, workdir, startup_timeout=300, server='sync'):
+        self.server = server
+        self.workers = workers
+        self.threads = threads
+        self.env = env
+        self.workdir = workdir
+        self.startup_timeout = startup_timeout
+        self.process = None
+
+    def __enter__(self):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        metrics_dir = os.path.join(self.workdir, f"metrics-{port}")
+        os.makedirs(metrics_dir, exist_ok=True)
+        env = dict(os.environ, **self.env, PROMETHEUS_MULTIPROC_DIR=metrics_dir)
+        self.log_path = os.path.join(self.workdir, f"gunicorn-{self.server}-{self.workers}w{self.threads}t.log")
+        if self.server == 'asgi':
+            target = ['-k', 'uvicorn.workers.UvicornWorker', 'asgi:app']
+        else:
+            target = ['--threads', str(self.threads), 'app:app']
+        self._log = open(self.log_path, 'ab')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-w', str(self.workers),
+             '-b', f"127.0.0.1:{port}", '--timeout', '300'] + target,
+            cwd=REPO_ROOT, env=env, stdout=self._log, stderr=subprocess.STDOUT,
+        )
+        try:
+            self._wait_until_booted()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def _wait_until_booted(self):
+        # Workers import the app (and load the models) after forking; each one
+        # that has finished sets its garmentz_model_loaded gauge
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {self.process.returncode}, see {self.log_path}")
+            try:
+                text = requests.get(f"{self.base_url}/metrics", timeout=5).text
+                if len(set(re.findall(r'garmentz_model_loaded\{[^}]*pid="(\d+)"', text))) >= self.workers:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError(f"Workers not ready after {self.startup_timeout}s, see {self.log_path}")
+
+    def worker_pids(self):
+        return _child_pids(self.process.pid)
+
+    def __exit__(self, *exc):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self._log.close()
+
+
+def measure(server, endpoint, images, concurrency, duration, warmup):
+    send = request_factory(endpoint, images)
+    if warmup:
+        generate_load(send, server.base_url, concurrency, warmup)
+
+    pids = server.worker_pids()
+    cpu_before = {pid: _cpu_seconds(pid) for pid in pids}
+    latencies, errors, elapsed = generate_load(send, server.base_url, concurrency, duration)
+    cpu = {}
+    for pid in pids:
+        after = _cpu_seconds(pid)
+        if after is not None and cpu_before[pid] is not None:
+            cpu[pid] = after - cpu_before[pid]
+
+    peak_rss = {pid: _peak_rss_mb(pid) for pid in pids}
+
+    ms = np.array(latencies) * 1000.0 if latencies else np.zeros(1)
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        'endpoint': endpoint,
+        'server': server.server,
+        'workers': server.workers,
+        'threads': server.threads,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(float(ms.mean()), 2),
+            'p50': round(float(p50), 2),
+            'p95': round(float(p95), 2),
+            'p99': round(float(p99), 2),
+            'max': round(float(ms.max()), 2),
+        },
+        'worker_cpu_seconds': {str(pid): round(seconds, 3) for pid, seconds in cpu.items()},
+        'cpu_percent': round(100.0 * sum(cpu.values()) / elapsed, 1) if elapsed and cpu else None,
+        'worker_peak_rss_mb': {str(pid): round(rss, 1) for pid, rss in peak_rss.items() if rss is not None},
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _save(path, run):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(run, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _parse_ints(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def run(args):
+    images = load_images(args.image_dir, args.images)
+    stub, stub_url = start_stub_server(args.stub_latency_ms)
+    workdir = tempfile.mkdtemp(prefix="garmentz-bench-")
+    app_env = dict(APP_ENV_DEFAULTS)
+    app_env.update(
+        AZURE_CONTAINER_URL=f"{stub_url}/benchmark",
+        EXCHANGE_RATES_URL=f"{stub_url}/v4/latest/{{base}}",
+        EXCHANGE_RATES_SNAPSHOT=os.path.join(workdir, "exchange_rates.json"),
+        EBAY_NOTIFY_QUEUE_DB=os.path.join(workdir, "ebay_notifications.db"),
+    )
+    for setting in args.app_env:
+        key, _, value = setting.partition('=')
+        app_env[key] = value
+
+    result = {
+        'meta': {
+            'label': args.label,
+            'started_at': datetime.utcnow().isoformat(),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'images': len(images),
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'stub_latency_ms': args.stub_latency_ms,
+            'app_env': {k: v for k, v in app_env.items() if k not in ('AZURE_CONTAINER_SAS_TOKEN',)},
+        },
+        'results': [],
+    }
+    endpoints = args.endpoints.split(',')
+    try:
+        for workers, threads in itertools.product(_parse_ints(args.workers), _parse_ints(args.threads)):
+            with AppServer(workers, threads, app_env, workdir, args.startup_timeout, args.server) as server:
+                for endpoint, concurrency in itertools.product(endpoints, _parse_ints(args.concurrency)):
+                    point = measure(server, endpoint, images, concurrency, args.duration, args.warmup)
+                    result['results'].append(point)
+                    _save(args.out, result)
+                    latency = point['latency_ms']
+                    print(f"{endpoint:<17} w={workers} t={threads} c={concurrency:<4} "
+                          f"{point['throughput_rps']:>9.1f} req/s  p50={latency['p50']:.1f}ms "
+                          f"p95={latency['p95']:.1f}ms p99={latency['p99']:.1f}ms  "
+                          f"errors={point['errors']}  cpu={point['cpu_percent']}%", flush=True)
+    finally:
+        stub.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"Results written to {args.out}")
+
+
+def compare(args):
+    """
+    Side by side view of two result files, matched on (endpoint, workers,
+    threads, concurrency); a sync run can be compared with an asgi one.
+    """
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    def key(point):
+        return point['endpoint'], point['workers'], point['threads'], point['concurrency']
+
+    baseline = {key(point): point for point in before['results']}
+    print(f"{'endpoint':<17} {'w':>2} {'t':>2} {'c':>4}  {'req/s':>17}  {'p95 ms':>19}  {'p99 ms':>19}")
+    for point in after['results']:
+        old = baseline.get(key(point))
+        if old is None:
+            continue
+
+        def change(a, b):
+            return f"{a:>7.1f}→{b:<7.1f}{(b - a) / a * 100 if a else 0.0:+5.0f}%"
+        print(f"{point['endpoint']:<17} {point['workers']:>2} {point['threads']:>2} {point['concurrency']:>4}  "
+              f"{change(old['throughput_rps'], point['throughput_rps'])}  "
+              f"{change(old['latency_ms']['p95'], point['latency_ms']['p95'])}  "
+              f"{change(old['latency_ms']['p99'], point['latency_ms']['p99'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the API under gunicorn against local stubs.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Run a sweep and write the results as JSON")
+    run_parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    run_parser.add_argument('--workers', default='1,2', help="Comma-separated gunicorn worker counts")
+    run_parser.add_argument('--server', choices=['sync', 'asgi'], default='sync',
+                            help="gunicorn app:app, or asgi:app on uvicorn workers")
+    run_parser.add_argument('--threads', default='1', help="Comma-separated threads per worker (sync only)")
+    run_parser.add_argument('--concurrency', default='1,4,16', help="Comma-separated client concurrency")
+    run_parser.add_argument('--duration', type=float, default=20.0, help="Seconds measured per point")
+    run_parser.add_argument('--warmup', type=float, default=3.0, help="Unmeasured seconds before each point")
+    run_parser.add_argument('--image-dir', default=STATIC_DIR)
+    run_parser.add_argument('--images', type=int, default=None, help="Replay only the first N images")
+    run_parser.add_argument('--stub-latency-ms', type=float, default=0.0, help="Delay added to each stub Azure PUT")
+    run_parser.add_argument('--startup-timeout', type=float, default=300.0)
+    run_parser.add_argument('--app-env', action='append', default=[], metavar='KEY=VALUE',
+                            help="Extra app setting, e.g. WEAR_MODEL_BACKEND=tflite-int8 (repeatable)")
+    run_parser.add_argument('--label', default=None)
+    run_parser.add_argument('--out', default=f"benchmark-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.json")
+
+    compare_parser = commands.add_parser('compare', help="Compare two result files")
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == '__main__':
+    main()
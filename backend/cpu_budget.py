@@ -0,0 +1,108 @@
+"""
+Per-worker CPU thread budget.
+
+Left alone, every gunicorn worker sizes TensorFlow's intra-op pool (and
+OpenMP/BLAS) to the whole machine, so N workers run N x cores threads and
+spend their time context switching. gunicorn.conf.py calls
+apply_worker_budget() in each forked worker, before the app is imported.
+It splits CPU_BUDGET cores (default: every core this process may use)
+evenly across the workers, optionally pins each worker to its own block of
+cores (CPU_PIN=1), and exports the thread counts through the usual
+environment variables. app.py then calls configure_tensorflow() before
+loading any model.
+
+Variables already set in the environment are left as they are, so an
+explicit OMP_NUM_THREADS or TFLITE_NUM_THREADS still wins. This relies on
+the app being imported after fork (gunicorn's default, no --preload).
+"""
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+THREAD_VARIABLES = (
+    'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+    'TF_NUM_INTRAOP_THREADS', 'TFLITE_NUM_THREADS',
+)
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan(workers, slot, cpus=None, budget=None):
+    """
+    Threads and cores for worker `slot` of `workers`: `budget` cores taken
+    from `cpus` are split into equal contiguous blocks, one per worker.
+    With more workers than cores each worker gets one thread and workers
+    share cores round-robin.
+    """
+    cpus = available_cpus() if cpus is None else cpus
+    budget = min(budget or len(cpus), len(cpus))
+    threads = max(1, budget // max(1, workers))
+    start = (slot * threads) % budget
+    return {'threads': threads, 'cpus': [cpus[(start + i) % budget] for i in range(threads)]}
+
+
+def worker_threads():
+    """
+    Size for this worker's own CPU-bound pools (image decode, hashing, blob
+    block uploads): the thread budget apply_worker_budget exported, or every
+    core this process may use when there is none (flask run, uvicorn, CLIs).
+    """
+    for name in ('TFLITE_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS'):
+        try:
+            threads = int(os.getenv(name, ""))
+        except ValueError:
+            continue
+        if threads > 0:
+            return threads
+    return len(available_cpus())
+
+
+def apply_worker_budget(workers, slot):
+    """
+    Set this (freshly forked) process's thread budget. Returns the plan.
+    """
+    worker_plan = plan(workers, slot, budget=int(os.getenv("CPU_BUDGET", "0")) or None)
+    threads = str(worker_plan['threads'])
+    for name in THREAD_VARIABLES:
+        os.environ.setdefault(name, threads)
+    os.environ.setdefault('TF_NUM_INTEROP_THREADS', os.getenv("CPU_INTEROP_THREADS", "1"))
+
+    if os.getenv("CPU_PIN", "0") == "1" and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, worker_plan['cpus'])
+        except OSError as e:
+            logger.warning(f"Could not pin worker to CPUs {worker_plan['cpus']}: {e}")
+            worker_plan['cpus'] = available_cpus()
+    else:
+        worker_plan['cpus'] = available_cpus()
+    return worker_plan
+
+
+def configure_tensorflow():
+    """
+    Apply TF_NUM_INTRAOP_THREADS / TF_NUM_INTEROP_THREADS to TensorFlow's
+    thread pools. Must run before the first model is loaded; does nothing
+    when neither is set (e.g. under flask run).
+    """
+    intra = os.getenv("TF_NUM_INTRAOP_THREADS")
+    inter = os.getenv("TF_NUM_INTEROP_THREADS")
+    if not intra and not inter:
+        return
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return
+    try:
+        if intra:
+            tf.config.threading.set_intra_op_parallelism_threads(int(intra))
+        if inter:
+            tf.config.threading.set_inter_op_parallelism_threads(int(inter))
+        logger.info(f"TensorFlow thread pools: intra_op={intra}, inter_op={inter}")
+    except RuntimeError as e:
+        # TensorFlow was already initialized (e.g. the app was preloaded)
+        logger.warning(f"Could not set TensorFlow thread pools: {e}")
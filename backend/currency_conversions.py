@@ -1,11 +1,13 @@
-import requests
+import numpy as np
 
-# API base URL - for Free Currency API (replace with your own API key)
-API_URL = "https://api.freecurrencyapi.com/v1/latest?apikey=fca_live_AtcpIMpdjpbOFPPzF4Vpg7z2FdJSJOzimoO5jC77"
+from backend.exchange_rates import default_store, get_rate
 
 def get_conversion_rate(base_currency, target_currency):
     """
-    Fetch the conversion rate from base_currency to target_currency using the API.
+    Look up the conversion rate from base_currency to target_currency.
+
+    Rates come from the shared exchange-rate table (backend/exchange_rates.py),
+    which is refreshed in the background, so this normally does no network I/O.
     
     Args:
         base_currency (str): Currency to convert from (e.g., 'USD')
@@ -15,19 +17,7 @@ def get_conversion_rate(base_currency, target_currency):
         float or None: Conversion rate, or None if failed
     """
     try:
-        # The API expects base currency as a query param, not in the URL path
-        # So we include base_currency as the "base_currency" param
-        url = f"{API_URL}&base_currency={base_currency.upper()}"
-        response = requests.get(url)
-        response.raise_for_status()
-
-        data = response.json()
-        rates = data.get('data')  # FreeCurrencyAPI returns rates under 'data'
-
-        if not rates:
-            raise ValueError("No rates data in response")
-
-        rate = rates.get(target_currency.upper())
+        rate = get_rate(base_currency, target_currency)
         if rate is None:
             raise ValueError(f"Conversion rate not found for currency: {target_currency}")
         return rate
@@ -54,3 +44,70 @@ def convert_currency(amount, base_currency, target_currency):
         return round(amount * rate, 2)
     else:
         return None
+
+
+def convert_currency_bulk(amounts, base_currencies, target_currencies):
+    """
+    Convert many amounts at once against a single rate snapshot.
+
+    Currency codes are resolved once per distinct code, then every
+    conversion is one vectorised NumPy division and multiply.
+
+    Args:
+        amounts (list): Amounts to convert
+        base_currencies (str or list): One code for all amounts, or one per amount
+        target_currencies (str or list): One code for all amounts, or one per amount
+
+    Returns:
+        tuple: (results, table) where results is a list in input order of
+        {'converted_amount', 'exchange_rate'} or {'error'} dicts, and table
+        is the rate snapshot used (None if no rates were available)
+    """
+    count = len(amounts)
+    if isinstance(base_currencies, str):
+        base_currencies = [base_currencies] * count
+    if isinstance(target_currencies, str):
+        target_currencies = [target_currencies] * count
+    if len(base_currencies) != count or len(target_currencies) != count:
+        raise ValueError("Currency lists must match the number of amounts")
+
+    errors = [None] * count
+    try:
+        values = np.asarray(amounts, dtype=np.float64)
+    except (TypeError, ValueError):
+        values = np.full(count, np.nan)
+        for i, amount in enumerate(amounts):
+            try:
+                values[i] = float(amount)
+            except (TypeError, ValueError):
+                errors[i] = 'Invalid amount'
+    for i in np.flatnonzero(~np.isfinite(values)):
+        errors[i] = 'Invalid amount'
+
+    table = default_store().table()
+    if table is None:
+        return [{'error': 'Exchange rate fetch failed'}] * count, None
+
+    bases = np.array([str(c).upper() for c in base_currencies], dtype=str)
+    targets = np.array([str(c).upper() for c in target_currencies], dtype=str)
+    codes, inverse = np.unique(np.concatenate([bases, targets]), return_inverse=True)
+    rates = table['rates']
+    units = np.array([1.0 if code == table['base'] else rates.get(code) or np.nan for code in codes])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        exchange_rates = units[inverse[count:]] / units[inverse[:count]]
+    exchange_rates[bases == targets] = 1.0
+    converted = np.round(values * exchange_rates, 2)
+
+    results = []
+    for i in range(count):
+        if errors[i] is not None:
+            results.append({'error': errors[i]})
+        elif np.isnan(exchange_rates[i]):
+            results.append({'error': f"Conversion rate not found for {bases[i]} -> {targets[i]}"})
+        else:
+            results.append({
+                'converted_amount': float(converted[i]),
+                'exchange_rate': float(exchange_rates[i])
+            })
+    return results, table
@@ -0,0 +1,199 @@
+"""
+Preprocessed, memory-mapped copy of the training set.
+
+build_shards reads csv/dataset.csv, decodes each image once to a 224x224
+RGB uint8 tensor and appends it to .npy shard files under shards/. Labels
+and metadata are kept column-wise in shards/metadata.npz:
+
+    image_name, wear_category, clothing_type, fabric_type, wear_signs,
+    sha256, shard, offset
+
+Builds are incremental. An image is only decoded again when its content
+hash changes; everything else keeps pointing at the shard slot written by
+an earlier build. Shards are never rewritten, so a running trainer can
+keep reading while a build is in progress. Use --rebuild to start over and
+drop slots that are no longer referenced.
+
+    python -m backend.dataset_shards
+    python -m backend.dataset_shards --rebuild --workers 8
+
+ShardDataset opens the shards with np.load(mmap_mode='r'), so every
+trainer shares the page cache instead of decoding JPEGs itself.
+"""
+import argparse
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_DIR = os.path.join(BASE_DIR, 'static')
+LABELS_CSV = os.path.join(BASE_DIR, 'csv', 'dataset.csv')
+SHARDS_DIR = os.path.join(BASE_DIR, 'shards')
+IMAGE_SIZE = (224, 224)
+SHARD_SIZE = 1024
+COLUMNS = ['image_name', 'wear_category', 'clothing_type', 'fabric_type', 'wear_signs']
+METADATA_FILE = 'metadata.npz'
+
+
+def shard_path(shards_dir, shard):
+    return os.path.join(shards_dir, f"images_{shard:05d}.npy")
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def decode(path, size=IMAGE_SIZE):
+    with Image.open(path) as img:
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return np.asarray(img.resize(size, Image.Resampling.LANCZOS), dtype=np.uint8)
+
+
+def load_metadata(shards_dir):
+    path = os.path.join(shards_dir, METADATA_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def build_shards(dataset_csv=LABELS_CSV, image_dir=IMAGE_DIR, shards_dir=SHARDS_DIR,
+                 shard_size=SHARD_SIZE, workers=None, rebuild=False):
+    if rebuild and os.path.exists(shards_dir):
+        shutil.rmtree(shards_dir)
+    os.makedirs(shards_dir, exist_ok=True)
+
+    df = pd.read_csv(dataset_csv, usecols=COLUMNS)
+    df = df[[os.path.exists(os.path.join(image_dir, name)) for name in df['image_name']]].reset_index(drop=True)
+    paths = [os.path.join(image_dir, name) for name in df['image_name']]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = list(executor.map(file_sha256, paths))
+
+    previous = {}
+    old = load_metadata(shards_dir)
+    if old is not None:
+        for sha, shard, offset in zip(old['sha256'], old['shard'], old['offset']):
+            previous[str(sha)] = (int(shard), int(offset))
+
+    shard_ids = np.full(len(df), -1, dtype=np.int32)
+    offsets = np.full(len(df), -1, dtype=np.int32)
+    to_encode = []
+    for i, sha in enumerate(hashes):
+        if sha in previous:
+            shard_ids[i], offsets[i] = previous[sha]
+        else:
+            to_encode.append(i)
+
+    next_shard = 0
+    if old is not None and len(old['shard']):
+        next_shard = int(old['shard'].max()) + 1
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(to_encode), shard_size):
+            rows = to_encode[start:start + shard_size]
+            shard = next_shard
+            next_shard += 1
+            tmp_path = shard_path(shards_dir, shard) + '.tmp'
+            out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                            shape=(len(rows),) + IMAGE_SIZE[::-1] + (3,))
+            for offset, arr in enumerate(executor.map(decode, [paths[i] for i in rows])):
+                out[offset] = arr
+            out.flush()
+            del out
+            os.replace(tmp_path, shard_path(shards_dir, shard))
+            shard_ids[rows] = shard
+            offsets[rows] = np.arange(len(rows), dtype=np.int32)
+
+    columns = {name: df[name].astype(str).to_numpy(dtype=str) for name in COLUMNS}
+    columns.update(sha256=np.array(hashes), shard=shard_ids, offset=offsets)
+    tmp_path = os.path.join(shards_dir, 'metadata.tmp.npz')
+    np.savez(tmp_path, **columns)
+    os.replace(tmp_path, os.path.join(shards_dir, METADATA_FILE))
+
+    return {'images': len(df), 'encoded': len(to_encode), 'reused': len(df) - len(to_encode)}
+
+
+class ShardDataset:
+    """
+    Read-only view over built shards. `metadata` holds the columns from
+    metadata.npz; row i of every column describes image i.
+    """
+
+    def __init__(self, shards_dir=SHARDS_DIR):
+        self.metadata = load_metadata(shards_dir)
+        if self.metadata is None:
+            raise FileNotFoundError(f"No shards in {shards_dir}; run python -m backend.dataset_shards first")
+        self._shards = {
+            int(shard): np.load(shard_path(shards_dir, int(shard)), mmap_mode='r')
+            for shard in np.unique(self.metadata['shard'])
+        }
+
+    @property
+    def image_shape(self):
+        return next(iter(self._shards.values())).shape[1:]
+
+    def __len__(self):
+        return len(self.metadata['image_name'])
+
+    def image(self, row):
+        """
+        Zero-copy view of one image.
+        """
+        return self._shards[int(self.metadata['shard'][row])][int(self.metadata['offset'][row])]
+
+    def images(self, rows):
+        """
+        uint8 batch of shape (len(rows), H, W, 3). Only the batch is copied
+        out of the page cache.
+        """
+        rows = np.asarray(rows)
+        out = np.empty((len(rows),) + self.image_shape, dtype=np.uint8)
+        shards = self.metadata['shard'][rows]
+        offsets = self.metadata['offset'][rows]
+        for shard in np.unique(shards):
+            mask = shards == shard
+            # Sorted offsets keep reads sequential within a shard
+            order = np.argsort(offsets[mask])
+            positions = np.flatnonzero(mask)[order]
+            out[positions] = self._shards[int(shard)][offsets[mask][order]]
+        return out
+
+    def iter_batches(self, rows, labels, batch_size, shuffle=False, seed=None):
+        """
+        Yields (uint8 images, labels) batches over `rows`.
+        """
+        rows = np.asarray(rows)
+        labels = np.asarray(labels)
+        order = np.random.default_rng(seed).permutation(len(rows)) if shuffle else np.arange(len(rows))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            yield self.images(rows[batch]), labels[batch]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build memory-mapped training shards.")
+    parser.add_argument('--csv', default=LABELS_CSV)
+    parser.add_argument('--image-dir', default=IMAGE_DIR)
+    parser.add_argument('--out', default=SHARDS_DIR)
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--rebuild', action='store_true', help="Discard existing shards first")
+    args = parser.parse_args()
+
+    result = build_shards(args.csv, args.image_dir, args.out, args.shard_size, args.workers, args.rebuild)
+    print(f"{result['images']} images: {result['encoded']} encoded, {result['reused']} reused")
+
+
+if __name__ == '__main__':
+    main()
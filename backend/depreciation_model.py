@@ -2,6 +2,8 @@ import numpy as np
 from tensorflow.keras.models import load_model
 from tensorflow.keras.preprocessing import image
 
+from backend.depreciation_scoring import calculate_depreciation
+
 class DepreciationModel:
     def __init__(self, model_path: str = None):
         try:
@@ -28,10 +30,4 @@ class DepreciationModel:
         """
         Rule-based depreciation scoring fallback.
         """
-        brand_score = 0.8 if brand.lower() in ['gucci', 'prada', 'lv'] else 0.6
-        fabric_score = 0.9 if fabric.lower() in ['leather', 'wool'] else 0.7
-        age_score = max(0, 1 - (age_years / 10))  # 10% value loss per year
-        wear_score = 1 - wear_level_score        # wear level between 0 (new) and 1 (worn)
-
-        depreciation = brand_score * fabric_score * age_score * wear_score
-        return round(depreciation, 3)
+        return calculate_depreciation(brand, fabric, age_years, wear_level_score)
@@ -1,3 +1,5 @@
+from backend.depreciation_scoring import calculate_depreciation, depreciation_scores
+
 class DepreciationService:
     def __init__(self):
         self.depreciation_rates = {
@@ -19,10 +21,11 @@ class DepreciationService:
         Rule-based depreciation score from multiple item attributes.
         Returns a float between 0 and 1 representing depreciation factor.
         """
-        brand_score = 0.8 if brand.lower() in ['gucci', 'prada', 'lv'] else 0.6
-        fabric_score = 0.9 if fabric.lower() in ['leather', 'wool'] else 0.7
-        age_score = max(0, 1 - (age_years / 10))  # 10% value loss per year
-        wear_score = 1 - wear_level_score         # Lower score = more depreciation
+        return calculate_depreciation(brand, fabric, age_years, wear_level_score)
 
-        depreciation = brand_score * fabric_score * age_score * wear_score
-        return round(depreciation, 3)
+    def calculate_depreciation_batch(self, brand, fabric, age_years, wear_level_score):
+        """
+        Vectorised calculate_depreciation over columns of item attributes.
+        Returns a NumPy array of scores in input order.
+        """
+        return depreciation_scores(brand, fabric, age_years, wear_level_score)
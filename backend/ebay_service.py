@@ -1,12 +1,21 @@
+from backend.price_index import default_index
+
 class EbayService:
-    def __init__(self):
-        pass
+    def __init__(self, price_index=None):
+        # Comparable-sales index (backend/price_index.py); PRICE_INDEX_DB enables the default one
+        self.price_index = price_index if price_index is not None else default_index()
 
-    def get_price_estimate(self, condition: str) -> dict:
+    def get_price_estimate(self, condition: str, clothing_type: str = None, fabric_type: str = None) -> dict:
         """
-        Returns a mocked price estimate based on condition.
-        Replace this with real API logic using eBay's Finding API.
+        Returns {'min', 'avg', 'max'} for the condition. Comes from the local
+        comparable-sales index when it has enough sales for the item (with
+        percentiles and the sale count too); otherwise a mocked estimate.
         """
+        if self.price_index is not None:
+            estimate = self.price_index.estimate(clothing_type, fabric_type, condition)
+            if estimate is not None:
+                return estimate
+
         mock_prices = {
             'heavily worn': {'min': 10, 'avg': 15, 'max': 20},
             'lightly worn': {'min': 25, 'avg': 35, 'max': 45},
@@ -0,0 +1,188 @@
+"""
+Process-wide exchange-rate table.
+
+One fetch of /v4/latest/<base> returns rates for every currency, so the
+whole table is cached and any pair is derived locally as a cross-rate:
+rate(A -> B) = rates[B] / rates[A]. A background thread refreshes the
+table before it expires; callers only ever block on the network when no
+table exists yet (first request with no snapshot on disk).
+
+Each successful fetch is written to a JSON snapshot. It seeds the table at
+startup and keeps conversions working if the provider is down; a stale
+table is served rather than failing.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from backend import http_client
+
+logger = logging.getLogger(__name__)
+
+RATES_URL = "https://api.exchangerate-api.com/v4/latest/{base}"
+
+
+def fetch_latest(base):
+    # EXCHANGE_RATES_URL points at a different provider (or a local stub in benchmarks)
+    url = os.getenv("EXCHANGE_RATES_URL", RATES_URL)
+    resp = http_client.get(url.format(base=base), timeout=(5, 10))
+    resp.raise_for_status()
+    rates = resp.json().get('rates')
+    if not rates:
+        raise ValueError("No rates data in response")
+    return rates
+
+
+class RatesStore:
+    def __init__(self, fetch=fetch_latest, base='USD', ttl=3600, snapshot_path=None, refresh_margin=0.2):
+        self.fetch = fetch
+        self.base = base.upper()
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.refresh_margin = refresh_margin
+
+        self._table = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._thread_pid = None
+        self.last_error = None
+        self._load_snapshot()
+
+    def _load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path) as f:
+                table = json.load(f)
+            if table.get('base') == self.base and table.get('rates'):
+                self._table = table
+                logger.info(f"Loaded exchange-rate snapshot from {self.snapshot_path}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable exchange-rate snapshot: {e}")
+
+    def _save_snapshot(self, table):
+        if not self.snapshot_path:
+            return
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(table, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.warning(f"Could not write exchange-rate snapshot: {e}")
+
+    def _due(self):
+        table = self._table
+        if table is None:
+            return 0
+        return table['fetched_at'] + self.ttl * (1 - self.refresh_margin)
+
+    def refresh(self, force=True):
+        """
+        Fetch a fresh table. On failure the previous table stays in place.
+        With force=False nothing is fetched if another thread has already
+        brought the table up to date. Returns True if the table is current.
+        """
+        with self._refresh_lock:
+            if not force and self._table is not None and time.time() < self._due():
+                return True
+            try:
+                rates = self.fetch(self.base)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Exchange rate refresh failed: {e}")
+                return False
+            table = {'base': self.base, 'rates': rates, 'fetched_at': time.time()}
+            with self._lock:
+                self._table = table
+            self.last_error = None
+            self._save_snapshot(table)
+            return True
+
+    def _ensure_refresher(self):
+        # Started lazily so each forked gunicorn worker gets its own thread
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._refresh_loop, name="exchange-rates", daemon=True).start()
+
+    def _refresh_loop(self):
+        failures = 0
+        while True:
+            delay = max(0, self._due() - time.time())
+            if failures:
+                delay = max(delay, min(300, 5 * 2 ** (failures - 1)))
+            time.sleep(delay)
+            failures = 0 if self.refresh(force=False) else failures + 1
+
+    def table(self):
+        self._ensure_refresher()
+        table = self._table
+        if table is None:
+            # Cold start without a snapshot: nothing to serve until one fetch succeeds
+            self.refresh(force=False)
+            table = self._table
+        return table
+
+    def rate(self, base, target):
+        """
+        Rate for converting one unit of `base` into `target`, or None if
+        either currency is unknown or no table could be fetched.
+        """
+        base = base.upper()
+        target = target.upper()
+        if base == target:
+            return 1.0
+        table = self.table()
+        if table is None:
+            return None
+        rates = table['rates']
+        if base == table['base']:
+            return rates.get(target)
+        if target == table['base']:
+            return 1.0 / rates[base] if rates.get(base) else None
+        if not rates.get(base) or target not in rates:
+            return None
+        return rates[target] / rates[base]
+
+    def stats(self):
+        table = self._table
+        return {
+            'base': self.base,
+            'currencies': len(table['rates']) if table else 0,
+            'age_seconds': time.time() - table['fetched_at'] if table else None,
+            'stale': bool(table) and time.time() - table['fetched_at'] > self.ttl,
+            'last_error': self.last_error,
+        }
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def default_store():
+    """
+    The store shared by the API and currency_conversions, configured from
+    EXCHANGE_RATES_BASE, EXCHANGE_RATES_TTL and EXCHANGE_RATES_SNAPSHOT
+    (default: exchange_rates.json under DATA_DIR).
+    """
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = RatesStore(
+                base=os.getenv("EXCHANGE_RATES_BASE", "USD"),
+                ttl=float(os.getenv("EXCHANGE_RATES_TTL", "3600")),
+                snapshot_path=os.getenv("EXCHANGE_RATES_SNAPSHOT",
+                                        os.path.join(os.getenv("DATA_DIR", "data"), "exchange_rates.json")),
+            )
+        return _default_store
+
+
+def get_rate(base, target):
+    return default_store().rate(base, target)
@@ -0,0 +1,135 @@
+"""
+Export the trained Keras models to float16 and int8 TFLite files and
+measure what the conversion costs.
+
+Int8 calibration uses images listed in csv/dataset.csv; the comparison
+against Keras runs on the images in validation/validation.csv. For every
+model and variant a report is written next to the .tflite file with the
+per-image latency of both backends and the score deltas.
+
+Run from the repository root:
+
+    python -m backend.export_tflite
+    python -m backend.export_tflite --models wear_tear_model depreciation_model --calibration-samples 200
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+
+from backend.model_fetch import MODELS_DIR, tflite_filename, update_manifest
+from backend.preprocess import load_exact
+from backend.tflite_model import TFLiteModel
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_DIR = os.path.join(BASE_DIR, 'static')
+LABELS_CSV = os.path.join(BASE_DIR, 'csv', 'dataset.csv')
+VALIDATION_CSV = os.path.join(BASE_DIR, 'validation', 'validation.csv')
+MODEL_NAMES = ['wear_tear_model', 'depreciation_model']
+VARIANTS = ['float16', 'int8']
+
+
+def image_paths(csv_path, image_dir, limit=None, seed=42):
+    names = pd.read_csv(csv_path)['image_name'].tolist()
+    paths = [os.path.join(image_dir, n) for n in names if os.path.exists(os.path.join(image_dir, n))]
+    if limit is not None and limit < len(paths):
+        rng = np.random.default_rng(seed)
+        paths = [paths[i] for i in sorted(rng.choice(len(paths), limit, replace=False))]
+    return paths
+
+
+def convert(model, variant, calibration_paths):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == 'int8':
+        def representative_dataset():
+            for path in calibration_paths:
+                yield [np.expand_dims(load_exact(path).astype(np.float32), axis=0)]
+        converter.representative_dataset = representative_dataset
+        # Integer kernels throughout; float input/output keep the serving interface unchanged
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        raise ValueError(f"Unknown variant: {variant}")
+    return converter.convert()
+
+
+def compare(keras_model, tflite_model, paths):
+    """
+    Per-image latency of both backends and the difference in clamped score.
+    """
+    keras_time = 0.0
+    tflite_time = 0.0
+    deltas = []
+    for path in paths:
+        arr = np.expand_dims(load_exact(path).astype(np.float32), axis=0)
+
+        start = time.perf_counter()
+        keras_pred = keras_model.predict(arr, verbose=0)
+        keras_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        tflite_pred = tflite_model.predict(arr)
+        tflite_time += time.perf_counter() - start
+
+        keras_score = np.clip(keras_pred.reshape(-1)[0], 0, 1)
+        tflite_score = np.clip(tflite_pred.reshape(-1)[0], 0, 1)
+        deltas.append(float(abs(keras_score - tflite_score)))
+
+    count = len(paths)
+    return {
+        'images': count,
+        'keras_ms_per_image': 1000 * keras_time / count if count else 0.0,
+        'tflite_ms_per_image': 1000 * tflite_time / count if count else 0.0,
+        'score_mean_abs_diff': float(np.mean(deltas)) if count else 0.0,
+        'score_p95_abs_diff': float(np.percentile(deltas, 95)) if count else 0.0,
+        'score_max_abs_diff': max(deltas) if count else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Keras models to quantized TFLite.")
+    parser.add_argument('--models', nargs='+', default=MODEL_NAMES)
+    parser.add_argument('--variants', nargs='+', default=VARIANTS, choices=VARIANTS)
+    parser.add_argument('--model-dir', default=MODELS_DIR, help="Where the app loads models from")
+    parser.add_argument('--calibration-samples', type=int, default=100)
+    parser.add_argument('--eval-samples', type=int, default=None)
+    args = parser.parse_args()
+
+    calibration_paths = image_paths(LABELS_CSV, IMAGE_DIR, args.calibration_samples)
+    eval_paths = image_paths(VALIDATION_CSV, IMAGE_DIR, args.eval_samples)
+
+    for name in args.models:
+        h5_path = os.path.join(args.model_dir, f"{name}.h5")
+        if not os.path.exists(h5_path):
+            print(f"Skipping {name}: {h5_path} not found")
+            continue
+        keras_model = load_model(h5_path)
+
+        for variant in args.variants:
+            print(f"Converting {name} to {variant}...")
+            tflite_path = os.path.join(args.model_dir, tflite_filename(f"{name}.h5", variant))
+            with open(tflite_path, 'wb') as f:
+                f.write(convert(keras_model, variant, calibration_paths))
+
+            report = compare(keras_model, TFLiteModel(tflite_path), eval_paths)
+            report['size_bytes'] = os.path.getsize(tflite_path)
+            report['keras_size_bytes'] = os.path.getsize(h5_path)
+            with open(f"{tflite_path}.report.json", 'w') as f:
+                json.dump(report, f, indent=2)
+
+            # Lets model_fetch verify the file on nodes that download it
+            update_manifest(os.path.join(args.model_dir, "manifest.json"), [tflite_path])
+            print(f"  saved {tflite_path}")
+            for key, value in report.items():
+                print(f"  {key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
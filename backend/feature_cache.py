@@ -0,0 +1,146 @@
+"""
+Pooled embeddings from a frozen, pretrained backbone, cached on disk.
+
+The cache lives in features/<key>.npy (float32, one row per image) with
+features/<key>.hashes.npy holding the SHA-256 of the source image for each
+row. Images whose hash is already cached are never run through the
+backbone again, so after a label fix or a few new photos only the new
+images cost anything.
+
+The key (see cache_key) covers everything that changes the embeddings: the
+backbone, its weights (the file's SHA-256 for a local .h5), the input size
+and PREPROCESS_VERSION. Swapping any of them starts a new cache instead of
+mixing incompatible vectors; features/<key>.json records what the key
+stands for.
+
+Backbone weights are read from BACKBONE_WEIGHTS (a local .h5 from
+keras.applications) when set; otherwise Keras' ImageNet weights are used,
+which downloads them on first use.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FEATURES_DIR = os.path.join(BASE_DIR, 'features')
+BACKBONE = 'mobilenet_v2'
+IMAGE_SIZE = (224, 224)
+BACKBONE_WEIGHTS = os.getenv('BACKBONE_WEIGHTS')
+# Bump when the pixels fed to the backbone change (decode, resize, scaling)
+PREPROCESS_VERSION = 1
+
+
+def build_backbone(image_size=IMAGE_SIZE, weights=None):
+    """
+    MobileNetV2 with global average pooling. Takes images scaled to [0, 1],
+    the same input the served models get, and rescales to the [-1, 1]
+    range MobileNetV2 was trained on.
+    """
+    base = tf.keras.applications.MobileNetV2(
+        input_shape=image_size + (3,),
+        include_top=False,
+        pooling='avg',
+        weights=weights or BACKBONE_WEIGHTS or 'imagenet',
+    )
+    base.trainable = False
+    inputs = tf.keras.Input(shape=image_size + (3,))
+    x = tf.keras.layers.Rescaling(2.0, offset=-1.0)(inputs)
+    outputs = base(x, training=False)
+    return tf.keras.Model(inputs, outputs, name=f"{BACKBONE}_backbone")
+
+
+def cache_identity(weights=None, image_size=IMAGE_SIZE, backbone=BACKBONE):
+    """
+    What the cached embeddings depend on, as a dict.
+    """
+    weights = weights or BACKBONE_WEIGHTS or 'imagenet'
+    if os.path.isfile(weights):
+        digest = hashlib.sha256()
+        with open(weights, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        weights = f"sha256:{digest.hexdigest()}"
+    return {
+        'backbone': backbone,
+        'weights': weights,
+        'image_size': [int(n) for n in image_size],
+        'preprocess_version': PREPROCESS_VERSION,
+    }
+
+
+def cache_key(weights=None, image_size=IMAGE_SIZE, backbone=BACKBONE):
+    identity = cache_identity(weights, image_size, backbone)
+    digest = hashlib.sha256(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest()
+    return f"{backbone}-{digest[:16]}"
+
+
+def _paths(features_dir, key):
+    return (os.path.join(features_dir, f"{key}.npy"),
+            os.path.join(features_dir, f"{key}.hashes.npy"))
+
+
+def load_features(features_dir=FEATURES_DIR, key=None):
+    """
+    Returns (hashes, embeddings) for cache `key` (default: cache_key());
+    both empty if nothing is cached yet.
+    """
+    embeddings_path, hashes_path = _paths(features_dir, key or cache_key())
+    if not os.path.exists(embeddings_path):
+        return np.array([], dtype='<U64'), None
+    return np.load(hashes_path), np.load(embeddings_path, mmap_mode='r')
+
+
+def update_features(shards, model=None, features_dir=FEATURES_DIR, weights=None, batch_size=64):
+    """
+    Embed every image in `shards` (a ShardDataset) that is not cached yet.
+    `weights` must be what `model` was built with. Returns the number of
+    newly embedded images.
+    """
+    os.makedirs(features_dir, exist_ok=True)
+    image_size = shards.image_shape[:2]
+    key = cache_key(weights, image_size)
+    hashes, embeddings = load_features(features_dir, key)
+    known = set(hashes.tolist())
+    shard_hashes = shards.metadata['sha256']
+    rows = []
+    for i, sha in enumerate(shard_hashes):
+        if sha not in known:
+            known.add(sha)  # duplicate images in the CSV are embedded once
+            rows.append(i)
+    if not rows:
+        return 0
+
+    model = model or build_backbone(image_size, weights=weights)
+    new_embeddings = []
+    for images, _ in shards.iter_batches(rows, np.zeros(len(rows)), batch_size):
+        new_embeddings.append(model.predict(images.astype(np.float32) / 255.0, verbose=0))
+    new_embeddings = np.concatenate(new_embeddings).astype(np.float32)
+
+    if embeddings is not None:
+        new_embeddings = np.concatenate([np.asarray(embeddings), new_embeddings])
+    hashes = np.concatenate([hashes, shard_hashes[rows]])
+
+    embeddings_path, hashes_path = _paths(features_dir, key)
+    with open(os.path.join(features_dir, f"{key}.json"), 'w') as f:
+        json.dump(cache_identity(weights, image_size), f, indent=2)
+    for path, arr in ((embeddings_path, new_embeddings), (hashes_path, hashes)):
+        tmp_path = f"{path}.tmp.npy"
+        np.save(tmp_path, arr)
+        os.replace(tmp_path, path)
+    return len(rows)
+
+
+def features_for(shards, features_dir=FEATURES_DIR, weights=None):
+    """
+    Embedding matrix aligned with the rows of `shards`, from the cache that
+    matches `weights` and the shards' image size.
+    """
+    hashes, embeddings = load_features(features_dir, cache_key(weights, shards.image_shape[:2]))
+    index = {sha: i for i, sha in enumerate(hashes.tolist())}
+    missing = [sha for sha in shards.metadata['sha256'] if sha not in index]
+    if missing:
+        raise KeyError(f"{len(missing)} images have no cached features; run update_features first")
+    return np.asarray(embeddings)[[index[sha] for sha in shards.metadata['sha256']]]
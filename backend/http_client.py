@@ -0,0 +1,141 @@
+"""
+Shared outbound HTTP client.
+
+Every outbound call (model downloads, Azure blob uploads, exchange rates)
+goes through one requests.Session per process. Connections to each host are
+pooled and kept alive, so TLS handshakes are paid once rather than per
+call. Requests get a default timeout, and connection errors and
+429/5xx responses to idempotent methods (RETRY_METHODS) are retried with
+exponential backoff. This is the only retry layer: callers such as
+UploadJobs make a single call and treat a failure as final. Latency and
+error counts are tracked per host (and exported to /metrics).
+
+Tuned with HTTP_POOL_SIZE, HTTP_RETRIES, HTTP_BACKOFF, HTTP_CONNECT_TIMEOUT
+and HTTP_READ_TIMEOUT.
+"""
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from backend import metrics
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# A POST is never resent: a retry after a lost response could apply it twice
+RETRY_METHODS = frozenset(('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'))
+
+
+class HttpClient:
+    def __init__(self, pool_size=16, retries=3, backoff_factor=0.3, timeout=(5, 30)):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+
+        self._session_obj = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _session(self):
+        # Pooled sockets must not be shared with a forked child
+        if self._session_pid != os.getpid():
+            with self._lock:
+                if self._session_pid != os.getpid():
+                    retry = Retry(
+                        total=self.retries,
+                        backoff_factor=self.backoff_factor,
+                        status_forcelist=RETRY_STATUSES,
+                        allowed_methods=RETRY_METHODS,
+                        raise_on_status=False,
+                    )
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+                    session = requests.Session()
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session_obj = session
+                    self._session_pid = os.getpid()
+                    self._hosts = {}
+        return self._session_obj
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlparse(url).netloc
+        start = time.perf_counter()
+        try:
+            resp = self._session().request(method, url, **kwargs)
+        except Exception:
+            self._record(host, time.perf_counter() - start, None)
+            raise
+        self._record(host, time.perf_counter() - start, resp.status_code)
+        return resp
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def _record(self, host, elapsed, status):
+        metrics.outbound_call(host, elapsed, status)
+        with self._lock:
+            stats = self._hosts.get(host)
+            if stats is None:
+                stats = self._hosts[host] = {
+                    'requests': 0, 'errors': 0, 'status_4xx': 0, 'status_5xx': 0,
+                    'total_ms': 0.0, 'max_ms': 0.0,
+                }
+            elapsed_ms = elapsed * 1000.0
+            stats['requests'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if status is None:
+                stats['errors'] += 1
+            elif status >= 500:
+                stats['status_5xx'] += 1
+            elif status >= 400:
+                stats['status_4xx'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                host: dict(s, mean_ms=s['total_ms'] / s['requests'] if s['requests'] else 0.0)
+                for host, s in self._hosts.items()
+            }
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def default_client():
+    """
+    The process-wide client, configured from the environment on first use
+    (after app.py has loaded .env).
+    """
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HttpClient(
+                pool_size=int(os.getenv("HTTP_POOL_SIZE", "16")),
+                retries=int(os.getenv("HTTP_RETRIES", "3")),
+                backoff_factor=float(os.getenv("HTTP_BACKOFF", "0.3")),
+                timeout=(float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")), float(os.getenv("HTTP_READ_TIMEOUT", "30"))),
+            )
+        return _default_client
+
+
+def get(url, **kwargs):
+    return default_client().get(url, **kwargs)
+
+
+def put(url, **kwargs):
+    return default_client().put(url, **kwargs)
+
+
+def stats():
+    return default_client().stats()
@@ -0,0 +1,140 @@
+"""
+Prometheus instrumentation for the API.
+
+Metrics are plain prometheus_client objects, so recording costs an
+increment or an observe. Under gunicorn, gunicorn.conf.py points
+PROMETHEUS_MULTIPROC_DIR at a shared directory before any worker starts.
+Every worker then writes its samples to mmap'd files there, and /metrics
+(served by whichever worker gets the scrape) merges them, so counters and
+histograms cover the whole pool. Without that variable (flask run, the
+CLIs) the usual in-process registry is used.
+
+    garmentz_stage_seconds{stage}               per-stage latency of the analysis pipeline
+    garmentz_request_seconds{endpoint,method,status}
+    garmentz_bytes_total{kind}                  upload bytes in, blob bytes out
+    garmentz_cache_lookups_total{cache,result}  hit / miss per cache
+    garmentz_model_loaded{model,backend}        1 when the worker loaded the model
+    garmentz_outbound_seconds{host,outcome}     outbound HTTP calls via http_client
+    garmentz_notifications{status}              eBay notification queue rows, read at scrape time
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram(
+    'garmentz_stage_seconds', 'Latency of each stage of the analysis pipeline',
+    ['stage'], buckets=LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    'garmentz_request_seconds', 'HTTP request latency',
+    ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS,
+)
+BYTES = Counter('garmentz_bytes_total', 'Payload bytes handled', ['kind'])
+CACHE_LOOKUPS = Counter('garmentz_cache_lookups_total', 'Cache lookups by outcome', ['cache', 'result'])
+MODEL_LOADED = Gauge(
+    'garmentz_model_loaded', 'Whether this worker has the model loaded',
+    ['model', 'backend'], multiprocess_mode='liveall',
+)
+OUTBOUND_SECONDS = Histogram(
+    'garmentz_outbound_seconds', 'Outbound HTTP call latency',
+    ['host', 'outcome'], buckets=LATENCY_BUCKETS,
+)
+
+_scrape_collectors = []
+
+
+class NotificationQueueCollector:
+    """
+    Row counts per status from NotificationQueue.stats(). The queue is a
+    shared SQLite file, so whichever worker serves the scrape reads it.
+    """
+    STATUSES = ('pending', 'processing', 'done', 'failed')
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def collect(self):
+        stats = self.stats()
+        family = GaugeMetricFamily('garmentz_notifications', 'eBay notification queue rows by status',
+                                   labels=['status'])
+        for status in self.STATUSES:
+            family.add_metric([status], stats.get(status, 0))
+        yield family
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block into garmentz_stage_seconds{stage=name}.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+def count_bytes(kind, size):
+    BYTES.labels(kind).inc(size)
+
+
+def cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def set_model_loaded(model, backend, loaded):
+    MODEL_LOADED.labels(model, backend).set(1 if loaded else 0)
+
+
+def outbound_call(host, seconds, status):
+    if status is None:
+        outcome = 'error'
+    else:
+        outcome = f"{status // 100}xx"
+    OUTBOUND_SECONDS.labels(host, outcome).observe(seconds)
+
+
+def observe_request(endpoint, method, status, seconds):
+    REQUEST_SECONDS.labels(endpoint, method, str(status)).observe(seconds)
+
+
+def collect_on_scrape(collector):
+    """
+    Add a collector evaluated on each scrape, for values read from shared
+    state rather than recorded per process.
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        _scrape_collectors.append(collector)
+    else:
+        from prometheus_client import REGISTRY
+        REGISTRY.register(collector)
+
+
+def render():
+    """
+    (body, content type) for a scrape, merged across workers when running
+    in multiprocess mode.
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in _scrape_collectors:
+            registry.register(collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    from prometheus_client import REGISTRY
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """
+    Called from gunicorn's child_exit hook so a dead worker's live gauges
+    are dropped (its counters and histograms are kept).
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
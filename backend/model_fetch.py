@@ -0,0 +1,158 @@
+"""
+Download model artifacts safely at startup.
+
+- Only one process per host downloads: workers take an exclusive flock on
+  <models_dir>/.fetch.lock, and those that wait simply find the files
+  already in place once they get the lock.
+- Missing artifacts are streamed concurrently to temp files in models_dir,
+  hashed while they are written, fsynced and then os.replace()d into place,
+  so a killed worker can never leave a truncated model behind.
+- If a manifest ({"wear_tear_model.h5": "<sha256>", ...}) is given, both
+  fresh downloads and files already on disk are checked against it. A file
+  that does not match is moved aside to <name>.quarantined and downloaded
+  again, so it is never served even if that download fails.
+
+The serving app, the exporters and the offline tools all read and write
+models under MODELS_DIR (relative to the repository root).
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import http_client
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+MODELS_DIR = "models"
+
+
+class ModelFetchError(Exception):
+    pass
+
+
+def load_manifest(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def tflite_filename(h5_name, variant):
+    """
+    Where backend/export_tflite.py puts the `variant` ("float16", "int8")
+    export of a Keras model file, and where the app looks for it.
+    """
+    return f"{os.path.splitext(h5_name)[0]}_{variant}.tflite"
+
+
+def update_manifest(path, files):
+    """
+    Record the sha256 of each file in `files` in the manifest at `path`,
+    keeping its other entries.
+    """
+    manifest = load_manifest(path)
+    for file_path in files:
+        manifest[os.path.basename(file_path)] = file_sha256(file_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _is_valid(path, expected):
+    if not os.path.exists(path):
+        return False
+    if expected and file_sha256(path) != expected.lower():
+        logger.warning(f"{path} does not match its manifest checksum; quarantining it and fetching it again")
+        os.replace(path, f"{path}.quarantined")
+        return False
+    return True
+
+
+def _download(url, path, expected, timeout):
+    if not url:
+        raise ModelFetchError(f"No download URL configured for {os.path.basename(path)}")
+
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=".fetch-", dir=directory)
+    try:
+        h = hashlib.sha256()
+        with os.fdopen(fd, "wb") as f, http_client.get(url, stream=True, timeout=timeout) as resp:
+            resp.raise_for_status()
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+                h.update(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        digest = h.hexdigest()
+        if expected and digest != expected.lower():
+            raise ModelFetchError(f"Checksum mismatch for {os.path.basename(path)}: got {digest}")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def fetch_models(artifacts, models_dir, manifest=None, timeout=60, lock_timeout=900):
+    """
+    Make sure every file in `artifacts` ({filename: url}) exists and is
+    valid under `models_dir`. Returns {filename: error message} for those
+    that could not be fetched; an empty dict means everything is in place.
+    """
+    manifest = manifest or {}
+    os.makedirs(models_dir, exist_ok=True)
+
+    with open(os.path.join(models_dir, ".fetch.lock"), "w") as lock_file:
+        deadline = time.monotonic() + lock_timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    return {name: "Timed out waiting for another process to fetch models" for name in artifacts}
+                time.sleep(0.5)
+
+        try:
+            # Leftovers from a process that died mid-download
+            for entry in os.scandir(models_dir):
+                if entry.name.startswith(".fetch-"):
+                    os.remove(entry.path)
+
+            missing = {
+                name: url for name, url in artifacts.items()
+                if not _is_valid(os.path.join(models_dir, name), manifest.get(name))
+            }
+            if not missing:
+                return {}
+
+            logger.info(f"Downloading models: {', '.join(sorted(missing))}")
+            errors = {}
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                futures = {
+                    name: executor.submit(_download, url, os.path.join(models_dir, name), manifest.get(name), timeout)
+                    for name, url in missing.items()
+                }
+                for name, future in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        errors[name] = str(e)
+            return errors
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
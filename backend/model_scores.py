@@ -0,0 +1,15 @@
+"""
+The API's scores from a wear or depreciation model: the first output of
+each row, clamped to [0, 1] and rounded to 3 places. The API, the inventory
+valuation CLI and the near-duplicate index builder all store these values,
+so they must agree exactly.
+"""
+
+
+def predict_scores(model, batch):
+    """
+    One score per image in `batch` (anything with predict(arr, verbose=0)).
+    """
+    pred = model.predict(batch, verbose=0)
+    vals = pred[:, 0] if pred.ndim > 1 else pred
+    return [round(max(0, min(1, float(val))), 3) for val in vals]
@@ -0,0 +1,239 @@
+"""
+Durable queue for incoming eBay notifications.
+
+/ebay-notify only appends the raw body to a SQLite table (WAL mode) and
+returns; a background consumer claims pending rows in batches and hands
+them to a handler. The notification ID is a unique key, so redeliveries of
+an event that is queued or already processed are dropped at insert time.
+
+Every gunicorn worker runs a consumer against the same file. Rows are
+claimed in a write transaction with a lease, so each batch goes to one
+consumer, and a batch claimed by a worker that died is picked up again
+once its lease runs out. A failing batch is retried with exponential
+backoff (retry_backoff seconds, doubling per attempt up to
+max_retry_backoff), and a row that has used max_attempts, whether its batch
+raised or its lease expired, is marked failed. Processed rows are kept for
+`retention` seconds so late redeliveries are still recognised.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def notification_id(payload, raw):
+    """
+    eBay's notificationId, or a hash of the body when it is missing.
+    """
+    notification = payload.get('notification') if isinstance(payload, dict) else None
+    if isinstance(notification, dict) and notification.get('notificationId'):
+        return str(notification['notificationId'])
+    return 'sha256:' + hashlib.sha256(raw).hexdigest()
+
+
+class NotificationQueue:
+    def __init__(self, db_path, handler, batch_size=100, poll_interval=1.0, lease=60,
+                 max_attempts=5, retry_backoff=5.0, max_retry_backoff=600.0, retention=7 * 24 * 3600,
+                 synchronous='NORMAL'):
+        self.db_path = db_path
+        self.handler = handler
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.retention = retention
+        self.synchronous = synchronous
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread_pid = None
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.enqueued = 0
+        self.duplicates = 0
+        self.processed = 0
+
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS notifications ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " notification_id TEXT NOT NULL UNIQUE,"
+                " topic TEXT,"
+                " payload TEXT NOT NULL,"
+                " received REAL NOT NULL,"
+                " status TEXT NOT NULL DEFAULT 'pending',"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " claimed_until REAL,"
+                " available_at REAL,"
+                " finished REAL,"
+                " error TEXT)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(notifications)")}
+            if 'available_at' not in columns:
+                # Queues created before retries were delayed
+                conn.execute("ALTER TABLE notifications ADD COLUMN available_at REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS notifications_status ON notifications (status, seq)")
+
+    def _conn(self):
+        # sqlite3 connections are not shareable across threads (or forks)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, raw):
+        """
+        Append one notification body (bytes). Returns (notification_id, True)
+        if it was queued or (notification_id, False) for a redelivery.
+        Raises ValueError if the body is not JSON.
+        """
+        payload = json.loads(raw)
+        nid = notification_id(payload, raw)
+        metadata = payload.get('metadata') if isinstance(payload, dict) else None
+        topic = metadata.get('topic') if isinstance(metadata, dict) else None
+        cursor = self._conn().execute(
+            "INSERT OR IGNORE INTO notifications (notification_id, topic, payload, received) VALUES (?, ?, ?, ?)",
+            (nid, topic, raw.decode('utf-8'), time.time()),
+        )
+        added = cursor.rowcount == 1
+        with self._lock:
+            if added:
+                self.enqueued += 1
+            else:
+                self.duplicates += 1
+        if added:
+            self._ensure_consumer()
+            self._wakeup.set()
+        return nid, added
+
+    def _claim(self):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # A lease that ran out counts as a failed attempt: don't hand the
+            # row out again once it has had max_attempts
+            expired = conn.execute(
+                "UPDATE notifications SET status = 'failed', claimed_until = NULL,"
+                " error = 'lease expired on the last attempt'"
+                " WHERE status = 'processing' AND claimed_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            ).rowcount
+            rows = conn.execute(
+                "SELECT seq, notification_id, topic, payload, attempts FROM notifications"
+                " WHERE (status = 'pending' AND (available_at IS NULL OR available_at <= ?))"
+                " OR (status = 'processing' AND claimed_until < ?)"
+                " ORDER BY seq LIMIT ?",
+                (now, now, self.batch_size),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE notifications SET status = 'processing', claimed_until = ?, attempts = attempts + 1"
+                    " WHERE seq = ?",
+                    [(now + self.lease, row[0]) for row in rows],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if expired:
+            logger.warning(f"{expired} eBay notifications failed: lease expired after {self.max_attempts} attempts")
+        return rows
+
+    def _retry_delay(self, attempts):
+        return min(self.max_retry_backoff, self.retry_backoff * 2 ** max(0, attempts - 1))
+
+    def process_batch(self):
+        """
+        Claim and handle one batch. Returns the number of notifications claimed.
+        """
+        rows = self._claim()
+        if not rows:
+            return 0
+        events = []
+        for seq, nid, topic, payload, _ in rows:
+            events.append({'notification_id': nid, 'topic': topic or '', 'payload': json.loads(payload)})
+
+        conn = self._conn()
+        try:
+            self.handler(events)
+        except Exception as e:
+            logger.exception(f"eBay notification batch of {len(rows)} failed")
+            now = time.time()
+            # attempts in the row tuples is the count before this claim
+            conn.executemany(
+                "UPDATE notifications SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+                " claimed_until = NULL, available_at = ?, error = ? WHERE seq = ?",
+                [(self.max_attempts, now + self._retry_delay(row[4] + 1), str(e), row[0]) for row in rows],
+            )
+            return len(rows)
+
+        now = time.time()
+        conn.executemany(
+            "UPDATE notifications SET status = 'done', finished = ?, claimed_until = NULL, error = NULL WHERE seq = ?",
+            [(now, row[0]) for row in rows],
+        )
+        with self._lock:
+            self.processed += len(rows)
+        return len(rows)
+
+    def purge(self):
+        """
+        Drop processed rows older than the retention window.
+        """
+        self._conn().execute(
+            "DELETE FROM notifications WHERE status = 'done' AND finished < ?",
+            (time.time() - self.retention,),
+        )
+
+    def _ensure_consumer(self):
+        # Started lazily so each forked gunicorn worker gets its own thread
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._consume_loop, name="ebay-notifications", daemon=True).start()
+
+    def start(self):
+        self._ensure_consumer()
+
+    def _consume_loop(self):
+        last_purge = 0.0
+        while True:
+            self._wakeup.clear()
+            try:
+                if self.process_batch() == self.batch_size:
+                    continue  # more waiting, don't sleep
+                if time.time() - last_purge > 3600:
+                    self.purge()
+                    last_purge = time.time()
+            except sqlite3.Error as e:
+                logger.warning(f"eBay notification queue error: {e}")
+            self._wakeup.wait(self.poll_interval)
+
+    def stats(self):
+        counts = dict(self._conn().execute("SELECT status, COUNT(*) FROM notifications GROUP BY status").fetchall())
+        with self._lock:
+            return {
+                'pending': counts.get('pending', 0),
+                'processing': counts.get('processing', 0),
+                'done': counts.get('done', 0),
+                'failed': counts.get('failed', 0),
+                'enqueued': self.enqueued,
+                'duplicates': self.duplicates,
+                'processed': self.processed,
+            }
@@ -0,0 +1,412 @@
+"""
+Perceptual-hash index of analysed uploads, for reusing results across
+near-duplicate photos (re-encoded, resized or slightly cropped copies).
+
+Hashes are computed in NumPy from the 224x224 tensor the models already
+get, so they cost no extra decode:
+
+- phash: 32x32 grey block means -> 2-D DCT -> the 8x8 lowest frequencies
+  compared with their median (robust to re-encoding, resizing, small crops)
+- dhash: 9x8 grey block means -> sign of each horizontal gradient
+
+Codes are 64-bit. Lookups use multi-index hashing: each code is split into
+four 16-bit substrings, and any code within Hamming distance r of the query
+matches it in at least one substring to within r // 4 bits. Each substring
+table is a CSR array over all 65536 values, so a lookup probes a few dozen
+buckets and checks only their entries, with no scan. Entries added since the
+tables were built go into small per-substring dicts as they arrive and are
+probed the same way. Once TAIL_REBUILD of them pile up, the CSR tables are
+rebuilt on a background thread and swapped in, so neither lookups nor adds
+wait for a rebuild.
+
+Entries live in SQLite and are tagged with the model version; other workers'
+entries are picked up within refresh_interval seconds. Only codes and row ids are held
+in memory (about 32 bytes per entry). Payloads are read on a hit.
+
+Bulk-build from the catalog, scoring each image with the served models:
+
+    python -m backend.phash_index build backend/static --db phash.db
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+
+import numpy as np
+
+from backend.model_scores import predict_scores
+from backend.preprocess import IMAGE_SIZE, list_images, load_exact, load_fast
+
+SUBSTRINGS = 4
+SUBSTRING_BITS = 64 // SUBSTRINGS
+# Rebuild the CSR substring tables (in the background) once this many entries
+# were added since the last build; until then they are found through the dicts
+TAIL_REBUILD = 50000
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+_GREY = np.array([0.299, 0.587, 0.114])
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def _grey(arr):
+    arr = np.asarray(arr)
+    if arr.ndim == 4:
+        arr = arr[0]
+    return arr @ _GREY if arr.ndim == 3 else arr.astype(np.float64)
+
+
+def _block_means(grey, rows, cols):
+    h, w = grey.shape
+    row_edges = (np.arange(rows) * h) // rows
+    col_edges = (np.arange(cols) * w) // cols
+    sums = np.add.reduceat(np.add.reduceat(grey, row_edges, axis=0), col_edges, axis=1)
+    counts = np.outer(np.diff(np.append(row_edges, h)), np.diff(np.append(col_edges, w)))
+    return sums / counts
+
+
+def _pack(bits):
+    return int.from_bytes(np.packbits(bits.reshape(-1)).tobytes(), 'big')
+
+
+def phash(arr):
+    """
+    64-bit DCT hash of an HxWx3 (or 1xHxWx3) image array.
+    """
+    small = _block_means(_grey(arr), 32, 32)
+    low = (_DCT32 @ small @ _DCT32.T)[:8, :8]
+    return _pack(low > np.median(low.reshape(-1)[1:]))
+
+
+def dhash(arr):
+    """
+    64-bit gradient hash of an HxWx3 (or 1xHxWx3) image array.
+    """
+    small = _block_means(_grey(arr), 8, 9)
+    return _pack(small[:, 1:] > small[:, :-1])
+
+
+HASHES = {'phash': phash, 'dhash': dhash}
+
+
+def hamming(codes, code):
+    """
+    Hamming distances between a uint64 array and one code.
+    """
+    x = np.bitwise_xor(codes, np.uint64(code))
+    return _POPCOUNT[x.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _to_db(code):
+    # SQLite integers are signed 64-bit
+    return code - (1 << 64) if code >= 1 << 63 else code
+
+
+def _flip_masks(radius):
+    masks = [0]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(SUBSTRING_BITS), r):
+            masks.append(sum(1 << b for b in bits))
+    return np.array(masks, dtype=np.int64)
+
+
+def _substrings(codes, t):
+    return ((codes >> np.uint64(t * SUBSTRING_BITS)) & np.uint64(0xFFFF)).astype(np.int64)
+
+
+def _build_tables(codes):
+    """
+    (orders, offsets) CSR substring tables over `codes`. Table t lives at
+    [t * size, (t + 1) * size) of one flat order array, and its bucket
+    offsets already include that base.
+    """
+    size = len(codes)
+    orders = np.empty(SUBSTRINGS * size, dtype=np.int32)
+    offsets = np.empty((SUBSTRINGS, (1 << SUBSTRING_BITS) + 1), dtype=np.int64)
+    for t in range(SUBSTRINGS):
+        sub = _substrings(codes, t)
+        order = np.argsort(sub, kind='stable')
+        orders[t * size:(t + 1) * size] = order
+        offsets[t] = np.searchsorted(sub[order], np.arange((1 << SUBSTRING_BITS) + 1)) + t * size
+    return orders, offsets
+
+
+class NearDuplicateIndex:
+    def __init__(self, db_path, model_version, max_distance=6, kind='phash', refresh_interval=1.0):
+        if kind not in HASHES:
+            raise ValueError(f"Unknown perceptual hash {kind!r}")
+        self.db_path = db_path
+        self.model_version = model_version
+        self.max_distance = max_distance
+        self.kind = kind
+        self.refresh_interval = refresh_interval
+        self.hash = HASHES[kind]
+        self._masks = _flip_masks(max_distance // SUBSTRINGS)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._codes = np.empty(1024, dtype=np.uint64)
+        self._rowids = np.empty(1024, dtype=np.int64)
+        self._size = 0
+        self._last_rowid = 0
+        self._tables = None
+        self._indexed = 0
+        # Positions added since the CSR build, per substring table: value -> [position]
+        self._recent = [{} for _ in range(SUBSTRINGS)]
+        self._rebuilding = False
+        self._refreshed_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS phashes ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " code INTEGER NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " digest TEXT NOT NULL UNIQUE,"
+                " model_version TEXT NOT NULL,"
+                " payload TEXT NOT NULL)"
+            )
+            conn.execute("DELETE FROM phashes WHERE model_version != ? OR kind != ?", (self.model_version, self.kind))
+        self.refresh()
+
+    def _conn(self):
+        # sqlite3 connections are not shareable across threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _append(self, rows):
+        needed = self._size + len(rows)
+        if needed > len(self._codes):
+            capacity = max(needed, 2 * len(self._codes))
+            self._codes = np.resize(self._codes, capacity)
+            self._rowids = np.resize(self._rowids, capacity)
+        rowids = np.array([row[0] for row in rows], dtype=np.int64)
+        codes = np.array([row[1] for row in rows], dtype=np.int64).view(np.uint64)
+        start = self._size
+        self._rowids[start:needed] = rowids
+        self._codes[start:needed] = codes
+        self._size = needed
+        self._last_rowid = int(rowids[-1])
+        if self._tables is not None:
+            self._index_recent(start, needed)
+
+    def _index_recent(self, start, end):
+        codes = self._codes[start:end]
+        for t, recent in enumerate(self._recent):
+            for position, sub in enumerate(_substrings(codes, t).tolist(), start):
+                bucket = recent.get(sub)
+                if bucket is None:
+                    recent[sub] = [position]
+                else:
+                    bucket.append(position)
+
+    def _rebuild(self):
+        # Runs on its own thread. _append never rewrites positions below
+        # _size (growing allocates a new array), so the prefix view is stable.
+        try:
+            with self._lock:
+                size = self._size
+                codes = self._codes[:size]
+            tables = _build_tables(codes)
+            with self._lock:
+                self._tables = tables
+                self._indexed = size
+                self._recent = [{} for _ in range(SUBSTRINGS)]
+                self._index_recent(size, self._size)
+        finally:
+            self._rebuilding = False
+
+    def refresh(self, force=True):
+        """
+        Load entries added since the last refresh (by any process). With
+        force=False nothing is read if the last refresh is under
+        refresh_interval seconds old.
+        """
+        now = time.monotonic()
+        if not force and now - self._refreshed_at < self.refresh_interval:
+            return
+        self._refreshed_at = now
+        rows = self._conn().execute(
+            "SELECT id, code FROM phashes WHERE id > ? AND model_version = ? AND kind = ? ORDER BY id",
+            (self._last_rowid, self.model_version, self.kind),
+        ).fetchall()
+        with self._lock:
+            rows = [row for row in rows if row[0] > self._last_rowid]
+            if rows:
+                self._append(rows)
+            if self._tables is None:
+                self._tables = _build_tables(self._codes[:self._size])
+                self._indexed = self._size
+            elif self._size - self._indexed > TAIL_REBUILD and not self._rebuilding:
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild, name="phash-rebuild", daemon=True).start()
+
+    def _candidates(self, code):
+        orders, offsets = self._tables
+        subs = np.array([(code >> (t * SUBSTRING_BITS)) & 0xFFFF for t in range(SUBSTRINGS)], dtype=np.int64)
+        probes = (subs[:, None] ^ self._masks[None, :])
+        tables = np.arange(SUBSTRINGS)[:, None]
+        starts = offsets[tables, probes].reshape(-1)
+        lengths = offsets[tables, probes + 1].reshape(-1) - starts
+        # Concatenate every probed bucket's range in one go; duplicates are harmless
+        ends = np.cumsum(lengths)
+        slots = np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+        positions = orders[slots]
+        if self._indexed < self._size:
+            recent = [position
+                      for table, table_probes in zip(self._recent, probes.tolist())
+                      for probe in table_probes
+                      for position in table.get(probe, ())]
+            if recent:
+                positions = np.concatenate([positions, np.array(recent, dtype=np.int32)])
+        return positions
+
+    def nearest(self, code):
+        """
+        (rowid, distance) of the closest entry within max_distance, or None.
+        """
+        with self._lock:
+            positions = self._candidates(code)
+            if not len(positions):
+                return None
+            distances = hamming(self._codes[positions], code)
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                return None
+            return int(self._rowids[positions[best]]), int(distances[best])
+
+    def find(self, code):
+        """
+        Closest indexed upload within max_distance as {'digest', 'distance',
+        'result'}, or None.
+        """
+        self.refresh(force=False)
+        match = self.nearest(code)
+        if match is None:
+            self.misses += 1
+            return None
+        rowid, distance = match
+        row = self._conn().execute("SELECT digest, payload FROM phashes WHERE id = ?", (rowid,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {'digest': row[0], 'distance': distance, 'result': json.loads(row[1])}
+
+    def add_many(self, entries):
+        """
+        Store (code, digest, result) entries. Digests already indexed are kept as they are.
+        """
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO phashes (code, kind, digest, model_version, payload) VALUES (?, ?, ?, ?, ?)",
+                [(_to_db(code), self.kind, digest, self.model_version, json.dumps(result))
+                 for code, digest, result in entries],
+            )
+        self.refresh()
+
+    def add(self, code, digest, result):
+        self.add_many([(code, digest, result)])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': self._size,
+            'unindexed': self._size - self._indexed,
+            'rebuilding': self._rebuilding,
+            'max_distance': self.max_distance,
+            'kind': self.kind,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def build_from_dir(index, image_dir, wear_model, depreciation_model, batch_size=64, workers=None, mode='exact'):
+    """
+    Hash and score every image in `image_dir`. Entries are keyed by the
+    file's SHA-256 and carry the wear and depreciation scores (no blob URL),
+    so a near-duplicate upload skips both models but is still stored.
+    """
+    import hashlib
+
+    loader = load_fast if mode == 'fast' else load_exact
+
+    def prepare(path):
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        return digest, loader(path, IMAGE_SIZE)
+
+    paths = list_images(image_dir)
+    added = 0
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(paths), batch_size):
+            batch_paths = paths[start:start + batch_size]
+            prepared = list(executor.map(prepare, batch_paths))
+            batch = np.stack([arr for _, arr in prepared])
+            wear_scores = predict_scores(wear_model, batch)
+            dep_scores = predict_scores(depreciation_model, batch)
+            index.add_many([
+                (index.hash(arr), digest, {
+                    'wear_level_score': wear,
+                    'depreciation_score': dep,
+                    'azure_blob_url': None,
+                    'image': os.path.basename(path),
+                })
+                for path, (digest, arr), wear, dep in zip(batch_paths, prepared, wear_scores, dep_scores)
+            ])
+            added += len(batch_paths)
+            print(f"{added}/{len(paths)} images, {added / (time.perf_counter() - start_time):.1f} images/sec", flush=True)
+    return added
+
+
+def main():
+    from backend.result_cache import model_version
+    from backend.model_fetch import MODELS_DIR
+    from backend.valuate_inventory import load_scoring_model
+
+    parser = argparse.ArgumentParser(description="Bulk-build the perceptual-hash near-duplicate index.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help="Hash and score every image in a directory")
+    build_parser.add_argument('image_dir')
+    build_parser.add_argument('--db', default=os.getenv("PHASH_INDEX_DB", "phash.db"))
+    build_parser.add_argument('--kind', choices=sorted(HASHES), default=os.getenv("PHASH_KIND", "phash"))
+    build_parser.add_argument('--wear-model', default=os.path.join(MODELS_DIR, "wear_tear_model.h5"))
+    build_parser.add_argument('--depreciation-model', default=os.path.join(MODELS_DIR, "depreciation_model.h5"))
+    build_parser.add_argument('--preprocess', choices=['exact', 'fast'], default=os.getenv("PREPROCESS_MODE", "exact").lower())
+    build_parser.add_argument('--model-version', default=os.getenv("MODEL_VERSION"),
+                              help="Defaults to the hash the API computes for these models")
+    build_parser.add_argument('--batch-size', type=int, default=64)
+    build_parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    version = args.model_version or model_version(args.preprocess, (args.wear_model, args.depreciation_model))
+    index = NearDuplicateIndex(args.db, version, kind=args.kind)
+    added = build_from_dir(index, args.image_dir, load_scoring_model(args.wear_model),
+                           load_scoring_model(args.depreciation_model), args.batch_size, args.workers, args.preprocess)
+    print(f"Hashed {added} images; index holds {index.stats()['entries']} entries for model version {version}")
+
+
+if __name__ == '__main__':
+    main()
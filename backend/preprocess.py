@@ -0,0 +1,157 @@
+"""
+Image preprocessing for the wear and depreciation models.
+
+Two decode paths are provided:
+
+- load_exact: full decode, LANCZOS resize, float64. This is what the API
+  has always used and what the models were validated against.
+- load_fast: lets libjpeg downscale in the DCT domain (PIL draft mode) so
+  a 12 MP photo is decoded at roughly 1/8 size, then does a cheap bilinear
+  resize straight into float32.
+
+decode_exact / decode_fast stop before scaling to [0, 1] and return uint8
+pixels, an eighth the size of float64, for handing images between
+processes; normalize() then gives exactly what the load_* function would.
+
+Run this module to measure how far the fast path drifts from the exact one:
+
+    python -m backend.preprocess backend/static --limit 200
+    python -m backend.preprocess backend/static --model models/wear_tear_model.h5
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = (224, 224)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+
+
+def decode_exact(source, size=IMAGE_SIZE):
+    """
+    Full-resolution decode and LANCZOS resize. Returns an HxWx3 uint8 array.
+    """
+    with Image.open(source) as img:
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img = img.resize(size, Image.Resampling.LANCZOS)
+        return np.asarray(img, dtype=np.uint8)
+
+
+def decode_fast(source, size=IMAGE_SIZE):
+    """
+    Reduced-resolution decode. For JPEGs, draft() picks the largest DCT
+    scale (1/2, 1/4, 1/8) that still leaves the image at least `size`, so
+    the full-resolution bitmap is never materialised. Other formats fall
+    through to a normal decode. Returns an HxWx3 uint8 array.
+    """
+    with Image.open(source) as img:
+        img.draft('RGB', size)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img = img.resize(size, Image.Resampling.BILINEAR)
+        return np.asarray(img, dtype=np.uint8)
+
+
+def normalize(pixels, mode='exact'):
+    """
+    Scale uint8 pixels (one image or a stacked batch) to [0, 1]: float64
+    for the exact path, float32 for the fast one.
+    """
+    if mode == 'fast':
+        arr = np.asarray(pixels, dtype=np.float32)
+        arr *= 1.0 / 255.0
+        return arr
+    return np.asarray(pixels) / 255.0
+
+
+def load_exact(source, size=IMAGE_SIZE):
+    """
+    decode_exact scaled to an HxWx3 float64 array in [0, 1].
+    """
+    return normalize(decode_exact(source, size), 'exact')
+
+
+def load_fast(source, size=IMAGE_SIZE):
+    """
+    decode_fast scaled to an HxWx3 float32 array in [0, 1].
+    """
+    return normalize(decode_fast(source, size), 'fast')
+
+
+def list_images(image_dir):
+    return sorted(
+        os.path.join(image_dir, name)
+        for name in os.listdir(image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def check_parity(paths, size=IMAGE_SIZE, model=None):
+    """
+    Compare load_fast against load_exact over `paths`.
+
+    Returns a dict with pixel-level drift (max and mean absolute difference
+    on the [0, 1] scale), time spent in each decoder, and, if a Keras model
+    is given, the absolute difference in its clamped output score.
+    """
+    pixel_max = []
+    pixel_mean = []
+    score_diff = []
+    exact_time = 0.0
+    fast_time = 0.0
+
+    for path in paths:
+        start = time.perf_counter()
+        exact = load_exact(path, size)
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast = load_fast(path, size)
+        fast_time += time.perf_counter() - start
+
+        diff = np.abs(exact - fast)
+        pixel_max.append(float(diff.max()))
+        pixel_mean.append(float(diff.mean()))
+
+        if model is not None:
+            batch = np.stack([exact, fast])
+            preds = np.clip(model.predict(batch, verbose=0).reshape(2, -1)[:, 0], 0, 1)
+            score_diff.append(float(abs(preds[0] - preds[1])))
+
+    count = len(paths)
+    result = {
+        'images': count,
+        'pixel_max_abs_diff': max(pixel_max) if count else 0.0,
+        'pixel_mean_abs_diff': float(np.mean(pixel_mean)) if count else 0.0,
+        'exact_ms_per_image': 1000 * exact_time / count if count else 0.0,
+        'fast_ms_per_image': 1000 * fast_time / count if count else 0.0,
+    }
+    if model is not None:
+        result['score_max_abs_diff'] = max(score_diff) if count else 0.0
+        result['score_mean_abs_diff'] = float(np.mean(score_diff)) if count else 0.0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fast and exact image preprocessing.")
+    parser.add_argument('image_dir')
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--model', default=None, help="Optional .h5 model to measure score drift")
+    args = parser.parse_args()
+
+    paths = list_images(args.image_dir)[:args.limit]
+    model = None
+    if args.model:
+        from keras.models import load_model
+        model = load_model(args.model)
+
+    result = check_parity(paths, model=model)
+    for key, value in result.items():
+        print(f"{key}: {value:.6f}" if isinstance(value, float) else f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
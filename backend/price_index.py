@@ -0,0 +1,407 @@
+"""
+Local index of comparable sales, used by EbayService for price estimates.
+
+Sales are keyed by (clothing_type, fabric_type, condition). Each key keeps a
+quantile sketch with logarithmic buckets (relative error `relative_accuracy`,
+at most `max_buckets` buckets), plus exact count, sum, min and max. A
+sketch's size does not depend on how many sales went into it, and summaries
+are cached until the next sale lands in that key, so estimates never scan
+sales history or call eBay.
+
+Every sale also feeds the wider keys (clothing_type, *, condition) and
+(*, *, condition), which estimates fall back to when a narrow key has too
+few sales.
+
+State lives in a SQLite file (PRICE_INDEX_DB). New sales are appended to a
+`sales` log; compaction folds the log into the stored sketches and deletes
+it, so the file stays bounded however long the history grows. Run it
+nightly, and import sales CSVs the same way:
+
+    python -m backend.price_index import sales.csv
+    python -m backend.price_index compact
+
+Serving processes pick up sales and compactions from other processes every
+`refresh_interval` seconds.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+ANY = '*'
+QUANTILES = {'p10': 0.10, 'p25': 0.25, 'p50': 0.50, 'p75': 0.75, 'p90': 0.90}
+# dataset.csv wear categories -> the condition names used by the services
+WEAR_CATEGORY_CONDITIONS = {
+    'heavily': 'heavily worn',
+    'lightly': 'lightly worn',
+    'new': 'not worn',
+}
+
+
+class QuantileSketch:
+    """
+    Mergeable sketch with logarithmically sized buckets: any quantile is
+    returned within `relative_accuracy` of a value actually observed.
+    When more than `max_buckets` buckets exist the lowest ones are merged,
+    which only affects the bottom of the distribution.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=512):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._summary = None
+
+    def add(self, value, weight=1):
+        if not (math.isfinite(value) and value > 0):
+            raise ValueError(f"Sketch values must be finite and positive, got {value}")
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + weight
+        self.count += weight
+        self.total += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self._summary = None
+        if len(self.buckets) > self.max_buckets:
+            self.collapse()
+
+    def merge(self, other):
+        for index, weight in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + weight
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._summary = None
+        if len(self.buckets) > self.max_buckets:
+            self.collapse()
+
+    def collapse(self):
+        indexes = sorted(self.buckets)
+        excess = indexes[:len(indexes) - self.max_buckets + 1]
+        merged = sum(self.buckets.pop(index) for index in excess)
+        self.buckets[excess[-1]] = merged
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        if self._summary is None:
+            summary = {
+                'min': round(self.min, 2),
+                'avg': round(self.total / self.count, 2),
+                'max': round(self.max, 2),
+                'count': self.count,
+            }
+            summary.update({name: round(self.quantile(q), 2) for name, q in QUANTILES.items()})
+            self._summary = summary
+        return self._summary
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_buckets': self.max_buckets,
+            'buckets': [[index, weight] for index, weight in self.buckets.items()],
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'], data['max_buckets'])
+        sketch.buckets = {int(index): weight for index, weight in data['buckets']}
+        sketch.count = data['count']
+        sketch.total = data['total']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        return sketch
+
+
+def _norm(value):
+    return str(value).strip().lower() if value is not None and str(value).strip() else ANY
+
+
+def _valid_price(price):
+    return math.isfinite(price) and price > 0
+
+
+def index_keys(clothing_type, fabric_type, condition):
+    """
+    The exact key for a sale plus the wider keys it also counts towards,
+    narrowest first.
+    """
+    clothing_type, fabric_type, condition = _norm(clothing_type), _norm(fabric_type), _norm(condition)
+    keys = [(clothing_type, fabric_type, condition), (clothing_type, ANY, condition), (ANY, ANY, condition)]
+    return list(dict.fromkeys(keys))
+
+
+def _key_str(key):
+    return '|'.join(key)
+
+
+class PriceIndex:
+    def __init__(self, db_path, relative_accuracy=0.01, max_buckets=512, min_sales=5, refresh_interval=60):
+        self.db_path = db_path
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.min_sales = min_sales
+        self.refresh_interval = refresh_interval
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sketches = {}
+        self._generation = None
+        self._last_seq = 0
+        self._refreshed_at = 0.0
+
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sales ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " clothing_type TEXT NOT NULL,"
+                " fabric_type TEXT NOT NULL,"
+                " condition TEXT NOT NULL,"
+                " price REAL NOT NULL,"
+                " sold_at REAL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS sketches (key TEXT PRIMARY KEY, payload TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', 0), ('through_seq', 0)")
+        self.refresh(force=True)
+
+    def _conn(self):
+        # sqlite3 connections are not shareable across threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _new_sketch(self):
+        return QuantileSketch(self.relative_accuracy, self.max_buckets)
+
+    def _apply(self, sketches, clothing_type, fabric_type, condition, price):
+        if not _valid_price(price):
+            return  # inserted before add_sales rejected non-finite prices
+        for key in index_keys(clothing_type, fabric_type, condition):
+            sketch = sketches.get(key)
+            if sketch is None:
+                sketch = sketches[key] = self._new_sketch()
+            sketch.add(price)
+
+    @staticmethod
+    def _load_sketches(conn):
+        return {
+            tuple(key.split('|')): QuantileSketch.from_dict(json.loads(payload))
+            for key, payload in conn.execute("SELECT key, payload FROM sketches")
+        }
+
+    def refresh(self, force=False):
+        """
+        Catch up with sales appended by other processes. After a compaction
+        (new generation) the stored sketches are reloaded.
+        """
+        if not force and time.time() - self._refreshed_at < self.refresh_interval:
+            return
+        conn = self._conn()
+        with self._lock:
+            # One read transaction, so a concurrent compaction is seen either entirely or not at all
+            conn.execute("BEGIN")
+            try:
+                meta = dict(conn.execute("SELECT name, value FROM meta").fetchall())
+                if meta['generation'] != self._generation:
+                    self._sketches = self._load_sketches(conn)
+                    self._generation = meta['generation']
+                    self._last_seq = meta['through_seq']
+                rows = conn.execute(
+                    "SELECT seq, clothing_type, fabric_type, condition, price FROM sales WHERE seq > ? ORDER BY seq",
+                    (self._last_seq,),
+                ).fetchall()
+            finally:
+                conn.execute("COMMIT")
+            for seq, clothing_type, fabric_type, condition, price in rows:
+                self._apply(self._sketches, clothing_type, fabric_type, condition, price)
+                self._last_seq = seq
+            self._refreshed_at = time.time()
+
+    def add_sales(self, sales):
+        """
+        Record sales, each a (clothing_type, fabric_type, condition, price,
+        sold_at) tuple; sold_at may be None. Missing, non-positive and
+        non-finite prices are skipped. Returns the number recorded.
+        """
+        rows = [
+            (_norm(c), _norm(f), _norm(cond), float(price), sold_at)
+            for c, f, cond, price, sold_at in sales
+            if price is not None and _valid_price(float(price))
+        ]
+        if not rows:
+            return 0
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO sales (clothing_type, fabric_type, condition, price, sold_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        # Picks up our own rows (and anyone else's) in seq order
+        self.refresh(force=True)
+        return len(rows)
+
+    def add_sale(self, clothing_type, fabric_type, condition, price, sold_at=None):
+        return self.add_sales([(clothing_type, fabric_type, condition, price, sold_at)])
+
+    def import_csv(self, path, chunk_size=10000):
+        """
+        Import a sales CSV with clothing_type, fabric_type, price and either
+        condition or a dataset.csv style wear_category column, plus an
+        optional sold_at (epoch seconds). Returns the number imported.
+        """
+        imported = 0
+        chunk = []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                condition = row.get('condition')
+                if not condition and row.get('wear_category'):
+                    category = row['wear_category'].strip().lower()
+                    condition = WEAR_CATEGORY_CONDITIONS.get(category, category)
+                try:
+                    price = float(row['price'])
+                    sold_at = float(row['sold_at']) if row.get('sold_at') else None
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if not _valid_price(price):
+                    continue  # "inf", "nan", "1e400"
+                chunk.append((row.get('clothing_type'), row.get('fabric_type'), condition, price, sold_at))
+                if len(chunk) >= chunk_size:
+                    imported += self.add_sales(chunk)
+                    chunk = []
+        if chunk:
+            imported += self.add_sales(chunk)
+        return imported
+
+    def compact(self):
+        """
+        Fold the sales log into the stored sketches and delete it. Safe to
+        run while servers are appending; rows added meanwhile stay in the log.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            meta = dict(conn.execute("SELECT name, value FROM meta").fetchall())
+            sketches = self._load_sketches(conn)
+            through_seq = meta['through_seq']
+            folded = 0
+            for seq, clothing_type, fabric_type, condition, price in conn.execute(
+                    "SELECT seq, clothing_type, fabric_type, condition, price FROM sales ORDER BY seq"):
+                self._apply(sketches, clothing_type, fabric_type, condition, price)
+                through_seq = seq
+                folded += 1
+            conn.executemany(
+                "INSERT OR REPLACE INTO sketches (key, payload) VALUES (?, ?)",
+                [(_key_str(key), json.dumps(sketch.to_dict())) for key, sketch in sketches.items()],
+            )
+            conn.execute("DELETE FROM sales WHERE seq <= ?", (through_seq,))
+            conn.execute("UPDATE meta SET value = ? WHERE name = 'through_seq'", (through_seq,))
+            conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        # Freed pages are reused by the next day's sales, so the file stops growing
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.refresh(force=True)
+        return {'folded': folded, 'keys': len(sketches)}
+
+    def estimate(self, clothing_type=None, fabric_type=None, condition=None):
+        """
+        Price summary (min, avg, max, p10..p90, count) for the narrowest key
+        with at least min_sales sales, or None if none qualifies.
+        """
+        self.refresh()
+        with self._lock:
+            for key in index_keys(clothing_type, fabric_type, condition):
+                sketch = self._sketches.get(key)
+                if sketch is not None and sketch.count >= self.min_sales:
+                    return dict(sketch.summary(), key=list(key))
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self._sketches),
+                'buckets': sum(len(s.buckets) for s in self._sketches.values()),
+                'generation': self._generation,
+            }
+
+
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def default_index():
+    """
+    The index used by EbayService, or None when PRICE_INDEX_DB is not set.
+    """
+    global _default_index
+    with _default_lock:
+        if _default_index is None and os.getenv("PRICE_INDEX_DB"):
+            _default_index = PriceIndex(
+                os.getenv("PRICE_INDEX_DB"),
+                relative_accuracy=float(os.getenv("PRICE_INDEX_ACCURACY", "0.01")),
+                min_sales=int(os.getenv("PRICE_INDEX_MIN_SALES", "5")),
+                refresh_interval=float(os.getenv("PRICE_INDEX_REFRESH", "60")),
+            )
+        return _default_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the local comparable-sales price index.")
+    parser.add_argument('--db', default=os.getenv("PRICE_INDEX_DB", "price_index.db"))
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help="Import a sales CSV")
+    import_parser.add_argument('csv')
+    commands.add_parser('compact', help="Fold the sales log into the sketches (run nightly)")
+    estimate_parser = commands.add_parser('estimate', help="Print the estimate for one key")
+    estimate_parser.add_argument('condition')
+    estimate_parser.add_argument('--clothing-type')
+    estimate_parser.add_argument('--fabric-type')
+    args = parser.parse_args()
+
+    index = PriceIndex(args.db)
+    if args.command == 'import':
+        start = time.perf_counter()
+        imported = index.import_csv(args.csv)
+        print(f"Imported {imported} sales in {time.perf_counter() - start:.1f}s")
+    elif args.command == 'compact':
+        result = index.compact()
+        print(f"Folded {result['folded']} sales into {result['keys']} sketches")
+    else:
+        print(index.estimate(args.clothing_type, args.fabric_type, args.condition))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 class RecommendationService:
-    def __init__(self):
-        pass
+    def __init__(self, similarity_index=None):
+        # Optional backend.similarity_index.SimilarityIndex for "items like this one"
+        self.similarity_index = similarity_index
 
     def get_recommendations(self, condition: str) -> list:
         """
@@ -21,3 +22,12 @@ class RecommendationService:
             ]
         }
         return recommendations.get(condition.lower(), ['No recommendations available'])
+
+    def get_similar_items(self, embedding, k: int = 10, exclude_ids=()) -> list:
+        """
+        Catalog items most visually similar to an image embedding, best
+        first, each with a cosine 'score'. Empty without a similarity index.
+        """
+        if self.similarity_index is None:
+            return []
+        return self.similarity_index.similar_items(embedding, k, exclude_ids)
@@ -0,0 +1,294 @@
+"""
+Content-addressed cache of /upload-image results.
+
+Keys are the SHA-256 of the uploaded bytes. Entries are tagged with the
+model version they were computed under; anything from another version is
+ignored and purged, so swapping a model invalidates the cache.
+
+Two tiers:
+- an in-process LRU (OrderedDict) bounded by max_entries
+- an optional SQLite file shared by every gunicorn worker on the box,
+  bounded by disk_max_entries (least recently used rows are trimmed every
+  trim_interval seconds, not on every write)
+
+get_or_compute also collapses concurrent requests for the same key. Within
+a worker one thread computes and the others wait on its Future. Across
+workers (sync gunicorn workers never share a process) the computing worker
+holds a row in the SQLite file's inflight table; the others poll for its
+result until the claim is released or runs out after claim_timeout
+seconds, then compute themselves. Without the SQLite tier only the
+in-process collapsing applies.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+def model_version(preprocess_mode, model_paths):
+    """
+    Short hash of the preprocessing mode and model files that produce a
+    score. Missing models hash as "missing".
+    """
+    h = hashlib.sha256(preprocess_mode.encode('utf-8'))
+    for path in model_paths:
+        if path is None or not os.path.exists(path):
+            h.update(b"missing")
+            continue
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+class ResultCache:
+    def __init__(self, model_version, max_entries=1024, db_path=None, disk_max_entries=100000,
+                 claim_timeout=60.0, poll_interval=0.05, trim_interval=60.0):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self.db_path = db_path
+        self.claim_timeout = claim_timeout
+        self.poll_interval = poll_interval
+        self.trim_interval = trim_interval
+        self._last_trim = 0.0
+
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+        if self.db_path:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS results ("
+                    " digest TEXT PRIMARY KEY,"
+                    " model_version TEXT NOT NULL,"
+                    " payload TEXT NOT NULL,"
+                    " accessed REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS inflight ("
+                    " digest TEXT PRIMARY KEY,"
+                    " claimed_until REAL NOT NULL)"
+                )
+                conn.execute("DELETE FROM results WHERE model_version != ?", (self.model_version,))
+
+    def _conn(self):
+        # sqlite3 connections are not shareable across threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, digest):
+        with self._lock:
+            result = self._memory.get(digest)
+            if result is not None:
+                self._memory.move_to_end(digest)
+                return result
+
+        if not self.db_path:
+            return None
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT payload FROM results WHERE digest = ? AND model_version = ?",
+                (digest, self.model_version),
+            ).fetchone()
+            if row is None:
+                return None
+            with conn:
+                conn.execute("UPDATE results SET accessed = ? WHERE digest = ?", (time.time(), digest))
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache read failed: {e}")
+            return None
+
+        result = json.loads(row[0])
+        self._remember(digest, result)
+        return result
+
+    def put(self, digest, result):
+        self._remember(digest, result)
+        if not self.db_path:
+            return
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (digest, model_version, payload, accessed) VALUES (?, ?, ?, ?)",
+                    (digest, self.model_version, json.dumps(result), time.time()),
+                )
+            self._trim(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache write failed: {e}")
+
+    def _trim(self, conn):
+        # The OFFSET scan walks the whole index, so run it periodically
+        now = time.time()
+        if now - self._last_trim < self.trim_interval:
+            return
+        self._last_trim = now
+        with conn:
+            conn.execute(
+                "DELETE FROM results WHERE digest IN ("
+                " SELECT digest FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,),
+            )
+            # Claims left behind by a worker that died mid-compute
+            conn.execute("DELETE FROM inflight WHERE claimed_until < ?", (now,))
+
+    def _remember(self, digest, result):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._memory[digest] = result
+            self._memory.move_to_end(digest)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def lookup(self, digest):
+        """
+        get() that also counts towards the hit ratio.
+        """
+        result = self.get(digest)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def get_or_compute(self, digest, compute, cacheable=None):
+        """
+        Return (result, hit). On a miss, `compute()` runs once per digest
+        even if several threads or workers ask at the same time; its result
+        is stored unless `cacheable(result)` is false. Callers that waited
+        on someone else's compute get hit=True only if that result was
+        cacheable.
+        """
+        result = self.lookup(digest)
+        if result is not None:
+            return result, True
+
+        with self._lock:
+            future = self._inflight.get(digest)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[digest] = future
+
+        if not owner:
+            result, stored = future.result()
+            return result, stored
+
+        try:
+            result, hit, stored = self._compute_shared(digest, compute, cacheable)
+            future.set_result((result, stored))
+            return result, hit
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(digest, None)
+
+    def _compute_shared(self, digest, compute, cacheable):
+        """
+        (result, hit, stored) for this worker's owner thread, coordinating
+        with other workers through the inflight table.
+        """
+        claimed = self._claim(digest)
+        if not claimed:
+            result = self._wait_for_claim(digest)
+            if result is not None:
+                return result, True, True
+            claimed = self._claim(digest)
+        try:
+            result = compute()
+            stored = cacheable is None or cacheable(result)
+            if stored:
+                self.put(digest, result)
+            return result, False, stored
+        finally:
+            if claimed:
+                self._release(digest)
+
+    def _claim(self, digest):
+        """
+        True if this worker now holds the inflight claim on `digest`, or
+        there is no shared tier to coordinate through.
+        """
+        if not self.db_path:
+            return True
+        now = time.time()
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM inflight WHERE digest = ? AND claimed_until < ?", (digest, now))
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO inflight (digest, claimed_until) VALUES (?, ?)",
+                    (digest, now + self.claim_timeout),
+                )
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache claim failed: {e}")
+            return True
+
+    def _release(self, digest):
+        if not self.db_path:
+            return
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM inflight WHERE digest = ?", (digest,))
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache release failed: {e}")
+
+    def _wait_for_claim(self, digest):
+        """
+        Poll until the worker holding the claim stores a result (returned),
+        or releases the claim without one or lets it expire (None).
+        """
+        deadline = time.time() + self.claim_timeout
+        while time.time() < deadline:
+            time.sleep(self.poll_interval)
+            result = self.get(digest)
+            if result is not None:
+                return result
+            try:
+                row = self._conn().execute(
+                    "SELECT claimed_until FROM inflight WHERE digest = ?", (digest,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Result cache claim check failed: {e}")
+                return None
+            if row is None or row[0] < time.time():
+                return None
+        return None
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._memory)
+        lookups = self.hits + self.misses
+        return {
+            'model_version': self.model_version,
+            'memory_entries': entries,
+            'disk_tier': bool(self.db_path),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
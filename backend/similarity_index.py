@@ -0,0 +1,404 @@
+"""
+Visual similarity search over catalog images.
+
+Each image is embedded with the frozen MobileNetV2 backbone from
+feature_cache.py (1280-d, L2-normalised, so cosine similarity is a dot
+product). The index directory holds:
+
+    embeddings.f32   contiguous float32 matrix, one row per item, memory-mapped
+    items.jsonl      one JSON object per row (id, image, plus whatever the caller stores)
+    meta.json        dim, row count and byte lengths; rows past the count are ignored
+    ivf.npz          optional coarse quantiser (k-means centroids)
+    assignments.i32  centroid of every row, when ivf.npz exists
+
+Searches scan the matrix in blocks of `block_rows` rows with one matmul per
+block and keep a running top-k. With an IVF index only the rows in the
+`nprobe` lists closest to the query are scored, which keeps queries in the
+low milliseconds at hundreds of thousands of rows. Rows added since the
+lists were built are always scanned exhaustively.
+
+Adds are appends under an flock, so every gunicorn worker can add uploads;
+the others see them on their next search.
+
+    python -m backend.similarity_index build backend/static --index catalog
+    python -m backend.similarity_index train-ivf --index catalog --nlist 1024
+    python -m backend.similarity_index query photo.jpg --index catalog -k 10
+"""
+import argparse
+import fcntl
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from backend.preprocess import IMAGE_SIZE, list_images, load_exact, load_fast
+
+EMBEDDINGS_FILE = 'embeddings.f32'
+ITEMS_FILE = 'items.jsonl'
+META_FILE = 'meta.json'
+IVF_FILE = 'ivf.npz'
+ASSIGNMENTS_FILE = 'assignments.i32'
+# Rebuild the in-memory inverted lists once this many rows were added since the last build
+IVF_TAIL_REBUILD = 20000
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _topk(scores, k):
+    """
+    Indices of the k largest scores, best first.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+class Embedder:
+    """
+    Lazily built backbone; takes preprocessed [0, 1] image batches, the same
+    arrays the wear and depreciation models get.
+    """
+
+    def __init__(self, weights=None):
+        self.weights = weights
+        self._model = None
+        self._lock = threading.Lock()
+
+    def __call__(self, batch):
+        with self._lock:
+            if self._model is None:
+                from backend.feature_cache import build_backbone
+                self._model = build_backbone(IMAGE_SIZE, weights=self.weights)
+        return normalize(self._model.predict(np.asarray(batch, dtype=np.float32), verbose=0))
+
+
+class SimilarityIndex:
+    def __init__(self, index_dir, dim=1280, block_rows=65536, nprobe=8):
+        self.index_dir = index_dir
+        self.block_rows = block_rows
+        self.nprobe = nprobe
+        os.makedirs(index_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._meta_mtime = None
+        self.dim = dim
+        self.count = 0
+        self._embeddings = None
+        self.items = []
+        self._ids = {}
+        self._items_bytes = 0
+        self._centroids = None
+        self._ivf_mtime = None
+        self._lists = None
+        self._lists_rows = 0
+        self.reload()
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._path(META_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'dim': self.dim, 'count': 0, 'items_bytes': 0}
+
+    def _write_meta(self, meta):
+        tmp_path = f"{self._path(META_FILE)}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path(META_FILE))
+
+    def reload(self):
+        """
+        Pick up rows added by other processes and a retrained IVF index.
+        Cheap (two stat calls) when nothing changed.
+        """
+        with self._lock:
+            try:
+                st = os.stat(self._path(META_FILE))
+                # meta.json is replaced, never rewritten, so a new inode means new content
+                mtime = (st.st_ino, st.st_mtime_ns)
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self._meta_mtime:
+                meta = self._read_meta()
+                self._meta_mtime = mtime
+                self.dim = meta['dim']
+                if meta['count'] < self.count:
+                    # Index was rebuilt from scratch
+                    self.items, self._ids, self._items_bytes, self._lists, self._lists_rows = [], {}, 0, None, 0
+                self.count = meta['count']
+                self._embeddings = None
+                if self.count:
+                    self._embeddings = np.memmap(self._path(EMBEDDINGS_FILE), dtype=np.float32, mode='r',
+                                                 shape=(self.count, self.dim))
+                if meta['items_bytes'] > self._items_bytes:
+                    with open(self._path(ITEMS_FILE), 'rb') as f:
+                        f.seek(self._items_bytes)
+                        data = f.read(meta['items_bytes'] - self._items_bytes)
+                    for line in data.splitlines():
+                        item = json.loads(line)
+                        self._ids[item['id']] = len(self.items)
+                        self.items.append(item)
+                    self._items_bytes = meta['items_bytes']
+
+            try:
+                st = os.stat(self._path(IVF_FILE))
+                ivf_mtime = (st.st_ino, st.st_mtime_ns)
+            except FileNotFoundError:
+                ivf_mtime = None
+            if ivf_mtime != self._ivf_mtime:
+                self._ivf_mtime = ivf_mtime
+                self._centroids = None
+                self._lists = None
+                if ivf_mtime is not None:
+                    with np.load(self._path(IVF_FILE)) as data:
+                        self._centroids = data['centroids']
+            if self._centroids is not None and (self._lists is None or
+                                                self.count - self._lists_rows > IVF_TAIL_REBUILD):
+                self._build_lists()
+
+    def _build_lists(self):
+        assignments = np.fromfile(self._path(ASSIGNMENTS_FILE), dtype=np.int32)[:self.count]
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.searchsorted(assignments[order], np.arange(len(self._centroids) + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+        self._lists_rows = len(assignments)
+
+    def __len__(self):
+        return self.count
+
+    def row(self, item_id):
+        return self._ids.get(item_id)
+
+    def vector(self, row):
+        return np.array(self._embeddings[row])
+
+    def add(self, vectors, items):
+        """
+        Append normalised `vectors` with one item dict each. Every item needs
+        a unique 'id'; items already in the index are skipped. Returns the
+        rows of the added items.
+        """
+        vectors = normalize(vectors).reshape(-1, self.dim)
+        lock_path = self._path('.lock')
+        with self._lock, open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.reload()
+                keep = []
+                seen = set()
+                for i, item in enumerate(items):
+                    if item['id'] not in self._ids and item['id'] not in seen:
+                        seen.add(item['id'])
+                        keep.append(i)
+                if not keep:
+                    return []
+                vectors = np.ascontiguousarray(vectors[keep])
+                meta = self._read_meta()
+                count = meta['count']
+
+                mode = 'r+b' if os.path.exists(self._path(EMBEDDINGS_FILE)) else 'w+b'
+                with open(self._path(EMBEDDINGS_FILE), mode) as f:
+                    f.seek(count * self.dim * 4)
+                    f.truncate()
+                    f.write(vectors.tobytes())
+                lines = b''.join(json.dumps(items[i]).encode('utf-8') + b'\n' for i in keep)
+                mode = 'r+b' if os.path.exists(self._path(ITEMS_FILE)) else 'w+b'
+                with open(self._path(ITEMS_FILE), mode) as f:
+                    f.seek(meta['items_bytes'])
+                    f.truncate()
+                    f.write(lines)
+                if self._centroids is not None:
+                    assignments = np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+                    with open(self._path(ASSIGNMENTS_FILE), 'r+b') as f:
+                        f.seek(count * 4)
+                        f.truncate()
+                        f.write(assignments.tobytes())
+
+                self._write_meta({'dim': self.dim, 'count': count + len(keep),
+                                  'items_bytes': meta['items_bytes'] + len(lines)})
+                self.reload()
+                return list(range(count, count + len(keep)))
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _scan(self, queries, start, stop, k):
+        best_rows = [np.empty(0, dtype=np.int64)] * len(queries)
+        best_scores = [np.empty(0, dtype=np.float32)] * len(queries)
+        for block_start in range(start, stop, self.block_rows):
+            block_stop = min(block_start + self.block_rows, stop)
+            scores = np.asarray(self._embeddings[block_start:block_stop]) @ queries.T
+            for q in range(len(queries)):
+                top = _topk(scores[:, q], k)
+                best_rows[q] = np.concatenate([best_rows[q], top + block_start])
+                best_scores[q] = np.concatenate([best_scores[q], scores[top, q]])
+        return best_rows, best_scores
+
+    def _probe(self, query, k):
+        centroid_scores = self._centroids @ query
+        lists = _topk(centroid_scores, self.nprobe)
+        rows = np.sort(np.concatenate([self._lists[i] for i in lists]))
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float32)
+        scores = np.asarray(self._embeddings[rows]) @ query
+        top = _topk(scores, k)
+        return rows[top], scores[top]
+
+    def search(self, queries, k=10, exclude=None):
+        """
+        Top-k rows for each query vector. Returns one list of (row, score)
+        pairs per query, best first. Rows in `exclude` are left out.
+        """
+        self.reload()
+        with self._lock:
+            queries = normalize(queries).reshape(-1, self.dim)
+            exclude = set(exclude or ())
+            wanted = k + len(exclude)
+            if not self.count:
+                return [[] for _ in queries]
+
+            if self._lists is not None:
+                results = []
+                tail_rows, tail_scores = self._scan(queries, self._lists_rows, self.count, wanted)
+                for q, query in enumerate(queries):
+                    rows, scores = self._probe(query, wanted)
+                    results.append((np.concatenate([rows, tail_rows[q]]), np.concatenate([scores, tail_scores[q]])))
+            else:
+                rows, scores = self._scan(queries, 0, self.count, wanted)
+                results = list(zip(rows, scores))
+
+            out = []
+            for rows, scores in results:
+                order = _topk(scores, len(scores))
+                hits = [(int(rows[i]), float(scores[i])) for i in order if int(rows[i]) not in exclude]
+                out.append(hits[:k])
+            return out
+
+    def similar_items(self, vector, k=10, exclude_ids=()):
+        """
+        Item dicts (with a 'score') most similar to one embedding.
+        """
+        exclude = [self._ids[i] for i in exclude_ids if i in self._ids]
+        return [dict(self.items[row], score=round(score, 4)) for row, score in self.search(vector, k, exclude)[0]]
+
+    def stats(self):
+        return {
+            'items': self.count,
+            'dim': self.dim,
+            'ivf_lists': len(self._centroids) if self._centroids is not None else 0,
+            'unlisted_rows': self.count - self._lists_rows if self._lists is not None else self.count,
+        }
+
+    def train_ivf(self, nlist=None, sample=100000, iterations=10, seed=0):
+        """
+        Fit k-means centroids (spherical, on a sample) and assign every row.
+        nlist defaults to about 4 * sqrt(rows).
+        """
+        self.reload()
+        count = self.count
+        if not count:
+            raise ValueError("Index is empty")
+        nlist = min(nlist or int(4 * np.sqrt(count)), count)
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(count, size=min(sample, count), replace=False))
+        data = np.asarray(self._embeddings[sample_rows])
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+            centroids = normalize(sums)
+
+        lock_path = self._path('.lock')
+        with open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Rows appended while k-means ran are assigned too
+                count = self._read_meta()['count']
+                embeddings = np.memmap(self._path(EMBEDDINGS_FILE), dtype=np.float32, mode='r', shape=(count, self.dim))
+                assignments = np.empty(count, dtype=np.int32)
+                for start in range(0, count, self.block_rows):
+                    block = np.asarray(embeddings[start:start + self.block_rows])
+                    assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+                tmp_path = self._path(ASSIGNMENTS_FILE) + '.tmp'
+                assignments.tofile(tmp_path)
+                os.replace(tmp_path, self._path(ASSIGNMENTS_FILE))
+                tmp_path = self._path('ivf.tmp.npz')
+                np.savez(tmp_path, centroids=centroids)
+                os.replace(tmp_path, self._path(IVF_FILE))
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self.reload()
+        return nlist
+
+
+def build_from_dir(index, image_dir, embedder, batch_size=64, workers=None, mode='exact'):
+    """
+    Embed every image in `image_dir` not yet in the index (item id = file
+    name). Returns the number of images added.
+    """
+    loader = load_fast if mode == 'fast' else load_exact
+    paths = [path for path in list_images(image_dir) if index.row(os.path.basename(path)) is None]
+    added = 0
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(paths), batch_size):
+            batch_paths = paths[start:start + batch_size]
+            arrays = list(executor.map(loader, batch_paths))
+            vectors = embedder(np.stack(arrays))
+            items = [{'id': os.path.basename(path), 'image': os.path.basename(path)} for path in batch_paths]
+            added += len(index.add(vectors, items))
+            elapsed = time.perf_counter() - start_time
+            print(f"{start + len(batch_paths)}/{len(paths)} images, {added / elapsed:.1f} images/sec", flush=True)
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the visual similarity index.")
+    parser.add_argument('--index', default=os.getenv("SIMILARITY_INDEX_DIR", "catalog"))
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help="Embed every new image in a directory")
+    build_parser.add_argument('image_dir')
+    build_parser.add_argument('--batch-size', type=int, default=64)
+    build_parser.add_argument('--workers', type=int, default=None)
+    train_parser = commands.add_parser('train-ivf', help="Train the coarse IVF quantiser")
+    train_parser.add_argument('--nlist', type=int, default=None)
+    query_parser = commands.add_parser('query', help="Print the nearest catalog items to an image")
+    query_parser.add_argument('image')
+    query_parser.add_argument('-k', type=int, default=10)
+    for sub in (build_parser, query_parser):
+        sub.add_argument('--preprocess', choices=['exact', 'fast'], default=os.getenv("PREPROCESS_MODE", "exact").lower())
+    args = parser.parse_args()
+
+    index = SimilarityIndex(args.index)
+    if args.command == 'build':
+        added = build_from_dir(index, args.image_dir, Embedder(), args.batch_size, args.workers, args.preprocess)
+        print(f"Added {added} images; index holds {len(index)}")
+    elif args.command == 'train-ivf':
+        nlist = index.train_ivf(args.nlist)
+        print(f"Trained {nlist} lists over {len(index)} rows")
+    else:
+        loader = load_fast if args.preprocess == 'fast' else load_exact
+        vector = Embedder()(loader(args.image)[None])
+        start = time.perf_counter()
+        items = index.similar_items(vector, args.k)
+        print(f"Search took {1000 * (time.perf_counter() - start):.2f} ms")
+        for item in items:
+            print(f"{item['score']:.4f}  {item['id']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Serve a .tflite model behind the same predict(arr, verbose=0) call as Keras.
+
+Uses the lightweight tflite_runtime package when installed and falls back
+to tf.lite from the full TensorFlow install otherwise.
+"""
+import threading
+import time
+
+import numpy as np
+
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:
+    from tensorflow.lite import Interpreter
+
+
+class TFLiteModel:
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self._interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        # Interpreters are not thread-safe
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.images = 0
+        self.total_seconds = 0.0
+
+    def predict(self, arr, verbose=0):
+        arr = np.asarray(arr, dtype=self._input['dtype'])
+        with self._lock:
+            start = time.perf_counter()
+            if arr.shape[0] != self._batch_size:
+                self._interpreter.resize_tensor_input(self._input['index'], list(arr.shape))
+                self._interpreter.allocate_tensors()
+                self._input = self._interpreter.get_input_details()[0]
+                self._output = self._interpreter.get_output_details()[0]
+                self._batch_size = arr.shape[0]
+            self._interpreter.set_tensor(self._input['index'], arr)
+            self._interpreter.invoke()
+            result = self._interpreter.get_tensor(self._output['index']).copy()
+            self.calls += 1
+            self.images += arr.shape[0]
+            self.total_seconds += time.perf_counter() - start
+        return result
+
+    def stats(self):
+        return {
+            'model_path': self.model_path,
+            'calls': self.calls,
+            'images': self.images,
+            'ms_per_image': 1000 * self.total_seconds / self.images if self.images else 0.0,
+        }
@@ -1,47 +1,141 @@
 import os
 import pandas as pd
 import numpy as np
-from tensorflow.keras.preprocessing.image import load_img, img_to_array
+import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense
 from tensorflow.keras.optimizers import Adam
 from sklearn.model_selection import train_test_split
 
+from backend.dataset_shards import ShardDataset
+from backend.depreciation_scoring import calculate_depreciation  # rule-based fallback, re-exported
+
+# Run from the repository root: python -m backend.train_depreciation_model
 # Configurations
-IMAGE_DIR = 'static/'
-LABELS_CSV = 'csv/dataset.csv'
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_DIR = os.path.join(BASE_DIR, 'static')
+LABELS_CSV = os.path.join(BASE_DIR, 'csv', 'dataset.csv')
+MODEL_DIR = os.path.join(BASE_DIR, 'model')
 IMAGE_SIZE = (224, 224)
 BATCH_SIZE = 32
 EPOCHS = 20
+SHUFFLE_BUFFER = 256
+# Optional directory for tf.data's on-disk cache of decoded images.
+# Delete it after changing the dataset or IMAGE_SIZE.
+CACHE_DIR = os.getenv('TRAIN_CACHE_DIR')
+# Optional directory of memory-mapped shards built by dataset_shards.py.
+# When set, training reads preprocessed tensors instead of decoding JPEGs.
+SHARDS_DIR = os.getenv('TRAIN_SHARDS_DIR')
+# "full" trains the CNN end to end; "heads" trains heads on cached backbone features (train_heads.py)
+TRAIN_MODE = os.getenv('TRAIN_MODE', 'full').lower()
 
-def load_data(image_dir, dataset_csv):
-    df = pd.read_csv(dataset_csv)
-    images = []
-    labels = []
+# Map text labels to numeric values. csv/dataset.csv spells them
+# new_worn / lightly_worn / heavily_worn; the spaced forms are kept as aliases.
+WEAR_SIGNS_MAPPING = {
+    'new_worn': 0.0,
+    'not worn': 0.0,
+    'lightly_worn': 0.5,
+    'lightly worn': 0.5,
+    'heavily_worn': 1.0,
+    'heavily worn': 1.0
+}
 
-    # Map text labels to numeric values
-    wear_signs_mapping = {
-        'not worn': 0.0,
-        'lightly worn': 0.5,
-        'heavily worn': 1.0
-    }
+def wear_label(wear_text):
+    return WEAR_SIGNS_MAPPING.get(str(wear_text).strip().lower(), 0.0)  # Default to 0.0 if unknown
 
-    for _, row in df.iterrows():
-        img_path = os.path.join(image_dir, row['image_name'])
-        if os.path.exists(img_path):
-            img = load_img(img_path, target_size=IMAGE_SIZE)
-            img_array = img_to_array(img) / 255.0  # Normalize pixel values
-            images.append(img_array)
+def check_labels(labels):
+    """
+    Refuse to train on labels that are all the same value (e.g. a wear_signs
+    spelling WEAR_SIGNS_MAPPING doesn't know): the model would learn a constant.
+    """
+    labels = np.asarray(labels)
+    if len(labels) == 0 or np.all(labels == labels[0]):
+        value = labels[0] if len(labels) else None
+        raise ValueError(f"All {len(labels)} depreciation labels are {value}; "
+                         f"check WEAR_SIGNS_MAPPING against the wear_signs column")
+    return labels
 
-            wear_text = str(row['wear_signs']).strip().lower()
-            label = wear_signs_mapping.get(wear_text, 0.0)  # Default to 0.0 if unknown
-            labels.append(label)
+def load_records(image_dir, dataset_csv):
+    """
+    Image paths and numeric labels from the CSV. Only file names are held in
+    memory; the images themselves are streamed by make_dataset.
+    """
+    df = pd.read_csv(dataset_csv, usecols=['image_name', 'wear_signs'])
+    paths = []
+    labels = []
+    for image_name, wear_text in zip(df['image_name'], df['wear_signs']):
+        img_path = os.path.join(image_dir, image_name)
+        if os.path.exists(img_path):
+            paths.append(img_path)
+            labels.append(wear_label(wear_text))
         else:
             print(f"Warning: Image {img_path} not found.")
+    return np.array(paths), np.array(labels, dtype=np.float32)
+
+def decode_image(path, label):
+    data = tf.io.read_file(path)
+    img = tf.io.decode_image(data, channels=3, expand_animations=False)
+    img = tf.image.resize(img, IMAGE_SIZE, antialias=True)
+    return img / 255.0, label  # Normalize pixel values
+
+def make_dataset(paths, labels, training, cache_path=None):
+    """
+    Streaming input pipeline: parallel decode and resize, optional on-disk
+    cache, shuffle (training only), batch and prefetch.
+    """
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if training and not cache_path:
+        # Shuffling file names is free; decoded images would need a large buffer
+        ds = ds.shuffle(len(paths), reshuffle_each_iteration=True)
+    ds = ds.map(decode_image, num_parallel_calls=tf.data.AUTOTUNE)
+    if cache_path:
+        ds = ds.cache(cache_path)
+        if training:
+            ds = ds.shuffle(SHUFFLE_BUFFER, reshuffle_each_iteration=True)
+    return ds.batch(BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
 
-    X = np.array(images)
-    y = np.array(labels)
-    return X, y
+def make_shard_dataset(shards, rows, labels, training):
+    """
+    Batches gathered from memory-mapped shards. The generator is re-run
+    every epoch, so training batches are reshuffled each time.
+    """
+    def batches():
+        return shards.iter_batches(rows, labels, BATCH_SIZE, shuffle=training)
+
+    ds = tf.data.Dataset.from_generator(batches, output_signature=(
+        tf.TensorSpec((None,) + shards.image_shape, tf.uint8),
+        tf.TensorSpec((None,), tf.as_dtype(np.asarray(labels).dtype)),
+    ))
+    ds = ds.map(lambda x, y: (tf.cast(x, tf.float32) / 255.0, y), num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+def load_datasets():
+    """
+    Train/validation datasets from shards if TRAIN_SHARDS_DIR is set,
+    otherwise streamed from the JPEGs.
+    """
+    if SHARDS_DIR:
+        shards = ShardDataset(SHARDS_DIR)
+        rows = np.arange(len(shards))
+        labels = check_labels(np.array([wear_label(text) for text in shards.metadata['wear_signs']], dtype=np.float32))
+        print(f"Found {len(rows)} images in shards.")
+        train_rows, val_rows, y_train, y_val = train_test_split(rows, labels, test_size=0.2, random_state=42)
+        return (make_shard_dataset(shards, train_rows, y_train, training=True),
+                make_shard_dataset(shards, val_rows, y_val, training=False))
+
+    paths, labels = load_records(IMAGE_DIR, LABELS_CSV)
+    check_labels(labels)
+    print(f"Found {len(paths)} images.")
+
+    train_paths, val_paths, y_train, y_val = train_test_split(paths, labels, test_size=0.2, random_state=42)
+
+    train_cache = val_cache = None
+    if CACHE_DIR:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        train_cache = os.path.join(CACHE_DIR, 'train')
+        val_cache = os.path.join(CACHE_DIR, 'val')
+    return (make_dataset(train_paths, y_train, training=True, cache_path=train_cache),
+            make_dataset(val_paths, y_val, training=False, cache_path=val_cache))
 
 def build_model(input_shape=(224, 224, 3)):
     model = Sequential([
@@ -57,35 +151,27 @@ def build_model(input_shape=(224, 224, 3)):
     return model
 
 def main():
-    print("Loading data...")
-    X, y = load_data(IMAGE_DIR, LABELS_CSV)
-    print(f"Loaded {len(X)} images.")
+    if TRAIN_MODE == 'heads':
+        from backend import train_heads
+        return train_heads.main()
 
-    X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+    print("Loading data...")
+    train_ds, val_ds = load_datasets()
 
     model = build_model(input_shape=IMAGE_SIZE + (3,))
     model.summary()
 
     print("Training model...")
     model.fit(
-        X_train, y_train,
-        validation_data=(X_val, y_val),
-        epochs=EPOCHS,
-        batch_size=BATCH_SIZE
+        train_ds,
+        validation_data=val_ds,
+        epochs=EPOCHS
     )
 
-    os.makedirs('model', exist_ok=True)
-    model.save('model/depreciation_model.h5')
-    print("Model saved as model/depreciation_model.h5")
-
-# Fallback rule-based depreciation function (unchanged)
-def calculate_depreciation(brand, fabric, age_years, wear_level_score):
-    brand_score = 0.8 if brand.lower() in ['gucci', 'prada', 'lv'] else 0.6
-    fabric_score = 0.9 if fabric.lower() in ['leather', 'wool'] else 0.7
-    age_score = max(0, 1 - (age_years / 10))
-    wear_score = 1 - wear_level_score
-    depreciation = brand_score * fabric_score * age_score * wear_score
-    return round(depreciation, 3)
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    path = os.path.join(MODEL_DIR, 'depreciation_model.h5')
+    model.save(path)
+    print(f"Model saved as {path}")
 
 if __name__ == '__main__':
     main()
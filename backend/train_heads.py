@@ -0,0 +1,74 @@
+import os
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import Dense, Dropout
+from tensorflow.keras.optimizers import Adam
+from sklearn.model_selection import train_test_split
+
+from backend.dataset_shards import SHARDS_DIR as DEFAULT_SHARDS_DIR, ShardDataset
+from backend.feature_cache import build_backbone, update_features, features_for
+from backend.train_depreciation_model import IMAGE_SIZE, BATCH_SIZE, MODEL_DIR, check_labels, wear_label
+from backend.train_wear_model import WEAR_CATEGORY_MAPPING
+
+# Fast retraining: a frozen MobileNetV2 embeds every image once (cached in
+# features/), then only the small wear and depreciation heads are trained on
+# the cached vectors. The saved models are backbone + head, so the API loads
+# them like any other .h5 and they cost far fewer FLOPs than the
+# Flatten -> Dense(128) CNNs.
+SHARDS_DIR = os.getenv('TRAIN_SHARDS_DIR', DEFAULT_SHARDS_DIR)
+HEAD_EPOCHS = 60
+
+def build_head(input_dim, outputs, activation):
+    return Sequential([
+        Dense(128, activation='relu', input_shape=(input_dim,)),
+        Dropout(0.2),
+        Dense(outputs, activation=activation)
+    ])
+
+def fit_head(head, features, labels, loss, metrics):
+    X_train, X_val, y_train, y_val = train_test_split(features, labels, test_size=0.2, random_state=42)
+    head.compile(optimizer=Adam(1e-3), loss=loss, metrics=metrics)
+    head.fit(
+        X_train, y_train,
+        validation_data=(X_val, y_val),
+        epochs=HEAD_EPOCHS,
+        batch_size=BATCH_SIZE,
+        callbacks=[tf.keras.callbacks.EarlyStopping(patience=8, restore_best_weights=True)],
+        verbose=2
+    )
+    return head
+
+def export(backbone, head, path):
+    inputs = tf.keras.Input(shape=IMAGE_SIZE + (3,))
+    model = tf.keras.Model(inputs, head(backbone(inputs)))
+    model.save(path)
+    print(f"Model saved as {path}")
+
+def main():
+    shards = ShardDataset(SHARDS_DIR)
+    backbone = build_backbone(IMAGE_SIZE)
+
+    print("Updating feature cache...")
+    added = update_features(shards, backbone)
+    print(f"Embedded {added} new images.")
+    features = features_for(shards)
+
+    print("Training depreciation head...")
+    dep_labels = check_labels(np.array([wear_label(text) for text in shards.metadata['wear_signs']], dtype=np.float32))
+    dep_head = fit_head(build_head(features.shape[1], 1, 'linear'), features, dep_labels,
+                        'mean_squared_error', ['mae'])
+
+    print("Training wear head...")
+    categories = [str(c).strip().lower() for c in shards.metadata['wear_category']]
+    rows = np.array([i for i, c in enumerate(categories) if c in WEAR_CATEGORY_MAPPING], dtype=np.int64)
+    wear_labels = np.array([WEAR_CATEGORY_MAPPING[categories[i]] for i in rows], dtype=np.int32)
+    wear_head = fit_head(build_head(features.shape[1], len(WEAR_CATEGORY_MAPPING), 'softmax'),
+                         features[rows], wear_labels, 'sparse_categorical_crossentropy', ['accuracy'])
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    export(backbone, dep_head, os.path.join(MODEL_DIR, 'depreciation_model.h5'))
+    export(backbone, wear_head, os.path.join(MODEL_DIR, 'wear_tear_model.h5'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import os
+import numpy as np
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense
+from tensorflow.keras.optimizers import Adam
+from sklearn.model_selection import train_test_split
+
+from backend.dataset_shards import SHARDS_DIR as DEFAULT_SHARDS_DIR, ShardDataset
+from backend.train_depreciation_model import IMAGE_SIZE, EPOCHS, MODEL_DIR, make_shard_dataset
+
+# Wear classifier trained from the memory-mapped shards built by
+# dataset_shards.py. Class order matches WearTearModel.labels, so output 0
+# (probability of heavy wear) doubles as the wear_level_score the API reads.
+SHARDS_DIR = os.getenv('TRAIN_SHARDS_DIR', DEFAULT_SHARDS_DIR)
+WEAR_CATEGORY_MAPPING = {
+    'heavily': 0,   # heavily worn
+    'lightly': 1,   # lightly worn
+    'new': 2        # not worn
+}
+
+def build_model(input_shape=(224, 224, 3), num_classes=3):
+    model = Sequential([
+        Conv2D(32, (3,3), activation='relu', input_shape=input_shape),
+        MaxPooling2D(2,2),
+        Conv2D(64, (3,3), activation='relu'),
+        MaxPooling2D(2,2),
+        Flatten(),
+        Dense(128, activation='relu'),
+        Dense(num_classes, activation='softmax')
+    ])
+    model.compile(optimizer=Adam(), loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+def main():
+    print("Loading shards...")
+    shards = ShardDataset(SHARDS_DIR)
+    categories = [str(c).strip().lower() for c in shards.metadata['wear_category']]
+    known = np.array([c in WEAR_CATEGORY_MAPPING for c in categories])
+    rows = np.flatnonzero(known)
+    labels = np.array([WEAR_CATEGORY_MAPPING[categories[i]] for i in rows], dtype=np.int32)
+    print(f"Found {len(rows)} labelled images ({int((~known).sum())} skipped).")
+
+    train_rows, val_rows, y_train, y_val = train_test_split(
+        rows, labels, test_size=0.2, random_state=42, stratify=labels)
+
+    model = build_model(input_shape=IMAGE_SIZE + (3,))
+    model.summary()
+
+    print("Training model...")
+    model.fit(
+        make_shard_dataset(shards, train_rows, y_train, training=True),
+        validation_data=make_shard_dataset(shards, val_rows, y_val, training=False),
+        epochs=EPOCHS
+    )
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    path = os.path.join(MODEL_DIR, 'wear_tear_model.h5')
+    model.save(path)
+    print(f"Model saved as {path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Background blob uploads with a pollable job status.
+
+UploadJobs runs an upload callable on a bounded thread pool. Each job's
+state is written as a small JSON file under jobs_dir (atomic rename), so a
+status request can be answered by any gunicorn worker on the same host,
+not only the one that accepted the upload. Jobs make one attempt: the
+shared HTTP client already retries failed PUTs.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class UploadJobs:
+    def __init__(self, upload, jobs_dir, max_workers=4, max_pending=64, ttl_seconds=24 * 3600):
+        """
+        `upload(data, blob_name)` must return the blob URL on success
+        and None on failure.
+        """
+        self.upload = upload
+        self.jobs_dir = jobs_dir
+        self.ttl_seconds = ttl_seconds
+        self._last_prune = 0.0
+        os.makedirs(jobs_dir, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="azure-upload")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, data, blob_name, on_done=None):
+        """
+        Queue an upload and return its job id, or None if the queue is full
+        (the caller should then upload synchronously). The job keeps a
+        reference to `data` until it finishes. `on_done(blob_url)` runs after
+        a successful upload.
+        """
+        if not self._slots.acquire(blocking=False):
+            return None
+        job_id = uuid.uuid4().hex
+        self._write(job_id, {'status': 'pending', 'attempts': 0, 'azure_blob_url': None})
+        try:
+            self._executor.submit(self._run, job_id, data, blob_name, on_done)
+        except Exception:
+            self._slots.release()
+            raise
+        return job_id
+
+    def _run(self, job_id, data, blob_name, on_done):
+        try:
+            blob_url = self.upload(data, blob_name)
+            status = 'done' if blob_url is not None else 'failed'
+            self._write(job_id, {'status': status, 'attempts': 1, 'azure_blob_url': blob_url})
+            if blob_url is not None and on_done is not None:
+                on_done(blob_url)
+            if status == 'failed':
+                logger.error(f"Azure upload job {job_id} failed")
+        except Exception:
+            logger.exception(f"Azure upload job {job_id} crashed")
+            self._write(job_id, {'status': 'failed', 'attempts': 0, 'azure_blob_url': None})
+        finally:
+            self._slots.release()
+            self._prune()
+
+    def status(self, job_id):
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _write(self, job_id, state):
+        state = dict(state, job_id=job_id, updated=time.time())
+        tmp_path = f"{self._path(job_id)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._path(job_id))
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 600:
+            return
+        self._last_prune = now
+        cutoff = now - self.ttl_seconds
+        try:
+            for entry in os.scandir(self.jobs_dir):
+                if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+        except OSError:
+            pass
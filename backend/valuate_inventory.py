@@ -0,0 +1,209 @@
+"""
+Offline valuation of a whole intake of photos.
+
+Reads a CSV shaped like csv/dataset.csv (only image_name is required;
+fabric_type, and optional brand, age_years and original_price columns feed
+the rule-based scores), decodes images in a process pool, runs the wear and
+depreciation models over full batches, and appends one row per image to
+the output CSV as each batch finishes:
+
+    python -m backend.valuate_inventory intake.csv photos/ --out valuations.csv
+    python -m backend.valuate_inventory intake.csv photos/ --out valuations.csv --workers 8 --batch-size 64
+
+Runs are resumable: images already in the output are skipped, so an
+interrupted job continues where it stopped. Images that fail to decode are
+reported but not written, so the next run retries them. Throughput in
+images per second is printed as the job goes.
+"""
+import argparse
+import csv
+import os
+import time
+from collections import deque
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from backend.depreciation_service import DepreciationService
+from backend.ebay_service import EbayService
+from backend.model_fetch import MODELS_DIR
+from backend.model_scores import predict_scores
+from backend.preprocess import IMAGE_SIZE, decode_exact, decode_fast, normalize
+
+BATCH_SIZE = 32
+OUTPUT_COLUMNS = [
+    'image_name', 'wear_level_score', 'depreciation_score', 'condition',
+    'rule_depreciation_score', 'depreciated_value', 'price_min', 'price_avg', 'price_max',
+]
+
+
+def wear_condition(wear_level_score):
+    """
+    Condition category for a wear score, using the training label scale
+    (0 not worn, 0.5 lightly worn, 1 heavily worn).
+    """
+    if wear_level_score < 1 / 3:
+        return 'not worn'
+    if wear_level_score < 2 / 3:
+        return 'lightly worn'
+    return 'heavily worn'
+
+
+def load_scoring_model(path):
+    if path.endswith('.tflite'):
+        from backend.tflite_model import TFLiteModel
+        return TFLiteModel(path)
+    from keras.models import load_model
+    return load_model(path)
+
+
+def _decode_batch(paths, mode):
+    """
+    Runs in a pool worker. Returns (stacked uint8 images or None, error per
+    path). Pixels stay uint8 for the trip back through the pipe; the parent
+    normalizes them just before inference.
+    """
+    loader = decode_fast if mode == 'fast' else decode_exact
+    arrays = []
+    errors = []
+    for path in paths:
+        try:
+            arrays.append(loader(path, IMAGE_SIZE))
+            errors.append(None)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+    return (np.stack(arrays) if arrays else None), errors
+
+
+def _completed(out_path):
+    """
+    Image names already valued in `out_path`. A row cut short by an
+    interruption is dropped so the next append starts on a clean line.
+    """
+    if not os.path.exists(out_path):
+        return set()
+    with open(out_path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+    with open(out_path, newline='') as f:
+        return {row['image_name'] for row in csv.DictReader(f)}
+
+
+def _column(df, name, default):
+    return df[name].tolist() if name in df.columns else [default] * len(df)
+
+
+def valuate(dataset_csv, image_dir, out_path, wear_model, depreciation_model,
+            batch_size=BATCH_SIZE, workers=None, mode='exact', limit=None, report_every=10):
+    df = pd.read_csv(dataset_csv, dtype={'image_name': str})
+    done = _completed(out_path)
+    df = df[~df['image_name'].isin(done)].reset_index(drop=True)
+    if limit is not None:
+        df = df.head(limit)
+    if len(df) == 0:
+        print(f"Nothing to do: {len(done)} images already valued in {out_path}")
+        return {'valued': 0, 'failed': 0, 'skipped': len(done), 'images_per_second': 0.0}
+
+    names = df['image_name'].tolist()
+    brands = [str(b) for b in _column(df, 'brand', '')]
+    fabrics = [str(f) for f in _column(df, 'fabric_type', '')]
+    clothing_types = [str(c) for c in _column(df, 'clothing_type', '')]
+    ages = pd.to_numeric(pd.Series(_column(df, 'age_years', 0)), errors='coerce').fillna(0).tolist()
+    prices = pd.to_numeric(pd.Series(_column(df, 'original_price', 100.0)), errors='coerce').fillna(100.0).tolist()
+
+    depreciation_service = DepreciationService()
+    ebay_service = EbayService()
+    batches = [list(range(start, min(start + batch_size, len(df)))) for start in range(0, len(df), batch_size)]
+
+    write_header = not os.path.exists(out_path) or os.path.getsize(out_path) == 0
+    valued = failed = 0
+    start_time = time.perf_counter()
+    # Spawned, not forked: the parent already holds TensorFlow state
+    context = multiprocessing.get_context('spawn')
+    with open(out_path, 'a', newline='') as out, context.Pool(processes=workers) as pool:
+        writer = csv.DictWriter(out, fieldnames=OUTPUT_COLUMNS)
+        if write_header:
+            writer.writeheader()
+
+        # Keep a bounded number of batches decoding ahead of inference so
+        # memory stays flat however large the intake is
+        pending = deque()
+        ahead = 2 * (workers or os.cpu_count() or 1)
+        next_batch = 0
+        for index in range(len(batches)):
+            while next_batch < len(batches) and len(pending) < ahead:
+                paths = [os.path.join(image_dir, names[i]) for i in batches[next_batch]]
+                pending.append(pool.apply_async(_decode_batch, (paths, mode)))
+                next_batch += 1
+            images, errors = pending.popleft().get()
+            rows = batches[index]
+            ok = [i for i, error in zip(rows, errors) if error is None]
+
+            if ok:
+                images = normalize(images, mode)
+                wear_scores = predict_scores(wear_model, images)
+                dep_scores = predict_scores(depreciation_model, images)
+                rule_scores = depreciation_service.calculate_depreciation_batch(
+                    [brands[i] for i in ok], [fabrics[i] for i in ok],
+                    [ages[i] for i in ok], wear_scores,
+                )
+            for i, error in zip(rows, errors):
+                if error is not None:
+                    print(f"Skipping {names[i]}: {error}", flush=True)
+                    failed += 1
+            for j, i in enumerate(ok):
+                condition = wear_condition(wear_scores[j])
+                estimate = ebay_service.get_price_estimate(condition, clothing_types[i], fabrics[i])
+                writer.writerow({
+                    'image_name': names[i],
+                    'wear_level_score': wear_scores[j],
+                    'depreciation_score': dep_scores[j],
+                    'condition': condition,
+                    'rule_depreciation_score': float(rule_scores[j]),
+                    'depreciated_value': depreciation_service.calculate(condition, prices[i]),
+                    'price_min': estimate['min'],
+                    'price_avg': estimate['avg'],
+                    'price_max': estimate['max'],
+                })
+            valued += len(ok)
+            out.flush()
+
+            if (index + 1) % report_every == 0 or index + 1 == len(batches):
+                elapsed = time.perf_counter() - start_time
+                print(f"{valued + failed}/{len(df)} images, {failed} failed, "
+                      f"{(valued + failed) / elapsed:.1f} images/sec", flush=True)
+
+    elapsed = time.perf_counter() - start_time
+    return {
+        'valued': valued,
+        'failed': failed,
+        'skipped': len(done),
+        'images_per_second': (valued + failed) / elapsed if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Value an intake of garment photos offline.")
+    parser.add_argument('csv', help="CSV with an image_name column (e.g. csv/dataset.csv)")
+    parser.add_argument('image_dir')
+    parser.add_argument('--out', default='valuations.csv')
+    parser.add_argument('--wear-model', default=os.path.join(MODELS_DIR, "wear_tear_model.h5"))
+    parser.add_argument('--depreciation-model', default=os.path.join(MODELS_DIR, "depreciation_model.h5"))
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=None, help="Decode processes (default: CPU count)")
+    parser.add_argument('--preprocess', choices=['exact', 'fast'], default=os.getenv("PREPROCESS_MODE", "exact").lower())
+    parser.add_argument('--limit', type=int, default=None, help="Value at most this many new images")
+    args = parser.parse_args()
+
+    wear_model = load_scoring_model(args.wear_model)
+    depreciation_model = load_scoring_model(args.depreciation_model)
+    result = valuate(args.csv, args.image_dir, args.out, wear_model, depreciation_model,
+                     batch_size=args.batch_size, workers=args.workers, mode=args.preprocess, limit=args.limit)
+    print(f"{result['valued']} valued, {result['failed']} failed, {result['skipped']} already done, "
+          f"{result['images_per_second']:.1f} images/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Gunicorn settings, picked up automatically by `gunicorn app:app`.
+
+Points prometheus_client at a directory shared by all workers so /metrics
+reports the whole pool rather than whichever worker served the scrape.
+This has to happen before the workers import prometheus_client.
+
+Each worker also gets its share of the CPU budget (see backend/cpu_budget.py)
+right after fork, before it imports the app and loads TensorFlow.
+"""
+import glob
+import os
+import tempfile
+
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "garmentz-metrics"))
+
+
+def on_starting(server):
+    # Samples left by a previous run would otherwise be added to this one
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(path, exist_ok=True)
+    for name in glob.glob(os.path.join(path, "*.db")):
+        os.remove(name)
+
+
+def pre_fork(server, worker):
+    # Runs in the master: give the new worker the lowest slot no live worker
+    # holds, so a replacement takes over the cores of the worker it replaces
+    taken = {getattr(w, 'cpu_slot', None) for w in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    from backend.cpu_budget import apply_worker_budget
+    plan = apply_worker_budget(server.num_workers, worker.cpu_slot)
+    server.log.info("Worker %s: slot %s, %s threads, CPUs %s", worker.pid, worker.cpu_slot,
+                    plan['threads'], plan['cpus'])
+
+
+def child_exit(server, worker):
+    from backend.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
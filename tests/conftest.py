@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def client(tmp_path_factory):
+    """
+    Flask test client. app.py writes its runtime files (models/, uploads/,
+    the notification queue) under the working directory, so import it from
+    a scratch one. No models are configured, so the scoring fallbacks apply.
+    """
+    workdir = tmp_path_factory.mktemp('app')
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import app
+    finally:
+        os.chdir(previous)
+    return app.app.test_client()
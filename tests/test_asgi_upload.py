@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('starlette')
+pytest.importorskip('multipart')
+
+
+@pytest.fixture(scope='module')
+def asgi(client):
+    import asgi
+    return asgi
+
+
+def post(asgi, headers, chunks, method='POST', path='/upload-image'):
+    """
+    Drive asgi.app with a raw request (POST /upload-image by default) and
+    return (status, body). Chunks are delivered one receive() at a time, as
+    a chunked upload would be.
+    """
+    messages = [{'type': 'http.request', 'body': c, 'more_body': i < len(chunks) - 1}
+                for i, c in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'server': ('test', 80), 'client': ('test', 1234),
+        'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+    }
+    asyncio.run(asgi.app(scope, receive, send))
+    start = next(m for m in sent if m['type'] == 'http.response.start')
+    body = b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+    return start['status'], json.loads(body)
+
+
+MULTIPART = 'multipart/form-data; boundary=XYZ'
+
+
+def part(payload):
+    return (b'--XYZ\r\nContent-Disposition: form-data; name="image"; filename="a.jpg"\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + payload + b'\r\n--XYZ--\r\n')
+
+
+def test_malformed_content_length_is_rejected(asgi):
+    status, body = post(asgi, {'content-type': MULTIPART, 'content-length': 'abc'}, [part(b'x')])
+    assert status == 400
+    assert body['error'] == 'Invalid Content-Length'
+
+
+def test_declared_oversize_is_rejected(asgi):
+    limit = asgi.flask_app.app.config['MAX_CONTENT_LENGTH']
+    status, _ = post(asgi, {'content-type': MULTIPART, 'content-length': str(limit + 1)}, [b''])
+    assert status == 413
+
+
+def test_chunked_oversize_is_rejected_while_streaming(asgi):
+    limit = asgi.flask_app.app.config['MAX_CONTENT_LENGTH']
+    body = part(b'\0' * limit)
+    chunks = [body[i:i + (1 << 20)] for i in range(0, len(body), 1 << 20)]
+    status, response = post(asgi, {'content-type': MULTIPART, 'transfer-encoding': 'chunked'}, chunks)
+    assert status == 413
+    assert response['error'] == 'Upload too large'
+
+
+def test_missing_image_within_limit(asgi):
+    payload = b'--XYZ\r\nContent-Disposition: form-data; name="other"\r\n\r\nv\r\n--XYZ--\r\n'
+    status, body = post(asgi, {'content-type': MULTIPART, 'content-length': str(len(payload))}, [payload])
+    assert status == 400
+    assert body['error'] == 'No image provided'
+
+
+def test_other_routes_are_served_by_flask(asgi):
+    status, body = post(asgi, {}, [b''], method='GET', path='/health')
+    assert status == 200
+    assert body['status'] == 'ok'
@@ -0,0 +1,28 @@
+from backend import cpu_budget
+
+
+def test_worker_threads_follows_the_exported_budget(monkeypatch):
+    monkeypatch.delenv('TF_NUM_INTRAOP_THREADS', raising=False)
+    monkeypatch.setenv('TFLITE_NUM_THREADS', '3')
+    assert cpu_budget.worker_threads() == 3
+    monkeypatch.delenv('TFLITE_NUM_THREADS')
+    monkeypatch.setenv('TF_NUM_INTRAOP_THREADS', '2')
+    assert cpu_budget.worker_threads() == 2
+
+
+def test_worker_threads_without_a_budget_uses_usable_cores(monkeypatch):
+    for name in ('TFLITE_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS'):
+        monkeypatch.delenv(name, raising=False)
+    assert cpu_budget.worker_threads() == len(cpu_budget.available_cpus())
+
+
+def test_apply_worker_budget_sizes_worker_pools(monkeypatch):
+    # setenv first so teardown removes what apply_worker_budget exports
+    for name in cpu_budget.THREAD_VARIABLES + ('TF_NUM_INTEROP_THREADS',):
+        monkeypatch.setenv(name, '')
+        monkeypatch.delenv(name)
+    monkeypatch.setattr(cpu_budget, 'available_cpus', lambda: list(range(8)))
+    monkeypatch.setenv('CPU_BUDGET', '8')
+    plan = cpu_budget.apply_worker_budget(4, 1)
+    assert plan['threads'] == 2
+    assert cpu_budget.worker_threads() == 2
@@ -0,0 +1,58 @@
+import math
+
+import pytest
+
+from backend.depreciation_scoring import calculate_depreciation, depreciation_scores
+
+ITEMS = [
+    {'brand': 'gucci', 'fabric': 'wool', 'age_years': 2, 'wear_level_score': 0.1},
+    {'brand': 'zara', 'fabric': 'cotton', 'age_years': 5, 'wear_level_score': 0.4},
+]
+
+
+def test_batch_matches_single_item_scores(client):
+    resp = client.post('/depreciation/batch', json={'items': ITEMS})
+    assert resp.status_code == 200
+    assert resp.get_json()['depreciation_scores'] == [calculate_depreciation(**item) for item in ITEMS]
+
+
+@pytest.mark.parametrize('bad', [None, 'NaN', float('nan'), float('inf'), 'abc'])
+def test_batch_rejects_non_finite_wear(client, bad):
+    items = ITEMS + [dict(ITEMS[0], wear_level_score=bad)]
+    resp = client.post('/depreciation/batch', json={'items': items})
+    assert resp.status_code == 400
+    assert 'item 2' in resp.get_json()['detail']
+    assert 'wear_level_score' in resp.get_json()['detail']
+
+
+def test_columns_reject_missing_age(client):
+    columns = {
+        'brand': ['gucci', 'zara'], 'fabric': ['wool', 'cotton'],
+        'age_years': [1, None], 'wear_level_score': [0.1, 0.2],
+    }
+    resp = client.post('/depreciation/batch', json=columns)
+    assert resp.status_code == 400
+    assert 'item 1: age_years' in resp.get_json()['detail']
+
+
+def test_single_item_rejects_nan(client):
+    resp = client.post('/depreciation', json=dict(ITEMS[0], wear_level_score='nan'))
+    assert resp.status_code == 400
+
+
+def test_scores_never_nan():
+    with pytest.raises(ValueError):
+        depreciation_scores(['lv'], ['wool'], [1], [math.nan])
+
+
+@pytest.mark.parametrize('bad', [None, 3, ['gucci']])
+def test_batch_rejects_non_string_brand(client, bad):
+    items = ITEMS + [dict(ITEMS[1], brand=bad)]
+    resp = client.post('/depreciation/batch', json={'items': items})
+    assert resp.status_code == 400
+    assert 'item 2: brand must be a string' in resp.get_json()['detail']
+
+
+def test_single_item_rejects_missing_fabric(client):
+    resp = client.post('/depreciation', json=dict(ITEMS[0], fabric=None))
+    assert resp.status_code == 400
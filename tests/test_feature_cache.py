@@ -0,0 +1,21 @@
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from backend import feature_cache  # noqa: E402
+
+
+def test_cache_key_changes_with_weights_size_and_preprocessing(tmp_path, monkeypatch):
+    weights = tmp_path / 'weights.h5'
+    weights.write_bytes(b'first')
+    key = feature_cache.cache_key(str(weights), (224, 224))
+    assert key == feature_cache.cache_key(str(weights), (224, 224))
+    assert key != feature_cache.cache_key(None, (224, 224))
+    assert key != feature_cache.cache_key(str(weights), (160, 160))
+
+    weights.write_bytes(b'retrained')
+    assert key != feature_cache.cache_key(str(weights), (224, 224))
+
+    retrained = feature_cache.cache_key(str(weights), (224, 224))
+    monkeypatch.setattr(feature_cache, 'PREPROCESS_VERSION', feature_cache.PREPROCESS_VERSION + 1)
+    assert retrained != feature_cache.cache_key(str(weights), (224, 224))
@@ -0,0 +1,59 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.http_client import HttpClient
+from backend.upload_jobs import UploadJobs
+
+
+@pytest.fixture
+def unavailable():
+    """
+    A local server answering every request with 503. Yields (url, calls).
+    """
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self):
+            calls.append(self.command)
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        do_GET = do_PUT = do_POST = _reply
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/blob", calls
+    server.shutdown()
+
+
+def test_put_is_retried_once_per_attempt_and_post_is_not(unavailable):
+    url, calls = unavailable
+    client = HttpClient(retries=3, backoff_factor=0)
+    assert client.put(url, data=b'x').status_code == 503
+    assert calls.count('PUT') == 4
+    assert client.request('POST', url, data=b'x').status_code == 503
+    assert calls.count('POST') == 1
+
+
+def test_upload_job_does_not_add_retries_on_top_of_the_client(unavailable, tmp_path):
+    url, calls = unavailable
+    client = HttpClient(retries=3, backoff_factor=0)
+
+    def upload(data, blob_name):
+        return url if client.put(url, data=data).status_code == 201 else None
+
+    jobs = UploadJobs(upload, str(tmp_path))
+    job_id = jobs.submit(b'x', 'blob')
+    deadline = time.time() + 10
+    while jobs.status(job_id)['status'] == 'pending' and time.time() < deadline:
+        time.sleep(0.01)
+    assert jobs.status(job_id)['status'] == 'failed'
+    assert calls.count('PUT') == 4
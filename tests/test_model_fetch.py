@@ -0,0 +1,26 @@
+import hashlib
+import os
+
+from backend import model_fetch
+from backend.model_fetch import fetch_models
+
+
+def test_checksum_mismatch_with_failed_download_leaves_no_model(tmp_path, monkeypatch):
+    models_dir = str(tmp_path)
+    path = os.path.join(models_dir, "wear_tear_model.h5")
+    with open(path, "wb") as f:
+        f.write(b"tampered")
+    manifest = {"wear_tear_model.h5": hashlib.sha256(b"genuine").hexdigest()}
+
+    def unreachable(url, **kwargs):
+        raise ConnectionError("download failed")
+    monkeypatch.setattr(model_fetch.http_client, "get", unreachable)
+
+    errors = fetch_models({"wear_tear_model.h5": "https://models.example/wear_tear_model.h5"}, models_dir,
+                          manifest=manifest)
+
+    assert "wear_tear_model.h5" in errors
+    # The bad file must not be left where the app would load it
+    assert not os.path.exists(path)
+    with open(f"{path}.quarantined", "rb") as f:
+        assert f.read() == b"tampered"
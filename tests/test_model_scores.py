@@ -0,0 +1,16 @@
+import numpy as np
+
+from backend.model_scores import predict_scores
+
+
+class Fixed:
+    def __init__(self, output):
+        self.output = np.asarray(output)
+
+    def predict(self, batch, verbose=0):
+        return self.output
+
+
+def test_scores_are_clamped_and_rounded():
+    assert predict_scores(Fixed([[-0.2, 9], [0.12345, 9], [1.7, 9]]), None) == [0, 0.123, 1]
+    assert predict_scores(Fixed([0.4567]), None) == [0.457]
@@ -0,0 +1,50 @@
+import json
+import os
+import time
+
+from backend.notification_queue import NotificationQueue
+
+
+def body(nid):
+    return json.dumps({'metadata': {'topic': 'T'}, 'notification': {'notificationId': nid}}).encode()
+
+
+def failing(events):
+    raise RuntimeError('handler down')
+
+
+def make_queue(tmp_path, handler, **kwargs):
+    queue = NotificationQueue(str(tmp_path / 'q.db'), handler, **kwargs)
+    queue._thread_pid = os.getpid()  # no background consumer
+    return queue
+
+
+def test_failed_batch_is_not_reclaimed_until_its_backoff_passes(tmp_path):
+    queue = make_queue(tmp_path, failing, retry_backoff=0.2, max_attempts=5)
+    queue.enqueue(body('a'))
+    assert queue.process_batch() == 1
+    assert queue.process_batch() == 0
+    assert queue.stats()['pending'] == 1
+    time.sleep(0.25)
+    assert queue.process_batch() == 1
+    # Second failure waits twice as long
+    time.sleep(0.25)
+    assert queue.process_batch() == 0
+
+
+def test_expired_lease_on_last_attempt_is_marked_failed(tmp_path):
+    queue = make_queue(tmp_path, lambda events: None, lease=-1, max_attempts=2)
+    queue.enqueue(body('a'))
+    # Claimed twice by consumers that died before finishing
+    assert len(queue._claim()) == 1
+    assert len(queue._claim()) == 1
+    assert queue._claim() == []
+    stats = queue.stats()
+    assert stats['failed'] == 1 and stats['processing'] == 0
+
+
+def test_queue_depth_is_on_metrics_not_health(client):
+    health = client.get('/health').get_json()
+    assert 'ebay_notifications' not in health
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'garmentz_notifications{status="pending"}' in text
@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+
+from backend import phash_index
+from backend.phash_index import NearDuplicateIndex, hamming
+
+
+def random_codes(rng, n):
+    return rng.integers(0, 1 << 63, size=n, dtype=np.int64).view(np.uint64)
+
+
+def flip(code, bits):
+    for bit in bits:
+        code ^= 1 << bit
+    return code
+
+
+def brute_force(index, code):
+    distances = hamming(index._codes[:index._size], code)
+    best = int(np.argmin(distances))
+    return int(distances[best]) if distances[best] <= index.max_distance else None
+
+
+def wait_for_rebuild(index, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while index.stats()['rebuilding'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_recent_entries_are_found_before_and_after_rebuild(tmp_path, monkeypatch):
+    monkeypatch.setattr(phash_index, 'TAIL_REBUILD', 50)
+    rng = np.random.default_rng(0)
+    index = NearDuplicateIndex(str(tmp_path / 'phash.db'), 'v1')
+    index.add_many([(int(c), f'base{i}', {'i': i}) for i, c in enumerate(random_codes(rng, 200))])
+    wait_for_rebuild(index)
+    assert index.stats()['unindexed'] == 0
+
+    recent = [int(c) for c in random_codes(rng, 40)]
+    index.add_many([(c, f'recent{i}', {'i': i}) for i, c in enumerate(recent)])
+    assert index.stats()['unindexed'] == 40
+    for i, code in enumerate(recent):
+        match = index.find(flip(code, [3, 17, 40, 61]))
+        assert match['digest'] == f'recent{i}' and match['distance'] == 4
+
+    more = [int(c) for c in random_codes(rng, 40)]
+    index.add_many([(c, f'more{i}', {'i': i}) for i, c in enumerate(more)])
+    wait_for_rebuild(index)
+    assert index.stats()['unindexed'] == 0
+    for i, code in enumerate(recent + more):
+        assert index.find(flip(code, [0, 63]))['distance'] == 2
+
+
+def test_lookups_match_brute_force(tmp_path, monkeypatch):
+    monkeypatch.setattr(phash_index, 'TAIL_REBUILD', 1000)
+    rng = np.random.default_rng(1)
+    index = NearDuplicateIndex(str(tmp_path / 'phash.db'), 'v1')
+    codes = [int(c) for c in random_codes(rng, 600)]
+    index.add_many([(c, f'a{i}', {}) for i, c in enumerate(codes[:300])])
+    # Reopening builds the tables over the first 300; the rest go to the dicts
+    index = NearDuplicateIndex(index.db_path, 'v1')
+    index.add_many([(c, f'b{i}', {}) for i, c in enumerate(codes[300:])])
+    assert index.stats()['unindexed'] == 300
+    for code in codes[::10]:
+        for bits in ([5], [1, 20, 33, 50, 62], [2, 9, 18, 27, 36, 45]):
+            query = flip(code, bits)
+            match = index.nearest(query)
+            assert (match and match[1]) == brute_force(index, query)
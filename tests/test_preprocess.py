@@ -0,0 +1,25 @@
+import numpy as np
+from PIL import Image
+
+from backend.preprocess import load_exact, load_fast, normalize
+from backend.valuate_inventory import _decode_batch
+
+
+def write_image(path, seed):
+    pixels = np.random.default_rng(seed).integers(0, 256, (300, 400, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(path, quality=90)
+    return str(path)
+
+
+def test_decode_batch_returns_uint8_that_normalizes_like_load(tmp_path):
+    paths = [write_image(tmp_path / f"{i}.jpg", i) for i in range(3)]
+    paths.insert(1, str(tmp_path / 'missing.jpg'))
+    for mode, load in (('exact', load_exact), ('fast', load_fast)):
+        images, errors = _decode_batch(paths, mode)
+        assert images.dtype == np.uint8
+        assert images.shape == (3, 224, 224, 3)
+        assert [e is None for e in errors] == [True, False, True, True]
+        batch = normalize(images, mode)
+        expected = np.stack([load(p) for p in paths if 'missing' not in p])
+        assert batch.dtype == expected.dtype
+        assert np.array_equal(batch, expected)
@@ -0,0 +1,23 @@
+from backend.price_index import PriceIndex
+
+
+def test_import_skips_non_finite_prices(tmp_path):
+    csv_path = tmp_path / "sales.csv"
+    rows = ["clothing_type,fabric_type,condition,price"]
+    rows += ["coat,wool,good,40"] * 5
+    rows += ["coat,wool,good,inf", "coat,wool,good,1e400", "coat,wool,good,nan", "coat,wool,good,-3"]
+    csv_path.write_text("\n".join(rows) + "\n")
+    db_path = str(tmp_path / "prices.db")
+
+    assert PriceIndex(db_path).import_csv(str(csv_path)) == 5
+
+    # A fresh instance rebuilds from the sales log and must still open
+    estimate = PriceIndex(db_path).estimate('coat', 'wool', 'good')
+    assert estimate['count'] == 5
+    assert 39 < estimate['avg'] < 41
+
+
+def test_add_sales_rejects_infinite_price(tmp_path):
+    index = PriceIndex(str(tmp_path / "prices.db"))
+    assert index.add_sales([('coat', 'wool', 'good', float('inf'), None)]) == 0
+    assert index.add_sale('coat', 'wool', 'good', '1e400') == 0
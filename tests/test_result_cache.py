@@ -0,0 +1,81 @@
+import sqlite3
+import threading
+import time
+
+from backend.result_cache import ResultCache
+
+
+def run_together(*calls):
+    results = [None] * len(calls)
+
+    def run(i, call):
+        results[i] = call()
+
+    threads = [threading.Thread(target=run, args=(i, call)) for i, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)  # the first call claims the digest
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def slow_compute(calls, result, delay=0.3):
+    def compute():
+        calls.append(1)
+        time.sleep(delay)
+        return result
+    return compute
+
+
+def test_identical_uploads_in_two_workers_are_computed_once(tmp_path):
+    db = str(tmp_path / 'cache.db')
+    # Two caches on one file stand in for two gunicorn worker processes
+    first, second = ResultCache('v1', db_path=db), ResultCache('v1', db_path=db)
+    calls = []
+    compute = slow_compute(calls, {'score': 1})
+    (r1, hit1), (r2, hit2) = run_together(
+        lambda: first.get_or_compute('abc', compute),
+        lambda: second.get_or_compute('abc', compute),
+    )
+    assert len(calls) == 1
+    assert r1 == r2 == {'score': 1}
+    assert (hit1, hit2) == (False, True)
+
+
+def test_uncacheable_result_is_not_reported_as_cached(tmp_path):
+    cache = ResultCache('v1')
+    calls = []
+    compute = slow_compute(calls, {'url': None})
+    results = run_together(
+        lambda: cache.get_or_compute('abc', compute, cacheable=lambda r: r['url'] is not None),
+        lambda: cache.get_or_compute('abc', compute, cacheable=lambda r: r['url'] is not None),
+    )
+    assert len(calls) == 1
+    assert [hit for _, hit in results] == [False, False]
+
+
+def test_other_worker_computes_when_the_claim_is_released_without_a_result(tmp_path):
+    db = str(tmp_path / 'cache.db')
+    first, second = ResultCache('v1', db_path=db), ResultCache('v1', db_path=db)
+    calls = []
+    compute = slow_compute(calls, {'url': None})
+    results = run_together(
+        lambda: first.get_or_compute('abc', compute, cacheable=lambda r: r['url'] is not None),
+        lambda: second.get_or_compute('abc', compute, cacheable=lambda r: r['url'] is not None),
+    )
+    assert len(calls) == 2
+    assert [hit for _, hit in results] == [False, False]
+
+
+def test_disk_tier_is_trimmed_periodically(tmp_path):
+    db = str(tmp_path / 'cache.db')
+    cache = ResultCache('v1', max_entries=0, db_path=db, disk_max_entries=2, trim_interval=3600)
+    for i in range(5):
+        cache.put(f"d{i}", {'i': i})
+    count = sqlite3.connect(db).execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    assert count == 5  # only the first put trimmed, when there was one row
+    cache._last_trim = 0.0
+    cache.put('d5', {'i': 5})
+    count = sqlite3.connect(db).execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    assert count == 2
@@ -0,0 +1,21 @@
+import csv
+
+import pytest
+
+pytest.importorskip('tensorflow')
+pytest.importorskip('sklearn')
+
+from backend.train_depreciation_model import LABELS_CSV, WEAR_SIGNS_MAPPING, check_labels, wear_label  # noqa: E402
+
+
+def test_every_dataset_wear_sign_is_mapped():
+    with open(LABELS_CSV, newline='') as f:
+        signs = {row['wear_signs'].strip().lower() for row in csv.DictReader(f)}
+    assert signs <= set(WEAR_SIGNS_MAPPING)
+    assert sorted({wear_label(s) for s in signs}) == [0.0, 0.5, 1.0]
+
+
+def test_constant_labels_are_rejected():
+    with pytest.raises(ValueError, match='All 3 depreciation labels'):
+        check_labels([0.0, 0.0, 0.0])
+    assert list(check_labels([0.0, 0.5])) == [0.0, 0.5]